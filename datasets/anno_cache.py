@@ -0,0 +1,88 @@
+""" Content-keyed, columnar annotation caches for preload_anno().
+
+A cache is a directory named by a hash of
+    - the index list actually loaded (after split / mini / filtering),
+    - the cfg.DB fields the annotation depends on,
+    - mtimes of the source files: the index file (csv / split list), and every
+      meta file if cfg.DB.CACHE_CHECK_META, which costs a stat per item on each load,
+so any change of these builds a new cache instead of silently reusing a stale one.
+
+Inside, array-like fields (hA, hTo, cTh, ...) are stacked into float32 .npy
+and memory-mapped on load; other fields (index, cad_index) are pickled.
+"""
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import os.path as osp
+import pickle
+import shutil
+import numpy as np
+import torch
+import tqdm
+
+
+META_FILE = 'meta.pkl'
+
+
+def cache_key(index_list, fields: dict, files=()) -> str:
+    """
+    Args:
+        index_list: list of str / tuple, the annotations to load
+        fields: dict of cfg values the annotation depends on
+        files: source files, their mtimes are part of the key
+
+    Returns:
+        str, 16 hex chars
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps([list(v) if isinstance(v, tuple) else v for v in index_list]).encode())
+    h.update(json.dumps(fields, sort_keys=True, default=str).encode())
+    for f in files:
+        mtime = os.stat(f).st_mtime_ns if osp.exists(f) else -1
+        h.update(('%s:%d;' % (f, mtime)).encode())
+    return h.hexdigest()[:16]
+
+
+def exists(cache_dir) -> bool:
+    return osp.exists(osp.join(cache_dir, META_FILE))
+
+
+def save_anno(anno: dict, cache_dir):
+    """ Write anno as columns, atomically. """
+    tmp_dir = cache_dir + '.tmp%d' % os.getpid()
+    os.makedirs(tmp_dir, exist_ok=True)
+    meta = {'arrays': [], 'objects': {}}
+    for key, values in anno.items():
+        if len(values) > 0 and isinstance(values[0], (torch.Tensor, np.ndarray)):
+            arr = np.stack([np.asarray(v, dtype=np.float32) for v in values])
+            np.save(osp.join(tmp_dir, key + '.npy'), arr)
+            meta['arrays'].append(key)
+        else:
+            meta['objects'][key] = list(values)
+    with open(osp.join(tmp_dir, META_FILE), 'wb') as fp:
+        pickle.dump(meta, fp)
+    if osp.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.replace(tmp_dir, cache_dir)
+
+
+def load_anno(cache_dir) -> dict:
+    """ Array fields come back as torch.Tensor (N, ...) backed by a copy-on-write memory map. """
+    with open(osp.join(cache_dir, META_FILE), 'rb') as fp:
+        meta = pickle.load(fp)
+    anno = dict(meta['objects'])
+    for key in meta['arrays']:
+        arr = np.load(osp.join(cache_dir, key + '.npy'), mmap_mode='c')
+        anno[key] = torch.from_numpy(arr)
+    return anno
+
+
+def parallel_map(func, items, num_workers=None, chunksize=64) -> list:
+    """ Ordered map over a process pool, func must be picklable (module level). """
+    if num_workers == 0:
+        return [func(v) for v in tqdm.tqdm(items)]
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return list(tqdm.tqdm(
+            pool.map(func, items, chunksize=chunksize), total=len(items)))
@@ -2,12 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from copy import deepcopy
 from pathlib import Path
 import pandas as pd
 from functools import lru_cache
 
-from . import hoaio
+from . import hoa_cache
 
 
 def framedet2dicts(det,
@@ -18,7 +17,7 @@ def framedet2dicts(det,
     res_dict = {"video_id": det.video_id, "frame": det.frame_number}
     dicts = []
     for obj_det in det.objects:
-        det_dict = deepcopy(res_dict)
+        det_dict = dict(res_dict)
         score = obj_det.score
         if score > obj_thresh:
             det_dict["score"] = score
@@ -29,7 +28,7 @@ def framedet2dicts(det,
             det_dict["det_type"] = "object"
             dicts.append(det_dict)
     for hand_det in det.hands:
-        det_dict = deepcopy(res_dict)
+        det_dict = dict(res_dict)
         score = hand_det.score
         if score > hand_thresh:
             det_dict["score"] = score
@@ -48,7 +47,7 @@ def framedet2dicts(det,
 
 
 @lru_cache(maxsize=128)
-def load_video_hoa(video_id, hoa_root):
+def load_video_hoa(video_id, hoa_root, cache_root=None):
     """
     Args:
         video_id (str): PXX_XX video id
@@ -57,7 +56,12 @@ def load_video_hoa(video_id, hoa_root):
                 \\ P01
                    \\ P01_01.pkl
                 \\ ...
+        cache_root (str): if the video is in this hoa_cache, read it
+            from there instead of parsing the protobuf
     """
+    if cache_root is not None and hoa_cache.has_cache(video_id, cache_root):
+        return hoa_cache.load_video_hoa_cache(video_id, cache_root).to_dataframe()
+    from . import hoaio  # needs protobuf
     hoa_root = Path(hoa_root)
     hoa_list = hoaio.load_detections(hoa_root / video_id[:3] /
                                      f"{video_id}.pkl")
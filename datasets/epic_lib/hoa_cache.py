@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Columnar cache of the EPIC hand-object detections, read without protobuf.
+
+convert_video() parses the protobuf pickle of a video once and writes,
+under `cache_root/PXX/`:
+    PXX_YY.det.npy: one DET_DTYPE row per detection, sorted by frame,
+        objects then hands within a frame as in the protobuf
+    PXX_YY.idx.npy: (max_frame + 2,) int64, rows of frame f are idx[f]:idx[f+1]
+VideoHOA memory-maps both, so looking up a frame only reads its rows.
+
+    python -m datasets.epic_lib.hoa_cache <hoa_root> <cache_root>
+"""
+
+import os
+from argparse import ArgumentParser
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+OBJECT, HAND = 0, 1
+SIDES = ('left', 'right')  # HandSide values
+STATES = ('no_contact', 'self_contact', 'another_person',
+          'portable_object', 'stationary_object')  # HandState values
+
+DET_DTYPE = np.dtype([
+    ('frame', '<i4'),
+    ('det_type', 'u1'),  # OBJECT or HAND
+    ('side', 'i1'),  # index into SIDES, -1 for objects
+    ('state', 'i1'),  # index into STATES, -1 for objects
+    ('score', '<f4'),
+    ('bbox', '<f4', (4,)),  # left, top, right, bottom, normalized
+    ('offset', '<f4', (2,)),  # hand to object offset, normalized
+])
+
+
+def cache_paths(video_id: str, cache_root: Union[str, Path]) -> Tuple[Path, Path]:
+    folder = Path(cache_root) / video_id[:3]
+    return folder / f"{video_id}.det.npy", folder / f"{video_id}.idx.npy"
+
+
+def detections_to_arrays(detections) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Args:
+        detections: list of types.FrameDetections
+
+    Returns:
+        dets: (N,) DET_DTYPE
+        idx: (max_frame + 2,) int64
+    """
+    rows = []
+    for det in sorted(detections, key=lambda d: d.frame_number):
+        for obj in det.objects:
+            b = obj.bbox
+            rows.append((det.frame_number, OBJECT, -1, -1, obj.score,
+                         (b.left, b.top, b.right, b.bottom), (0, 0)))
+        for hand in det.hands:
+            b = hand.bbox
+            rows.append((det.frame_number, HAND, hand.side.value, hand.state.value,
+                         hand.score, (b.left, b.top, b.right, b.bottom),
+                         (hand.object_offset.x, hand.object_offset.y)))
+    dets = np.array(rows, dtype=DET_DTYPE)
+    max_frame = int(dets['frame'].max()) if len(dets) else -1
+    idx = np.searchsorted(dets['frame'], np.arange(max_frame + 2)).astype(np.int64)
+    return dets, idx
+
+
+def _save_npy(path: Path, arr: np.ndarray):
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as fp:
+        np.save(fp, arr)
+    os.replace(tmp_path, path)
+
+
+def convert_video(video_id: str,
+                  hoa_root: Union[str, Path],
+                  cache_root: Union[str, Path],
+                  overwrite=False) -> bool:
+    """ Convert hoa_root/PXX/PXX_YY.pkl into the cache.
+
+    Returns:
+        True if converted, False if already cached
+    """
+    from . import hoaio  # needs protobuf
+
+    det_path, idx_path = cache_paths(video_id, cache_root)
+    if not overwrite and det_path.exists() and idx_path.exists():
+        return False
+    detections = hoaio.load_detections(
+        Path(hoa_root) / video_id[:3] / f"{video_id}.pkl")
+    dets, idx = detections_to_arrays(detections)
+    det_path.parent.mkdir(parents=True, exist_ok=True)
+    _save_npy(det_path, dets)
+    _save_npy(idx_path, idx)  # written last, marks the video as cached
+    return True
+
+
+def has_cache(video_id: str, cache_root: Union[str, Path]) -> bool:
+    return all(p.exists() for p in cache_paths(video_id, cache_root))
+
+
+class VideoHOA:
+    """ Memory-mapped detections of one video, see the module doc. """
+
+    def __init__(self, video_id: str, cache_root: Union[str, Path]):
+        det_path, idx_path = cache_paths(video_id, cache_root)
+        self.video_id = video_id
+        self.dets = np.load(det_path, mmap_mode='r')
+        self.idx = np.load(idx_path)
+
+    def __len__(self):
+        return len(self.dets)
+
+    def frame(self, frame: int) -> np.ndarray:
+        """ DET_DTYPE rows of `frame`, empty if it has no detections """
+        if frame < 0 or frame + 1 >= len(self.idx):
+            return self.dets[:0]
+        return self.dets[self.idx[frame]:self.idx[frame+1]]
+
+    def hand_box(self, frame: int, side: str, width=1920, height=1080) -> np.ndarray:
+        """ First hand detection of `side` ('left'/'right') in frame.
+
+        Returns:
+            (4,) xywh in pixels, or None
+        """
+        rows = self.frame(frame)
+        match = np.flatnonzero(
+            (rows['det_type'] == HAND) & (rows['side'] == SIDES.index(side)))
+        if len(match) == 0:
+            return None
+        return self._xywh(rows['bbox'][match[:1]], width, height)[0]
+
+    def object_boxes(self, frame: int, obj_thresh=0.5, width=1920, height=1080) -> np.ndarray:
+        """ (M, 4) xywh in pixels of objects scoring above obj_thresh """
+        rows = self.frame(frame)
+        keep = (rows['det_type'] == OBJECT) & (rows['score'] > obj_thresh)
+        return self._xywh(rows['bbox'][keep], width, height)
+
+    @staticmethod
+    def _xywh(bbox: np.ndarray, width, height) -> np.ndarray:
+        bbox = np.asarray(bbox, dtype=np.float64) * (width, height, width, height)
+        bbox[:, 2:] -= bbox[:, :2]
+        return bbox
+
+    def to_dataframe(self, obj_thresh=0.5, height=1080, width=1920) -> pd.DataFrame:
+        """ The DataFrame of epichoa.framedet2dicts() over all frames.
+        As there, hands are kept whatever their score.
+        """
+        dets = self.dets
+        is_hand = dets['det_type'] == HAND
+        dets = dets[is_hand | (dets['score'] > obj_thresh)]
+        if len(dets) == 0:
+            return pd.DataFrame()
+        is_hand = dets['det_type'] == HAND
+        bbox = dets['bbox'].astype(np.float64)
+        data = dict(
+            video_id=self.video_id,
+            frame=dets['frame'].astype(np.int64),
+            score=dets['score'].astype(np.float64),
+            left=bbox[:, 0] * width,
+            right=bbox[:, 2] * width,
+            top=bbox[:, 1] * height,
+            bottom=bbox[:, 3] * height,
+            det_type=np.where(is_hand, 'hand', 'object').astype(object),
+        )
+        if is_hand.any():
+            offset = dets['offset'].astype(np.float64)
+            data.update(
+                hoa_link=np.where(is_hand, np.asarray(STATES, dtype=object)[dets['state']], np.nan),
+                side=np.where(is_hand, np.asarray(SIDES, dtype=object)[dets['side']], np.nan),
+                obj_offx=np.where(is_hand, offset[:, 0], np.nan),
+                obj_offy=np.where(is_hand, offset[:, 1], np.nan),
+            )
+        return pd.DataFrame(data)
+
+
+@lru_cache(maxsize=128)
+def load_video_hoa_cache(video_id: str, cache_root: Union[str, Path]) -> VideoHOA:
+    return VideoHOA(video_id, cache_root)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('hoa_root', type=str, help='hand-objects folder, with PXX/PXX_YY.pkl')
+    parser.add_argument('cache_root', type=str)
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+    import tqdm
+    video_ids = sorted(p.stem for p in Path(args.hoa_root).glob('P*/P*_*.pkl'))
+    for video_id in tqdm.tqdm(video_ids):
+        convert_video(video_id, args.hoa_root, args.cache_root, args.overwrite)
+
+
+if __name__ == '__main__':
+    main()
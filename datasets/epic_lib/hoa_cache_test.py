@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from datasets.epic_lib import epichoa, hoaio
+from datasets.epic_lib.hoa_cache import (
+    VideoHOA, cache_paths, convert_video, has_cache)
+from datasets.epic_lib.types import (
+    BBox, FloatVector, FrameDetections, HandDetection, HandSide, HandState,
+    ObjectDetection)
+
+
+def random_detections(video_id, num_frames, rng):
+    """ 0-2 objects and hands per frame, some frames without detections """
+    def bbox():
+        x, y = rng.uniform(0, 0.8, 2)
+        w, h = rng.uniform(0.02, 0.2, 2)
+        return BBox(left=x, top=y, right=x + w, bottom=y + h)
+
+    detections = []
+    for frame in range(1, num_frames + 1):
+        if rng.random() < 0.1:
+            continue
+        objects = [ObjectDetection(bbox=bbox(), score=rng.uniform())
+                   for _ in range(rng.integers(0, 3))]
+        hands = [HandDetection(bbox=bbox(), score=rng.uniform(),
+                               state=HandState(int(rng.integers(0, 5))),
+                               side=HandSide(int(rng.integers(0, 2))),
+                               object_offset=FloatVector(*rng.uniform(-0.1, 0.1, 2)))
+                 for _ in range(rng.integers(0, 3))]
+        detections.append(FrameDetections(
+            video_id=video_id, frame_number=frame, objects=objects, hands=hands))
+    return detections
+
+
+class HOACacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.hoa_root, self.cache_root = root / 'hoa', root / 'hoa_cache'
+        self.vid = 'P01_01'
+        hoaio.save_detections(
+            random_detections(self.vid, 200, np.random.default_rng(0)),
+            self.hoa_root / 'P01' / f'{self.vid}.pkl')
+        self.assertTrue(convert_video(self.vid, self.hoa_root, self.cache_root))
+        self.df = epichoa.load_video_hoa.__wrapped__(self.vid, self.hoa_root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_convert_once(self):
+        self.assertTrue(has_cache(self.vid, self.cache_root))
+        self.assertFalse(convert_video(self.vid, self.hoa_root, self.cache_root))
+        self.assertEqual(cache_paths(self.vid, self.cache_root)[0].parent.name, 'P01')
+
+    def test_dataframe_matches_protobuf(self):
+        df = VideoHOA(self.vid, self.cache_root).to_dataframe()
+        pd.testing.assert_frame_equal(df, self.df)
+        cached = epichoa.load_video_hoa.__wrapped__(
+            self.vid, self.hoa_root, cache_root=self.cache_root)
+        pd.testing.assert_frame_equal(cached, self.df)
+
+    def test_frame_lookups(self):
+        hoa = VideoHOA(self.vid, self.cache_root)
+        df = self.df
+        for frame in range(-1, 205):
+            rows = df[df.frame == frame]
+            self.assertEqual((hoa.frame(frame)['det_type'] == 1).sum(),
+                             (rows.det_type == 'hand').sum())
+            for side in ['left', 'right']:
+                hands = rows[(rows.det_type == 'hand') & (rows.side == side)]
+                box = hoa.hand_box(frame, side)
+                if len(hands) == 0:
+                    self.assertIsNone(box)
+                    continue
+                row = hands.iloc[0]
+                np.testing.assert_allclose(
+                    box, [row.left, row.top, row.right - row.left, row.bottom - row.top])
+            objects = rows[rows.det_type == 'object']
+            np.testing.assert_allclose(
+                hoa.object_boxes(frame).reshape(-1, 4),
+                np.stack([objects.left, objects.top,
+                          objects.right - objects.left, objects.bottom - objects.top], 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
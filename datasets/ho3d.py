@@ -14,6 +14,7 @@ from nnutils.hand_utils import cvt_axisang_t_i2o
 from datasets.base_data import BaseData, minmax, proj3d
 
 from nnutils import mesh_utils, geom_utils, image_utils
+from datasets import anno_cache
 
 
 class HO3D(BaseData):
@@ -42,8 +43,10 @@ class HO3D(BaseData):
         else:
             meta_folder = 'meta_%s' % self.use_gt
 
-        self.cache_file = osp.join(self.data_dir, 'Cache', '%s_%s_%s.pkl' % (dataset, self.split, self.use_gt))
-        self.cache_mesh = osp.join(self.data_dir, 'Cache', '%s_%s_mesh.pkl' % (dataset, self.split))
+        # keyed by content in preload_anno(), see datasets/anno_cache.py
+        self.cache_name = dataset
+        self.cache_file = None
+        self.cache_mesh = None
         self.mask_dir = ''
         self.meta_dir = os.path.join(self.data_dir, '{}', '{}', meta_folder, '{}.pkl')
         self.image_dir = osp.join(self.data_dir, '{}', '{}', 'rgb', '{}.jpg')
@@ -51,70 +54,40 @@ class HO3D(BaseData):
         self.shape_dir = os.path.join(self.cfg.DB.DIR, 'ho3dobj/models', '{}', 'textured_simple.obj')
 
     def preload_anno(self, load_keys=[]):
-        if self.cache and osp.exists(self.cache_file):
+        # filter 1e-3
+        csv_file = osp.join(self.data_dir, '%s%s.csv' % (self.split, self.suf))
+        df = pd.read_csv(csv_file)
+        sub_df = df[df['dist'] < 5]
+        sub_df = sub_df[sub_df['vid'] == 'MDF11']
+        # sub_df = sub_df[sub_df['frame'] >= 350]
+        print(len(df), '-->', len(sub_df))
+
+        index_list = [
+            (folder, index.split('/')[0], index.split('/')[1])
+            for index, folder in zip(sub_df['index'], sub_df['split'])]
+        meta_files = [self.meta_dir.format(*index) for index in index_list]
+        # stat-ing every meta file is slow on a warm load, opt in with DB.CACHE_CHECK_META
+        check_meta = getattr(self.cfg.DB, 'CACHE_CHECK_META', False)
+        key = anno_cache.cache_key(
+            index_list, {'split': self.split, 'gt': self.use_gt, 'suf': self.suf},
+            [csv_file] + (meta_files if check_meta else []))
+        self.cache_file = osp.join(self.data_dir, 'Cache', '%s_%s_%s' % (self.cache_name, self.split, key))
+        self.cache_mesh = self.cache_file + '_mesh.pkl'
+
+        if self.cache and anno_cache.exists(self.cache_file):
             print('!! Load from cache !!', self.cache_file)
-            self.anno = pickle.load(open(self.cache_file, 'rb'))
         else:
-            print(self.meta_dir)
             print('creating cahce', self.meta_dir)
-            # filter 1e-3
-            df = pd.read_csv(osp.join(self.data_dir, '%s%s.csv' % (self.split, self.suf)))
-            sub_df = df[df['dist'] < 5]
-            sub_df = sub_df[sub_df['vid'] == 'MDF11']
-            # sub_df = sub_df[sub_df['frame'] >= 350]
-            
-            print(len(df), '-->', len(sub_df))
-            index_list = sub_df['index']
-            folder_list = sub_df['split']
-
-            for i, (index, folder) in enumerate(tqdm.tqdm(zip(index_list, folder_list))):
-                # if (self.split == 'test' or self.split == 'val') and i % 10 != 0:
-                    # continue
-                index = (folder, index.split('/')[0], index.split('/')[1])
-                meta_path = self.meta_dir.format(*index)
-                with open(meta_path, "rb") as meta_f:
-                    anno = pickle.load(meta_f)
-
+            metas = anno_cache.parallel_map(
+                parse_meta, meta_files, getattr(self.cfg.DB, 'CACHE_WORKERS', None))
+            for index, meta in zip(index_list, metas):
                 self.anno['index'].append(index)
-                self.anno['cad_index'].append(anno["objName"])
-                pose = torch.FloatTensor(anno['handPose'])[None]  # handTrans
-                trans = torch.FloatTensor(anno['handTrans'].reshape(3))[None]
-                hA = pose[..., 3:]
-                rot = pose[..., :3]
-                rot, trans = cvt_axisang_t_i2o(rot, trans)
-                wTh = geom_utils.axis_angle_t_to_matrix(rot, trans)
-
-                wTo = geom_utils.axis_angle_t_to_matrix(
-                    torch.FloatTensor([anno['objRot'].reshape(3)]), 
-                    torch.FloatTensor([anno['objTrans'].reshape(3)]))
-                hTo = geom_utils.inverse_rt(mat=wTh, return_mat=True) @ wTo
-
-                rot = torch.FloatTensor([[[1, 0, 0],
-                        [0, -1, 0],
-                        [0, 0, -1]]])
-                cTw = geom_utils.rt_to_homo(rot, )
-                cTh = cTw @ wTh
-
-                cam_intr = torch.FloatTensor(anno['camMat'])
-                joint3d = anno['handJoints3D']
-                if joint3d.ndim == 1:
-                    pad = 0.3
-                    joint3d = joint3d[None]
-                else:
-                    pad = 0.2
-                cPoints = np.concatenate([anno['objCorners3D'], joint3d], 0)
-                cCorner = mesh_utils.apply_transform(torch.FloatTensor([cPoints]), cTw)
-                bbox2d = image_utils.square_bbox(minmax(proj3d(cCorner, cam_intr))[0], pad)
-
-                self.anno['bbox'].append(bbox2d)
-                self.anno['cam'].append(cam_intr)
-                self.anno['cTh'].append(cTh[0])
-                self.anno['hTo'].append(hTo[0])
-                self.anno['hA'].append(hA[0])
-                
-            # os.makedirs(osp.dirname(self.cache_file), exist_ok=True)
-            # print('save cache')
-            # pickle.dump(self.anno, open(self.cache_file, 'wb'))
+                for k, v in meta.items():
+                    self.anno[k].append(v)
+
+            print('save cache')
+            anno_cache.save_anno(self.anno, self.cache_file)
+        self.anno = anno_cache.load_anno(self.cache_file)
 
         self.preload_mesh()
 
@@ -147,3 +120,47 @@ class HO3D(BaseData):
 
     def get_image(self, index):
         return Image.open(self.image_dir.format(*index))        
+
+
+def parse_meta(meta_path) -> dict:
+    """ Returns dict of cad_index, bbox, cam, cTh, hTo, hA """
+    with open(meta_path, "rb") as meta_f:
+        anno = pickle.load(meta_f)
+
+    pose = torch.FloatTensor(anno['handPose'])[None]  # handTrans
+    trans = torch.FloatTensor(anno['handTrans'].reshape(3))[None]
+    hA = pose[..., 3:]
+    rot = pose[..., :3]
+    rot, trans = cvt_axisang_t_i2o(rot, trans)
+    wTh = geom_utils.axis_angle_t_to_matrix(rot, trans)
+
+    wTo = geom_utils.axis_angle_t_to_matrix(
+        torch.FloatTensor([anno['objRot'].reshape(3)]), 
+        torch.FloatTensor([anno['objTrans'].reshape(3)]))
+    hTo = geom_utils.inverse_rt(mat=wTh, return_mat=True) @ wTo
+
+    rot = torch.FloatTensor([[[1, 0, 0],
+            [0, -1, 0],
+            [0, 0, -1]]])
+    cTw = geom_utils.rt_to_homo(rot, )
+    cTh = cTw @ wTh
+
+    cam_intr = torch.FloatTensor(anno['camMat'])
+    joint3d = anno['handJoints3D']
+    if joint3d.ndim == 1:
+        pad = 0.3
+        joint3d = joint3d[None]
+    else:
+        pad = 0.2
+    cPoints = np.concatenate([anno['objCorners3D'], joint3d], 0)
+    cCorner = mesh_utils.apply_transform(torch.FloatTensor([cPoints]), cTw)
+    bbox2d = image_utils.square_bbox(minmax(proj3d(cCorner, cam_intr))[0], pad)
+
+    return {
+        'cad_index': anno["objName"],
+        'bbox': bbox2d,
+        'cam': cam_intr,
+        'cTh': cTh[0],
+        'hTo': hTo[0],
+        'hA': hA[0],
+    }
@@ -3,7 +3,6 @@
 # --------------------------------------------------------
 from __future__ import print_function
 import json
-import os
 import os.path as osp
 import pickle
 import numpy as np
@@ -16,6 +15,7 @@ from nnutils.hand_utils import ManopthWrapper, cvt_axisang_t_i2o
 from datasets.base_data import BaseData, minmax, proj3d
 
 from nnutils import mesh_utils, geom_utils, image_utils
+from datasets import anno_cache
 
 
 def apply_trans(rot, t, s, device='cpu'):
@@ -48,8 +48,10 @@ class MOW(BaseData):
         if split == 'val':
             self.split = 'test'
         self.set_dir = osp.join(self.data_dir, '{}.lst')
-        self.cache_file = osp.join(self.data_dir, 'Cache', '%s_%s.pkl' % (dataset, self.split))
-        self.cache_mesh = osp.join(self.data_dir, 'Cache', '%s_%s_mesh.pkl' % (dataset, self.split))
+        # keyed by content in preload_anno(), see datasets/anno_cache.py
+        self.cache_name = dataset
+        self.cache_file = None
+        self.cache_mesh = None
         self.mask_dir = osp.join(self.data_dir, 'results/{0}/{0}_mask.png')
         self.image_dir = osp.join(self.data_dir, 'results/{0}/{0}.jpg')
         self.shape_dir = osp.join(self.data_dir, 'results/{0}/{0}_norm.obj')
@@ -63,8 +65,19 @@ class MOW(BaseData):
         else:
             index_list = [line.strip() for line in open(self.set_dir.format(self.split))]
 
+        pose_file = osp.join(self.data_dir, 'poses.json')
+        key = anno_cache.cache_key(
+            sorted(index_list), {'split': self.split, 'suf': self.suf}, [pose_file])
+        self.cache_file = osp.join(self.data_dir, 'Cache', '%s_%s_%s' % (self.cache_name, self.split, key))
+        self.cache_mesh = self.cache_file + '_mesh.pkl'
+        if self.cache and anno_cache.exists(self.cache_file):
+            print('!! Load from cache !!', self.cache_file)
+            self.anno = anno_cache.load_anno(self.cache_file)
+            self.preload_mesh()
+            return
+
         index_list = set(index_list)
-        with open(osp.join(self.data_dir, 'poses.json')) as fp:
+        with open(pose_file) as fp:
             anno_list = json.load(fp)
 
         for i, anno in enumerate(anno_list):
@@ -112,9 +125,9 @@ class MOW(BaseData):
             self.anno['hA'].append(pose[0])
             # self.anno['image'].append(image)
             
-        os.makedirs(osp.dirname(self.cache_file), exist_ok=True)
         print('save cache')
-        pickle.dump(self.anno, open(self.cache_file, 'wb'))
+        anno_cache.save_anno(self.anno, self.cache_file)
+        self.anno = anno_cache.load_anno(self.cache_file)
 
         self.preload_mesh()
 
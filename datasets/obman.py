@@ -12,6 +12,7 @@ import numpy as np
 import tqdm
 from PIL import Image
 from nnutils import mesh_utils, geom_utils
+from datasets import anno_cache
 
 
 class Obman(BaseData):
@@ -32,8 +33,10 @@ class Obman(BaseData):
         else:
             self.cls = ''
 
-        self.cache_file = osp.join(self.data_dir, 'Cache', '%s_%s.pkl' % (dataset, self.split))
-        self.cache_mesh = osp.join(self.data_dir, 'Cache', '%s_%s_mesh.pkl' % (dataset, self.split))
+        # keyed by content in preload_anno(), see datasets/anno_cache.py
+        self.cache_name = dataset
+        self.cache_file = None
+        self.cache_mesh = None
 
         self.shape_dir = os.path.join(self.cfg.DB.DIR, 'obmanboj', '{}', '{}', 'models', 'model_normalized.obj')
         self.image_dir = osp.join(self.data_dir, split, 'rgb', '{}.jpg')
@@ -43,36 +46,35 @@ class Obman(BaseData):
     def preload_anno(self, load_keys=[]):
         for key in load_keys:
             self.anno[key] = []
-        
-        if self.cache and osp.exists(self.cache_file):
-            print('!! Load from cache !!')
-            self.anno = pickle.load(open(self.cache_file, 'rb'))
-        else:
-
-            index_list = [line.strip() for line in open(osp.join(self.data_dir, '%s.txt' % self.split))]
-            for i, index in enumerate(tqdm.tqdm(index_list)):
-                dset = self.cfg.DB.NAME
-                if 'mini' in dset and i >= int(dset.split('mini')[-1]):
-                    break
 
-                meta_path = self.meta_dir.format(index)
-                with open(meta_path, "rb") as meta_f:
-                    meta_info = pickle.load(meta_f)
+        index_file = osp.join(self.data_dir, '%s.txt' % self.split)
+        index_list = [line.strip() for line in open(index_file)]
+        dset = self.cfg.DB.NAME
+        if 'mini' in dset:
+            index_list = index_list[:int(dset.split('mini')[-1])]
+        meta_files = [self.meta_dir.format(index) for index in index_list]
+        check_meta = getattr(self.cfg.DB, 'CACHE_CHECK_META', False)
+        key = anno_cache.cache_key(
+            index_list, {'name': dset, 'split': self.split, 'dir': self.cfg.DB.DIR},
+            [index_file] + (meta_files if check_meta else []))
+        self.cache_file = osp.join(self.data_dir, 'Cache', '%s_%s_%s' % (self.cache_name, self.split, key))
+        self.cache_mesh = self.cache_file + '_mesh.pkl'
 
+        if self.cache and anno_cache.exists(self.cache_file):
+            print('!! Load from cache !!', self.cache_file)
+        else:
+            metas = anno_cache.parallel_map(
+                parse_meta, meta_files, getattr(self.cfg.DB, 'CACHE_WORKERS', None))
+            for index, (cad_index, cTh, hTo, hA) in zip(index_list, metas):
                 self.anno['index'].append(index)
-                self.anno['cad_index'].append(osp.join(meta_info["class_id"], meta_info["sample_id"]))
-                cTo = torch.FloatTensor([meta_info['cTo']])
-                cTh = torch.FloatTensor([meta_info['cTh']])
-                hTc = geom_utils.inverse_rt(mat=cTh, return_mat=True)
-                hTo = torch.matmul(hTc, cTo)
-
-                self.anno['cTh'].append(cTh[0])
-                self.anno['hTo'].append(hTo[0])
-                self.anno['hA'].append(meta_info['hA'])
+                self.anno['cad_index'].append(cad_index)
+                self.anno['cTh'].append(cTh)
+                self.anno['hTo'].append(hTo)
+                self.anno['hA'].append(hA)
 
-            os.makedirs(osp.dirname(self.cache_file), exist_ok=True)
             print('save cache')
-            pickle.dump(self.anno, open(self.cache_file, 'wb'))
+            anno_cache.save_anno(self.anno, self.cache_file)
+        self.anno = anno_cache.load_anno(self.cache_file)
 
         self.preload_mesh()
 
@@ -139,3 +141,16 @@ class Obman(BaseData):
         sample = {key: self.anno[key][idx] for key in self.anno}
         sample['mesh'] = self.obj2mesh[sample['cad_index']]
         return sample
+
+
+def parse_meta(meta_path):
+    """ Returns cad_index, cTh (4, 4), hTo (4, 4), hA (45,) """
+    with open(meta_path, "rb") as meta_f:
+        meta_info = pickle.load(meta_f)
+    cad_index = osp.join(meta_info["class_id"], meta_info["sample_id"])
+    cTo = torch.FloatTensor([meta_info['cTo']])
+    cTh = torch.FloatTensor([meta_info['cTh']])
+    hTc = geom_utils.inverse_rt(mat=cTh, return_mat=True)
+    hTo = torch.matmul(hTc, cTo)
+    hA = np.asarray(meta_info['hA'], dtype=np.float32)
+    return cad_index, cTh[0].numpy(), hTo[0].numpy(), hA
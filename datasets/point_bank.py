@@ -0,0 +1,97 @@
+""" Pre-sampled colored surface points per CAD, to replace per-item
+pytorch3d.ops.sample_points_from_meshes() in SdfImg.
+
+Layout:
+    {prefix}.npy: float32 (num_cad, num_points, 6), xyz + rgb, memory-mapped on read
+    {prefix}_index.npz: cad_index, num_points it was built with
+"""
+from __future__ import print_function
+import os
+import os.path as osp
+import numpy as np
+import torch
+import tqdm
+import pytorch3d.ops as op_3d
+
+
+class SurfacePointBank:
+    """ Points of a CAD are i.i.d. samples of its surface,
+    so a window at a random offset is distributed as a fresh call of the sampler. """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        index = np.load(prefix + '_index.npz')
+        self.cad2row = {
+            str(cad): i for i, cad in enumerate(index['cad_index'])}
+        self._data = None
+
+    @staticmethod
+    def exists(prefix, num_points=None):
+        """ Whether the bank was built, with `num_points` per cad if given.
+        A bank of another size (e.g. after changing DB.NUM_POINTS) is stale. """
+        if not (osp.exists(prefix + '.npy') and osp.exists(prefix + '_index.npz')):
+            return False
+        if num_points is None:
+            return True
+        with np.load(prefix + '_index.npz') as index:
+            return 'num_points' in index and int(index['num_points']) == num_points
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None:
+            self._data = np.load(self.prefix + '.npy', mmap_mode='r')
+        return self._data
+
+    @property
+    def bank_size(self) -> int:
+        return self.data.shape[1]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __contains__(self, cad_idx):
+        return cad_idx in self.cad2row
+
+    def read(self, cad_idx, num):
+        """
+        Returns:
+            xyz: (1, num, 3)
+            color: (1, num, 3)
+            same as sample_points_from_meshes(mesh, num, return_textures=True)
+        """
+        if num > self.bank_size:
+            raise ValueError('%d points requested from a bank of %d' % (num, self.bank_size))
+        r = self.cad2row[cad_idx]
+        start = np.random.randint(0, self.bank_size - num + 1)
+        points = torch.from_numpy(np.array(self.data[r, start:start+num]))
+        xyz, color = points[None].split([3, 3], dim=-1)
+        return xyz, color
+
+
+def build_point_bank(obj2mesh: dict, num_points: int, prefix: str, chunk=65536):
+    """ One-off sampling of num_points colored surface points for every mesh.
+
+    Args:
+        obj2mesh: cad_idx -> pytorch3d Meshes with textures, as in Obman.preload_mesh()
+        num_points: points per cad, e.g. K * subsample
+        prefix: output path without extension
+    """
+    cad_index_list = sorted(obj2mesh.keys())
+    os.makedirs(osp.dirname(osp.abspath(prefix)), exist_ok=True)
+    tmp_file = prefix + '.tmp.npy'
+    data = np.lib.format.open_memmap(
+        tmp_file, mode='w+', dtype=np.float32,
+        shape=(len(cad_index_list), num_points, 6))
+    for i, cad_idx in enumerate(tqdm.tqdm(cad_index_list)):
+        mesh = obj2mesh[cad_idx]
+        for st in range(0, num_points, chunk):
+            n = min(chunk, num_points - st)
+            xyz, color = op_3d.sample_points_from_meshes(mesh, n, return_textures=True)
+            data[i, st:st+n] = torch.cat([xyz, color], dim=-1)[0].cpu().numpy()
+    data.flush()
+    del data
+    np.savez(prefix + '_index.npz', cad_index=np.array(cad_index_list), num_points=num_points)
+    os.replace(tmp_file, prefix + '.npy')
+    print('sampled %d points for %d cads to %s.npy' % (num_points, len(cad_index_list), prefix))
+    return prefix
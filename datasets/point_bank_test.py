@@ -0,0 +1,71 @@
+import os.path as osp
+import tempfile
+import unittest
+import numpy as np
+import torch
+from scipy import stats
+from pytorch3d.structures import Meshes
+from pytorch3d.renderer import TexturesVertex
+import pytorch3d.ops as op_3d
+
+from datasets.point_bank import SurfacePointBank, build_point_bank
+
+
+def two_triangle_mesh():
+    """ A small red triangle and a 4x larger blue one, far apart. """
+    verts = torch.FloatTensor([
+        [0, 0, 0], [1, 0, 0], [0, 1, 0],
+        [3, 0, 0], [5, 0, 0], [3, 2, 0]])
+    faces = torch.LongTensor([[0, 1, 2], [3, 4, 5]])
+    colors = torch.FloatTensor([[1, 0, 0]] * 3 + [[0, 0, 1]] * 3)
+    return Meshes([verts], [faces], textures=TexturesVertex([colors]))
+
+
+class TestSurfacePointBank(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        np.random.seed(0)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.mesh = two_triangle_mesh()
+        self.prefix = osp.join(self.tmp_dir.name, 'bank')
+        build_point_bank({'a/b': self.mesh}, 8 * 4096, self.prefix)
+        self.bank = SurfacePointBank(self.prefix)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shapes(self):
+        xyz, color = self.bank.read('a/b', 2048)
+        self.assertEqual(tuple(xyz.shape), (1, 2048, 3))
+        self.assertEqual(tuple(color.shape), (1, 2048, 3))
+
+    def test_build_parameters(self):
+        self.assertTrue(SurfacePointBank.exists(self.prefix))
+        self.assertTrue(SurfacePointBank.exists(self.prefix, 8 * 4096))
+        self.assertFalse(SurfacePointBank.exists(self.prefix, 8 * 2048))
+        self.assertFalse(SurfacePointBank.exists(self.prefix + '_missing'))
+        with self.assertRaises(ValueError):
+            self.bank.read('a/b', self.bank.bank_size + 1)
+
+    def test_matches_on_the_fly_sampler(self):
+        num = 4096
+        xyz_bank, color_bank = self.bank.read('a/b', num)
+        xyz_ref, color_ref = op_3d.sample_points_from_meshes(
+            self.mesh, num, return_textures=True)
+        # coordinate marginals: two-sample Kolmogorov-Smirnov
+        for d in range(2):
+            p = stats.ks_2samp(xyz_bank[0, :, d].numpy(), xyz_ref[0, :, d].numpy()).pvalue
+            self.assertGreater(p, 1e-3)
+        # area weighting: big triangle (blue) should hold 4/5 of the points
+        blue_bank = int((color_bank[0, :, 2] > 0.5).sum())
+        blue_ref = int((color_ref[0, :, 2] > 0.5).sum())
+        p = stats.chi2_contingency(
+            [[blue_bank, num - blue_bank], [blue_ref, num - blue_ref]])[1]
+        self.assertGreater(p, 1e-3)
+        p = stats.binomtest(blue_bank, num, 0.8).pvalue
+        self.assertGreater(p, 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,8 @@ import pytorch3d.ops as op_3d
 
 from nnutils.hand_utils import ManopthWrapper, get_nTh
 from nnutils import mesh_utils, geom_utils, image_utils
+from datasets.sdf_store import SdfSampleStore
+from datasets.point_bank import SurfacePointBank, build_point_bank
 
 
 class SdfImg(nn.Module):
@@ -33,6 +35,15 @@ class SdfImg(nn.Module):
         self.data_dir = data_dir
 
         self.subsample = cfg.DB.NUM_POINTS
+        # optional packed samples, see datasets/sdf_store.py
+        self.sdf_pack = getattr(cfg.DB, 'SDF_PACK', '')
+        self.sdf_window = getattr(cfg.DB, 'SDF_WINDOW', 16) * self.subsample
+        self.sdf_store = None
+        # optional pre-sampled surface points, see datasets/point_bank.py
+        self.point_bank_file = getattr(cfg.DB, 'POINT_BANK', '')
+        self.point_bank_k = getattr(cfg.DB, 'POINT_BANK_K', 8)
+        self.point_bank = None
+        self.nTh = None  # (N, 4, 4) per annotation, filled in preload_anno()
         self.hand_wrapper = ManopthWrapper().to('cpu')
 
         self.transform = transforms.Compose([
@@ -46,6 +57,47 @@ class SdfImg(nn.Module):
             self.anno[key] = self.dataset.anno[key]
         self.obj2mesh = self.dataset.obj2mesh
         self.map = self.dataset.map
+        if self.sdf_pack and SdfSampleStore.exists(self.sdf_pack):
+            print('!! Load packed sdf !!', self.sdf_pack)
+            self.sdf_store = SdfSampleStore(self.sdf_pack)
+        if self.point_bank_file:
+            num_points = self.point_bank_k * self.subsample
+            if not SurfacePointBank.exists(self.point_bank_file, num_points):
+                build_point_bank(self.obj2mesh, num_points, self.point_bank_file)
+            print('!! Load point bank !!', self.point_bank_file)
+            self.point_bank = SurfacePointBank(self.point_bank_file)
+        if getattr(self.cfg.DB, 'CACHE_NTH', True):
+            self.nTh = self.precompute_nTh()
+
+    def precompute_nTh(self, chunk=1024) -> torch.Tensor:
+        """ get_nTh() only depends on the annotated hA, run MANO once in batches. """
+        hA = torch.stack([torch.FloatTensor(h).view(-1) for h in self.anno['hA']])
+        nTh = []
+        with torch.no_grad():
+            for st in range(0, len(hA), chunk):
+                nTh.append(get_nTh(self.hand_wrapper, hA[st:st+chunk], self.cfg.DB.RADIUS))
+        return torch.cat(nTh, 0)
+
+    def get_nTh(self, idx, hA) -> torch.Tensor:
+        if self.nTh is not None:
+            return self.nTh[idx]
+        return get_nTh(self.hand_wrapper, hA[None], self.cfg.DB.RADIUS)[0]
+
+    def sample_surface(self, cad_idx, num):
+        """ Returns xyz (1, num, 3), color (1, num, 3) """
+        if self.point_bank is not None and cad_idx in self.point_bank \
+                and num <= self.point_bank.bank_size:
+            return self.point_bank.read(cad_idx, num)
+        mesh = self.obj2mesh[cad_idx]
+        return op_3d.sample_points_from_meshes(mesh, num, return_textures=True)
+
+    def load_sdf(self, cad_idx):
+        """ Returns pos/neg samples (P, 4): a random window of the packed store if available,
+        otherwise all samples decompressed from the npz. """
+        if self.sdf_store is not None and cad_idx in self.sdf_store:
+            return self.sdf_store.read(cad_idx, self.sdf_window)
+        filename = self.dataset.get_sdf_files(cad_idx)
+        return unpack_sdf_samples(filename, None)
 
     def __len__(self):
         return len(self.anno['index'])
@@ -55,12 +107,10 @@ class SdfImg(nn.Module):
         idx = self.map[idx] if self.map is not None else idx
         # load SDF
         cad_idx = self.anno['cad_index'][idx]
-        filename = self.dataset.get_sdf_files(cad_idx)
-
-        oPos_sdf, oNeg_sdf = unpack_sdf_samples(filename, None)
+        oPos_sdf, oNeg_sdf = self.load_sdf(cad_idx)
         hTo = torch.FloatTensor(self.anno['hTo'][idx])
         hA = torch.FloatTensor(self.anno['hA'][idx])
-        nTh = get_nTh(self.hand_wrapper, hA[None], self.cfg.DB.RADIUS)[0]
+        nTh = self.get_nTh(idx, hA)
 
         nPos_sdf = self.norm_points_sdf(oPos_sdf, nTh @ hTo) 
         nNeg_sdf = self.norm_points_sdf(oNeg_sdf, nTh @ hTo) 
@@ -83,7 +133,7 @@ class SdfImg(nn.Module):
         mesh = self.obj2mesh[cad_idx]
         if self.cfg.MODEL.BATCH_SIZE == 1:
             sample['mesh'] = mesh
-        xyz, color = op_3d.sample_points_from_meshes(mesh, self.subsample * 2, return_textures=True)
+        xyz, color = self.sample_surface(cad_idx, self.subsample * 2)
         sample['oObj'] = torch.cat([xyz, color], dim=-1)[0]  # (1, P, 6)
         hObj = torch.cat([
                 mesh_utils.apply_transform(xyz, hTo[None]),
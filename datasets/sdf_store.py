@@ -0,0 +1,141 @@
+""" Packed DeepSDF samples: one memory-mapped array for all CADs.
+
+    python -m datasets.sdf_store --sdf_dir {DB.DIR}/sdf/SdfSamples/obman/all --out {DB.DIR}/sdf/packed/obman
+"""
+from __future__ import print_function
+import argparse
+import os
+import os.path as osp
+import numpy as np
+import torch
+import tqdm
+
+
+class SdfSampleStore:
+    """ Read-only view of the file written by pack_sdf_samples().
+
+    Layout:
+        {prefix}.bin: float32 (total, 4), per CAD: shuffled pos rows then shuffled neg rows,
+            NaNs stripped.
+        {prefix}_index.npz: cad_index, pos_offset, pos_count, neg_offset, neg_count, total
+
+    Since rows of a CAD are shuffled once at pack time,
+    any contiguous slice is a uniform random subset, which is read without decompression.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        index = np.load(prefix + '_index.npz')
+        self.total = int(index['total'])
+        self.cad2row = {
+            str(cad): i for i, cad in enumerate(index['cad_index'])}
+        self.pos_offset = index['pos_offset']
+        self.pos_count = index['pos_count']
+        self.neg_offset = index['neg_offset']
+        self.neg_count = index['neg_count']
+        self._data = None  # opened lazily, once per dataloader worker
+
+    @staticmethod
+    def exists(prefix):
+        return osp.exists(prefix + '.bin') and osp.exists(prefix + '_index.npz')
+
+    @property
+    def data(self) -> np.memmap:
+        if self._data is None:
+            self._data = np.memmap(
+                self.prefix + '.bin', dtype=np.float32, mode='r', shape=(self.total, 4))
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __contains__(self, cad_idx):
+        return cad_idx in self.cad2row
+
+    def _read(self, offset, count, num) -> torch.Tensor:
+        if num is None or num >= count:
+            start, num = 0, count
+        else:
+            start = np.random.randint(0, count - num + 1)
+        rows = np.array(self.data[offset + start: offset + start + num])
+        return torch.from_numpy(rows)
+
+    def read(self, cad_idx, num=None):
+        """
+        Args:
+            cad_idx: key as in anno['cad_index']
+            num: rows to read for each of pos/neg, None for all.
+
+        Returns:
+            pos_tensor: (<=num, 4)
+            neg_tensor: (<=num, 4)
+        """
+        r = self.cad2row[cad_idx]
+        pos = self._read(int(self.pos_offset[r]), int(self.pos_count[r]), num)
+        neg = self._read(int(self.neg_offset[r]), int(self.neg_count[r]), num)
+        return pos, neg
+
+
+def pack_sdf_samples(cad_index_list, get_sdf_file, prefix, seed=0):
+    """ One-off conversion of per-CAD DeepSDF npz into a SdfSampleStore.
+
+    Args:
+        cad_index_list: list of str
+        get_sdf_file: cad_idx -> npz filename, e.g. BaseData.get_sdf_files
+        prefix: output path without extension
+    """
+    from datasets.sdf_img import unpack_sdf_samples
+    rng = np.random.default_rng(seed)
+    cad_index_list = sorted(set(cad_index_list))
+    num_cad = len(cad_index_list)
+    pos_offset = np.zeros(num_cad, dtype=np.int64)
+    pos_count = np.zeros(num_cad, dtype=np.int64)
+    neg_offset = np.zeros(num_cad, dtype=np.int64)
+    neg_count = np.zeros(num_cad, dtype=np.int64)
+
+    os.makedirs(osp.dirname(osp.abspath(prefix)), exist_ok=True)
+    offset = 0
+    with open(prefix + '.bin', 'wb') as fp:
+        for i, cad_idx in enumerate(tqdm.tqdm(cad_index_list)):
+            pos, neg = unpack_sdf_samples(get_sdf_file(cad_idx), None)
+            pos = pos.numpy().astype(np.float32)
+            neg = neg.numpy().astype(np.float32)
+            pos = pos[rng.permutation(len(pos))]
+            neg = neg[rng.permutation(len(neg))]
+
+            pos_offset[i], pos_count[i] = offset, len(pos)
+            offset += len(pos)
+            neg_offset[i], neg_count[i] = offset, len(neg)
+            offset += len(neg)
+            fp.write(np.ascontiguousarray(pos).tobytes())
+            fp.write(np.ascontiguousarray(neg).tobytes())
+
+    np.savez(prefix + '_index.npz',
+             cad_index=np.array(cad_index_list), total=offset,
+             pos_offset=pos_offset, pos_count=pos_count,
+             neg_offset=neg_offset, neg_count=neg_count)
+    print('packed %d cads, %d rows to %s.bin' % (num_cad, offset, prefix))
+    return prefix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sdf_dir', type=str, required=True,
+                        help='e.g. {DB.DIR}/sdf/SdfSamples/obman/all')
+    parser.add_argument('--out', type=str, required=True,
+                        help='output prefix, e.g. {DB.DIR}/sdf/packed/obman')
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    cad_index_list = []
+    for root, _, files in os.walk(args.sdf_dir):
+        for f in files:
+            if f.endswith('.npz'):
+                rel = osp.relpath(osp.join(root, f), args.sdf_dir)
+                cad_index_list.append(rel[:-len('.npz')])
+    pack_sdf_samples(
+        cad_index_list, lambda c: osp.join(args.sdf_dir, c + '.npz'), args.out)
@@ -1,5 +1,7 @@
 import os
 import gc
+import pickle
+from functools import lru_cache
 import numpy as np
 import cv2
 
@@ -7,10 +9,11 @@ from argparse import ArgumentParser
 from PIL import Image
 from moviepy import editor
 import bisect, re
+from typing import Union
 from libzhifan import io
 import tqdm
 from config.epic_constants import HAND_MASK_KEEP_EXPAND, EPIC_HOA_SIZE, VISOR_SIZE
-from datasets.epic_lib import epichoa
+from datasets.epic_lib import epichoa, hoa_cache
 from datasets.epic_clip_v3 import PairLocator, ClipInfo
 
 from libzhifan import odlib
@@ -34,6 +37,8 @@ def parse_args():
     parser.add_argument('--output', default='/home/skynet/Zhifan/ihoi/weights/v3_clip_boxes.pkl')
     parser.add_argument('--amend', action='store_true', help='Amend the output file instead of restarting')
     parser.add_argument('--index', default=None, type=int)
+    parser.add_argument('--hoa_cache', default=None,
+                        help='hoa_cache root, videos converted there are read without protobuf')
     args = parser.parse_args()
     return args
 
@@ -75,11 +80,6 @@ class Mapper:
         y = k * (q - p) + p
         return round(y)
 
-def row2xywh(row):
-    wid = row.right - row.left
-    hei = row.bottom - row.top
-    return np.asarray([row.left, row.top, wid, hei])
-
 def box_dist(box1, box2):
     """ distance for xywh box (4,) """
     dist = np.linalg.norm(box1[:2] - box2[:2])
@@ -112,16 +112,13 @@ def compute_hand_box(det_box: np.ndarray,
     x1 = min(int(x + bw + pad), W-1)
     y1 = min(int(y + bh + pad), H-1)
 
-    crop_mask = np.zeros_like(mask)
-    crop_mask[y0:y1, x0:x1] = mask[y0:y1, x0:x1]
-    # assert n_cls == 2
-    h, w = mask.shape[:2]
-    y, x = np.nonzero(crop_mask == hid)
+    y, x = np.nonzero(mask[y0:y1, x0:x1] == hid)
     if len(y) == 0 or len(x) == 0:
         return None
+    y, x = y + y0, x + x0
     pad = 1
-    x0, x1 = max(x.min()-pad, 0), min(x.max()+pad, w-1)
-    y0, y1 = max(y.min()-pad, 0), min(y.max()+pad, h-1)
+    x0, x1 = max(x.min()-pad, 0), min(x.max()+pad, W-1)
+    y0, y1 = max(y.min()-pad, 0), min(y.max()+pad, H-1)
     hand_box = np.asarray([x0, y0, x1-x0, y1-y0], dtype=np.float32)
     return hand_box
 
@@ -136,34 +133,28 @@ def boxes_from_mask(mask: np.ndarray,
     Returns:
         (N, 4) xywh. or (0, 4) if no object
     """
-    n_cls, mask = cv2.connectedComponents(
+    n_cls, _, stats, _ = cv2.connectedComponentsWithStats(
         mask, connectivity=8)
-
-    boxes = []
-    for c in range(1, n_cls):
-        h, w = mask.shape[:2]
-        y, x = np.nonzero(mask == c)
-        x0, x1 = max(x.min()-pad, 0), min(x.max()+pad, w-1)
-        y0, y1 = max(y.min()-pad, 0), min(y.max()+pad, h-1)
-        box = np.asarray([x0, y0, x1-x0, y1-y0], dtype=np.float32)
-        boxes.append(box)
-
-    if len(boxes) == 0:
+    if n_cls <= 1:
         return np.empty((0, 4), dtype=np.float32)
 
+    h, w = mask.shape[:2]
+    left, top, width, height = stats[1:, :4].T
+    x0, x1 = np.maximum(left-pad, 0), np.minimum(left+width-1+pad, w-1)
+    y0, y1 = np.maximum(top-pad, 0), np.minimum(top+height-1+pad, h-1)
+    boxes = np.stack([x0, y0, x1-x0, y1-y0], 1).astype(np.float32)
+
     visit = set()
     finals = []
     for i in range(len(boxes)):
         if i in visit:
             continue
         box1 = boxes[i]
-        bc1 = box1[:2] + box1[2:]/2
         sz1 = np.linalg.norm(box1[2:])
         for j in range(i+1, len(boxes)):
             if j in visit:
                 continue
             box2 = boxes[j]
-            bc2 = box2[:2] + box2[2:]/2
             dist = box_dist(box1, box2)
             sz2 = np.linalg.norm(box2[2:])
             if debug:
@@ -179,16 +170,16 @@ def boxes_from_mask(mask: np.ndarray,
 
     return np.stack(finals)
 
-def compute_box_iou(box1: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+def box_iou_matrix(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
     """
     Args:
-        box1: (1, 4) xywh
-        boxes: (N, 4) xywh
+        boxes1: (M, 4) xywh
+        boxes2: (N, 4) xywh
     Returns:
-        ious: (N,)
+        ious: (M, N)
     """
-    x1, y1, w1, h1 = box1.T
-    x2, y2, w2, h2 = boxes.T
+    x1, y1, w1, h1 = [v[:, None] for v in boxes1.T]
+    x2, y2, w2, h2 = [v[None] for v in boxes2.T]
     x1, x2 = np.maximum(x1, x2), np.minimum(x1+w1, x2+w2)
     y1, y2 = np.maximum(y1, y2), np.minimum(y1+h1, y2+h2)
     inter = np.maximum(x2-x1, 0) * np.maximum(y2-y1, 0)
@@ -197,17 +188,150 @@ def compute_box_iou(box1: np.ndarray, boxes: np.ndarray) -> np.ndarray:
     return ious
 
 
+class FrameDetections:
+    """ HOA detections of one video as columns sorted by frame,
+    boxes in VISOR xywh pixels. Rows of a frame keep the order of the DataFrame.
+    """
+
+    def __init__(self, frames, is_hand, sides, boxes):
+        self.frames = frames  # (R,) int
+        self.is_hand = is_hand  # (R,) bool
+        self.sides = sides  # (R,) object, None for objects
+        self.boxes = boxes  # (R, 4)
+
+    @staticmethod
+    def from_dataframe(df) -> 'FrameDetections':
+        order = np.argsort(df.frame.to_numpy(), kind='stable')
+        df = df.iloc[order]
+        boxes = np.stack([
+            df.left.to_numpy(), df.top.to_numpy(),
+            (df.right - df.left).to_numpy(), (df.bottom - df.top).to_numpy()], 1)
+        boxes = boxes / np.asarray(EPIC_HOA_SIZE * 2) * np.asarray(VISOR_SIZE * 2)
+        is_hand = (df.det_type == 'hand').to_numpy()
+        sides = np.where(is_hand, df.side.to_numpy() if 'side' in df else None, None)
+        return FrameDetections(df.frame.to_numpy(), is_hand, sides, boxes)
+
+    def _rows(self, frame: int) -> slice:
+        start, end = np.searchsorted(self.frames, [frame, frame + 1])
+        return slice(start, end)
+
+    def hand_box(self, frame: int, side: str) -> np.ndarray:
+        """ (4,) first hand detection of `side` in frame, or None """
+        rows = self._rows(frame)
+        match = np.flatnonzero(self.is_hand[rows] & (self.sides[rows] == side))
+        if len(match) == 0:
+            return None
+        return self.boxes[rows][match[0]]
+
+    def object_boxes(self, frame: int) -> np.ndarray:
+        """ (M, 4) """
+        rows = self._rows(frame)
+        return self.boxes[rows][~self.is_hand[rows]]
+
+
+class CachedDetections:
+    """ hoa_cache.VideoHOA with the boxes of FrameDetections, in VISOR xywh pixels """
+
+    def __init__(self, hoa: hoa_cache.VideoHOA):
+        self.hoa = hoa
+
+    def hand_box(self, frame: int, side: str) -> np.ndarray:
+        return self.hoa.hand_box(frame, side, width=VISOR_SIZE[0], height=VISOR_SIZE[1])
+
+    def object_boxes(self, frame: int) -> np.ndarray:
+        return self.hoa.object_boxes(frame, width=VISOR_SIZE[0], height=VISOR_SIZE[1])
+
+
+@lru_cache(maxsize=16)
+def load_video_detections(vid, hoa_root, cache_root=None):
+    """ CachedDetections if `vid` is in the hoa_cache at cache_root,
+    otherwise FrameDetections of the protobuf DataFrame. """
+    if cache_root is not None and hoa_cache.has_cache(vid, cache_root):
+        return CachedDetections(hoa_cache.VideoHOA(vid, cache_root))
+    return FrameDetections.from_dataframe(epichoa.load_video_hoa(vid, hoa_root=hoa_root))
+
+
+def select_frame_boxes(mask: np.ndarray,
+                       cid: int,
+                       hid: int,
+                       dets: Union[FrameDetections, CachedDetections],
+                       epic_frame: int,
+                       side: str):
+    """ Object box from the mask of `cid`, the one overlapping the detected object
+    if there is exactly one, otherwise the one closest to the hand box;
+    hand box from the mask of `hid` inside the detected hand box.
+
+    Returns:
+        hand_box: (4,) or None if no hand is detected or no object in mask
+        obj_box: (4,) or None if no object in mask
+    """
+    boxes = boxes_from_mask((mask == cid).astype(np.uint8))
+    if len(boxes) == 0:  # No object mask -> the Model should skip this frame
+        return None, None
+
+    det_hand_box = dets.hand_box(epic_frame, side)
+    det_obj_boxes = dets.object_boxes(epic_frame)
+    hand_box = None
+    if det_hand_box is not None:
+        hand_box = compute_hand_box(det_hand_box, mask, hid)
+        hand_box = hand_box if hand_box is not None else det_hand_box  # Handle no hand_mask corner case
+
+    """ Only keep the box that is closest to hand """
+    if len(det_obj_boxes) == 1 or (hand_box is None and len(det_obj_boxes) > 0):
+        ious = box_iou_matrix(det_obj_boxes, boxes)  # (M, N)
+        min_idx = np.argmax(ious.max(axis=0))
+    elif hand_box is not None:
+        min_idx = np.argmin(np.linalg.norm(boxes[:, :2] - hand_box[:2], axis=1))
+    else:
+        min_idx = 0
+    return hand_box, boxes[min_idx]
+
+
+def append_boxes(path, vid, clip_boxes: dict):
+    """ Append one record of {frame: {side/cat: box}} to `path` """
+    with open(path, 'ab') as fp:
+        pickle.dump((vid, clip_boxes), fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def merge_boxes(all_boxes: dict, vid, clip_boxes: dict):
+    vid_boxes = all_boxes.setdefault(vid, dict())
+    for frame, frame_boxes in clip_boxes.items():
+        vid_boxes.setdefault(frame, dict()).update(frame_boxes)
+
+
+def read_appended_boxes(path, all_boxes: dict = None) -> dict:
+    """ Merge the records of append_boxes() in order, into `all_boxes` if given.
+    A record cut short by an interrupted run is dropped. """
+    all_boxes = dict() if all_boxes is None else all_boxes
+    if not os.path.exists(path):
+        return all_boxes
+    with open(path, 'rb') as fp:
+        while True:
+            try:
+                vid, clip_boxes = pickle.load(fp)
+            except (EOFError, pickle.UnpicklingError):
+                break
+            merge_boxes(all_boxes, vid, clip_boxes)
+    return all_boxes
+
+
 def generate_boxes(hos_v3,
                    output,
                    gen_videos=False,
                    amend=True,
-                   index: int = None):
+                   index: int = None,
+                   hoa_cache_root: str = None):
+    """ Boxes of each clip are appended to `output`.records as they are computed,
+    and merged into the `output` pickle at the end.
+    Detections of videos in `hoa_cache_root` are read from the hoa_cache.
+    """
     hoa_root = '/home/skynet/Zhifan/datasets/epic/hoa/'
     mask_fmt = '/media/skynet/DATA/Datasets/visor-dense/interpolations/%s/%s_frame_%010d.png'  # % (vid, vid, frame)
     data_mapping = io.read_json('/media/skynet/DATA/Datasets/visor-dense/meta_infos/data_mapping.json')
     mapper = Mapper(mapping='/home/skynet/Zhifan/data/epic_analysis/resources/mapping_visor_to_epic.json')
     locator = PairLocator()
     image_fmt = '/media/skynet/DATA/Datasets/visor-dense/480p/%s/%s_frame_%010d.jpg'  # % (folder, vid, frame)
+    records = f'{output}.records'
 
     hos_v3 = io.read_json(hos_v3)
     hos_v3 = [ClipInfo(**v) for v in hos_v3]
@@ -215,9 +339,12 @@ def generate_boxes(hos_v3,
     if index is not None:
         hos_v3 = hos_v3[index:index+1]
     if amend:
-        all_boxes = io.read_pickle(output)
+        all_boxes = io.read_pickle(output) if os.path.exists(output) else dict()
+        all_boxes = read_appended_boxes(records, all_boxes)
     else:
         all_boxes = dict()
+        if os.path.exists(records):
+            os.remove(records)
 
     os.makedirs('/home/skynet/Zhifan/ihoi/outputs/tmp/clip_boxes_videos', exist_ok=True)
     for clip in tqdm.tqdm(hos_v3):
@@ -227,6 +354,8 @@ def generate_boxes(hos_v3,
         side = clip.side
         cat = clip.cat
         cid = data_mapping[vid][clip.visor_name]  # original name
+        hand_name = ('left hand' if 'left' in side else 'right hand')
+        hid = data_mapping[vid][hand_name]
 
         vid_boxes = all_boxes.get(vid, dict())
         frames = []
@@ -236,94 +365,43 @@ def generate_boxes(hos_v3,
             continue
 
         # If amend and all start-end frames are already computed, skip
-        if amend:
-            computed = True
-            for frame in range(start, end+1):
-                if not frame in vid_boxes:
-                    computed = False
-                    break
-            if computed:
-                continue
-
-        df = epichoa.load_video_hoa(vid, hoa_root=hoa_root)
+        if amend and all(frame in vid_boxes for frame in range(start, end+1)):
+            continue
 
+        dets = load_video_detections(vid, hoa_root, hoa_cache_root)
+        clip_boxes = dict()
         for frame in range(start, end+1):
             mask = mask_fmt % (vid, vid, frame)
             mask = Image.open(mask).convert('P')
             mask = np.asarray(mask, dtype=np.uint8)
-            obj_mask = np.where(mask == cid, cid, 0).astype(np.uint8)
-            boxes = boxes_from_mask(obj_mask)
             epic_frame = mapper(vid, frame)  # mapping from visor frame to epic frame, b.c. hoa is in EPIC
-
-            if len(boxes) == 0:  # No object mask -> the Model should skip this frame
-                if gen_videos:
-                    image = image_fmt % ( locator.locate(vid, frame), vid, frame)
-                    image = Image.open(image)
-                    frames.append(img)
-                frame_boxes = vid_boxes.get(frame, dict())
-                frame_boxes[side] = None
-                frame_boxes[cat] = None
-                vid_boxes[frame] = frame_boxes
-                continue
-
-            hand_entries = df[(df.frame == epic_frame) & (df.det_type == 'hand') & (df.side == side)]
-            if len(hand_entries) == 0:  # Put None to hand_box to indicate model skip this frame
-                if gen_videos:
-                    image = image_fmt % ( locator.locate(vid, frame), vid, frame)
-                    image = Image.open(image)
-                    img = odlib.draw_bboxes_image_array(image, obj_box[None], color='purple')
-                    frames.append(img)
-                frame_boxes = vid_boxes.get(frame, dict())
-                frame_boxes[side] = None
-                frame_boxes[cat] = obj_box
-                vid_boxes[frame] = frame_boxes
-                continue
-
-            det_hand_box = row2xywh(df[
-                (df.frame == epic_frame) & (df.det_type == 'hand') & (df.side == side)].iloc[0])
-            det_hand_box = det_hand_box / (EPIC_HOA_SIZE * 2) * (VISOR_SIZE * 2)
-            hand_name = ('left hand' if 'left' in side else 'right hand')
-            hid = data_mapping[vid][hand_name]
-            hand_mask = np.where(mask == hid, hid, 0).astype(np.uint8)
-            hand_box = compute_hand_box(det_hand_box, hand_mask, hid)
-            hand_box = hand_box if hand_box is not None else det_hand_box  # Handle no hand_mask corner case
-
-            """ Only keep the box that is closest to hand """
-            det_obj_entries = df[(df.frame == epic_frame) & (df.det_type == 'object')]
-            if len(det_obj_entries) == 1:
-                det_obj_box = row2xywh(det_obj_entries.iloc[0])
-                det_obj_box = det_obj_box / (EPIC_HOA_SIZE * 2) * (VISOR_SIZE * 2)
-                ious = compute_box_iou(det_obj_box[None], boxes)
-                min_idx = np.argmax(ious)
-            else:
-                min_dst = np.inf
-                min_idx = 0
-                for bi in range(len(boxes)):
-                    dst = box_dist(boxes[bi], hand_box)
-                    if box_dist(boxes[bi], hand_box) < min_dst:
-                        min_idx = bi
-                        min_dst = dst
-            obj_box = boxes[min_idx]
+            hand_box, obj_box = select_frame_boxes(
+                mask, cid, hid, dets, epic_frame, side)
 
             if gen_videos:
                 image = image_fmt % ( locator.locate(vid, frame), vid, frame)
                 image = Image.open(image)
-                img = odlib.draw_bboxes_image_array(image, obj_box[None], color='purple')
-                odlib.draw_bboxes_image(img, hand_box[None],
-                                        color='green' if 'right' in side else 'red')
+                if obj_box is None:
+                    img = np.asarray(image)
+                else:
+                    img = odlib.draw_bboxes_image_array(image, obj_box[None], color='purple')
+                if hand_box is not None:
+                    odlib.draw_bboxes_image(img, hand_box[None],
+                                            color='green' if 'right' in side else 'red')
                 frames.append(img)
-            frame_boxes = vid_boxes.get(frame, dict())
-            frame_boxes[side] = hand_box
-            frame_boxes[cat] = obj_box
-            vid_boxes[frame] = frame_boxes
-        all_boxes[vid] = vid_boxes
+            clip_boxes[frame] = {side: hand_box, cat: obj_box}
+
+        append_boxes(records, vid, clip_boxes)
+        merge_boxes(all_boxes, vid, clip_boxes)
         if gen_videos:
             seq = editor.ImageSequenceClip(list(map(np.asarray, frames)), fps=15)
             seq.write_videofile(
                 f'/home/skynet/Zhifan/ihoi/outputs/tmp/clip_boxes_videos/{vid}_{start}_{end}.mp4', verbose=False, logger=None)
             del seq
             gc.collect()
-        io.write_pickle(all_boxes, output)
+    io.write_pickle(all_boxes, output)
+    if os.path.exists(records):
+        os.remove(records)  # merged into output
 
 
 if __name__ == '__main__':
@@ -332,4 +410,5 @@ if __name__ == '__main__':
                    output=args.output,
                    gen_videos=args.generate_videos,
                    amend=args.amend,
-                   index=args.index)
\ No newline at end of file
+                   index=args.index,
+                   hoa_cache_root=args.hoa_cache)
\ No newline at end of file
@@ -0,0 +1,204 @@
+import os
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import cv2
+
+from config.epic_constants import EPIC_HOA_SIZE, VISOR_SIZE
+from datasets.epic_lib import hoa_cache
+from datasets.tools.v3_clip_boxes import (
+    CachedDetections, FrameDetections, append_boxes, box_iou_matrix, boxes_from_mask,
+    compute_hand_box, load_video_detections, read_appended_boxes, select_frame_boxes)
+
+
+def detections_df(rows):
+    """ rows of (frame, det_type, side, xywh in VISOR pixels) -> DataFrame as epichoa """
+    scale = np.asarray(EPIC_HOA_SIZE * 2) / np.asarray(VISOR_SIZE * 2)
+    dicts = []
+    for frame, det_type, side, box in rows:
+        x, y, w, h = np.asarray(box, dtype=float) * scale
+        d = dict(video_id='P01_01', frame=frame, score=0.9,
+                 left=x, right=x + w, top=y, bottom=y + h, det_type=det_type)
+        if det_type == 'hand':
+            d['side'] = side
+        dicts.append(d)
+    return pd.DataFrame(dicts)
+
+
+def write_cache(cache_root, vid, rows):
+    """ the same rows as detections_df, in the hoa_cache of `vid` """
+    size = np.asarray(VISOR_SIZE * 2)
+    dets = []
+    for frame, det_type, side, box in rows:
+        x, y, w, h = box
+        is_hand = det_type == 'hand'
+        dets.append((frame, hoa_cache.HAND if is_hand else hoa_cache.OBJECT,
+                     hoa_cache.SIDES.index(side) if is_hand else -1, 0 if is_hand else -1,
+                     0.9, np.asarray([x, y, x + w, y + h]) / size, (0, 0)))
+    dets = np.array(dets, dtype=hoa_cache.DET_DTYPE)
+    dets = dets[np.lexsort([dets['det_type'], dets['frame']])]  # objects then hands
+    idx = np.searchsorted(dets['frame'], np.arange(dets['frame'].max() + 2))
+    det_path, idx_path = hoa_cache.cache_paths(vid, cache_root)
+    det_path.parent.mkdir(parents=True)
+    np.save(det_path, dets)
+    np.save(idx_path, idx.astype(np.int64))
+
+
+class BoxesFromMaskTest(unittest.TestCase):
+
+    def test_golden(self):
+        mask = np.zeros((40, 60), dtype=np.uint8)
+        mask[5:10, 10:15] = 1   # A
+        mask[5:7, 18:20] = 1    # C, close to A: merged into it
+        mask[30:36, 50:56] = 1  # B
+        mask[38:40, 0:2] = 1    # D, at the border
+        np.testing.assert_array_equal(boxes_from_mask(mask), np.float32([
+            [8, 3, 13, 8],
+            [48, 28, 9, 9],
+            [0, 36, 3, 3],
+        ]))
+        self.assertEqual(boxes_from_mask(np.zeros_like(mask)).shape, (0, 4))
+
+    def test_components_match_nonzero(self):
+        """ Component boxes from the stats match the per-label np.nonzero """
+        rng = np.random.default_rng(0)
+        for _ in range(5):
+            mask = (rng.random((48, 64)) > 0.97).astype(np.uint8)
+            mask = cv2.dilate(mask, np.ones((3, 3), np.uint8))
+            n_cls, labels = cv2.connectedComponents(mask, connectivity=8)
+            expected = []
+            for c in range(1, n_cls):
+                y, x = np.nonzero(labels == c)
+                x0, x1 = max(x.min()-2, 0), min(x.max()+2, 63)
+                y0, y1 = max(y.min()-2, 0), min(y.max()+2, 47)
+                expected.append([x0, y0, x1-x0, y1-y0])
+            np.testing.assert_array_equal(
+                boxes_from_mask(mask, size_mul=0), np.float32(expected))
+
+
+class BoxIouTest(unittest.TestCase):
+
+    def test_iou_matrix(self):
+        boxes1 = np.float32([[0, 0, 10, 10], [100, 100, 5, 5]])
+        boxes2 = np.float32([[0, 0, 10, 10], [5, 5, 10, 10], [20, 0, 4, 4]])
+        np.testing.assert_allclose(box_iou_matrix(boxes1, boxes2), [
+            [1, 25 / 175, 0],
+            [0, 0, 0],
+        ])
+
+
+class SelectFrameBoxesTest(unittest.TestCase):
+
+    def setUp(self):
+        cid, hid = 3, 1
+        self.mask = np.zeros(VISOR_SIZE[::-1], dtype=np.uint8)
+        self.mask[100:150, 100:150] = cid  # box 0
+        self.mask[300:340, 600:640] = cid  # box 1
+        self.mask[290:330, 560:600] = hid  # hand next to box 1
+        self.ids = dict(cid=cid, hid=hid)
+        # frames out of order, as in the pkl
+        self.rows = [
+            (12, 'object', None, [95, 95, 60, 60]),
+            (11, 'hand', 'right', [550, 280, 60, 60]),
+            (10, 'hand', 'left', [0, 0, 10, 10]),
+            (11, 'hand', 'right', [0, 0, 10, 10]),  # second right hand, ignored
+            (12, 'hand', 'right', [550, 280, 60, 60]),
+            (11, 'object', None, [95, 95, 60, 60]),
+            (11, 'object', None, [0, 0, 30, 30]),
+        ]
+        self.dets = FrameDetections.from_dataframe(detections_df(self.rows))
+
+    def test_detections(self):
+        np.testing.assert_array_equal(self.dets.frames, [10, 11, 11, 11, 11, 12, 12])
+        np.testing.assert_allclose(self.dets.hand_box(11, 'right'), [550, 280, 60, 60])
+        self.assertIsNone(self.dets.hand_box(10, 'right'))
+        self.assertIsNone(self.dets.hand_box(13, 'left'))
+        np.testing.assert_allclose(
+            self.dets.object_boxes(11), [[95, 95, 60, 60], [0, 0, 30, 30]])
+        self.assertEqual(self.dets.object_boxes(10).shape, (0, 4))
+
+    def test_golden(self):
+        # Two objects detected: box closest to the hand
+        hand_box, obj_box = select_frame_boxes(self.mask, dets=self.dets, epic_frame=11, side='right', **self.ids)
+        np.testing.assert_array_equal(hand_box, [559, 289, 41, 41])
+        np.testing.assert_array_equal(obj_box, [598, 298, 43, 43])
+        # One object detected: box overlapping it
+        hand_box, obj_box = select_frame_boxes(self.mask, dets=self.dets, epic_frame=12, side='right', **self.ids)
+        np.testing.assert_array_equal(hand_box, [559, 289, 41, 41])
+        np.testing.assert_array_equal(obj_box, [98, 98, 53, 53])
+        # No hand of that side detected
+        hand_box, obj_box = select_frame_boxes(self.mask, dets=self.dets, epic_frame=10, side='right', **self.ids)
+        self.assertIsNone(hand_box)
+        np.testing.assert_array_equal(obj_box, [98, 98, 53, 53])
+        # Detected hand without hand mask: the detection box
+        hand_box, _ = select_frame_boxes(self.mask, dets=self.dets, epic_frame=10, side='left', **self.ids)
+        np.testing.assert_allclose(hand_box, [0, 0, 10, 10])
+        # No object mask
+        self.assertEqual(select_frame_boxes(
+            np.zeros_like(self.mask), dets=self.dets, epic_frame=11, side='right', **self.ids), (None, None))
+
+    def test_cached_detections(self):
+        """ Reading the hoa_cache directly gives the boxes of the DataFrame """
+        with tempfile.TemporaryDirectory() as tmp:
+            write_cache(tmp, 'P01_01', self.rows)
+            cached = load_video_detections.__wrapped__('P01_01', hoa_root=None, cache_root=Path(tmp))
+            self.assertIsInstance(cached, CachedDetections)
+            for frame in range(9, 14):
+                np.testing.assert_allclose(
+                    cached.object_boxes(frame).reshape(-1, 4), self.dets.object_boxes(frame), atol=1e-3)
+                for side in ['left', 'right']:
+                    pairs = [(cached.hand_box(frame, side), self.dets.hand_box(frame, side))]
+                    pairs += zip(
+                        select_frame_boxes(self.mask, dets=cached, epic_frame=frame, side=side, **self.ids),
+                        select_frame_boxes(self.mask, dets=self.dets, epic_frame=frame, side=side, **self.ids))
+                    for box, expected in pairs:
+                        if expected is None:
+                            self.assertIsNone(box)
+                        else:
+                            np.testing.assert_allclose(box, expected, atol=1e-3)
+
+    def test_hand_box_matches_full_mask(self):
+        """ Cropping before np.nonzero gives the same box as masking the full image """
+        rng = np.random.default_rng(0)
+        mask = (rng.random((120, 160)) > 0.9).astype(np.uint8)
+        for det_box in rng.uniform(-20, 150, size=(20, 4)):
+            det_box[2:] = np.abs(det_box[2:])
+            x, y, bw, bh = det_box.astype(int)
+            pad = max(bw, bh) * 0.2 / 2
+            x0, y0 = max(int(x - pad), 0), max(int(y - pad), 0)
+            x1, y1 = min(int(x + bw + pad), 159), min(int(y + bh + pad), 119)
+            crop = np.zeros_like(mask)
+            crop[y0:y1, x0:x1] = mask[y0:y1, x0:x1]
+            ys, xs = np.nonzero(crop == 1)
+            out = compute_hand_box(det_box, mask, 1)
+            if len(ys) == 0:
+                self.assertIsNone(out)
+                continue
+            x0, x1 = max(xs.min()-1, 0), min(xs.max()+1, 159)
+            y0, y1 = max(ys.min()-1, 0), min(ys.max()+1, 119)
+            np.testing.assert_array_equal(out, [x0, y0, x1-x0, y1-y0])
+
+
+class AppendedBoxesTest(unittest.TestCase):
+
+    def test_merge_in_order(self):
+        box = np.float32([1, 2, 3, 4])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'boxes.pkl.records')
+            append_boxes(path, 'P01_01', {5: {'left hand': None, 'cup': box}})
+            append_boxes(path, 'P01_01', {5: {'right hand': box}, 6: {'cup': None}})
+            append_boxes(path, 'P02_01', {1: {'cup': box}})
+            with open(path, 'ab') as fp:  # interrupted write
+                fp.write(pickle.dumps(('P03_01', {1: {}}))[:10])
+            all_boxes = read_appended_boxes(path, {'P01_01': {4: {'cup': None}}})
+        self.assertEqual(sorted(all_boxes), ['P01_01', 'P02_01'])
+        self.assertEqual(sorted(all_boxes['P01_01']), [4, 5, 6])
+        self.assertEqual(sorted(all_boxes['P01_01'][5]), ['cup', 'left hand', 'right hand'])
+        self.assertEqual(read_appended_boxes(path + '.missing'), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 from typing import NamedTuple, List
+import torch
 from libzhifan import io
 from hydra.utils import to_absolute_path
 
@@ -17,3 +18,54 @@ class ContactRegion(NamedTuple):
 def get_contact_regions(path='weights/contact_regions.json'):
     contact_regions = io.read_json(to_absolute_path(path))
     return ContactRegion(**contact_regions)
+
+
+class ContactIndex(NamedTuple):
+    """ ContactRegion.verts as tensors, regions concatenated in order.
+
+    flat: (CONTACT,) hand vertex indices, 
+        same as reduce(lambda a, b: a + b, verts, [])
+    offsets: (R+1,) region r is flat[offsets[r]:offsets[r+1]]
+    pad_index: (R, L) positions into flat, L is the largest region size
+    pad_mask: (R, L) False where pad_index is padding
+    """
+    flat: torch.Tensor
+    offsets: torch.Tensor
+    pad_index: torch.Tensor
+    pad_mask: torch.Tensor
+
+
+def build_contact_index(contact_regions: ContactRegion) -> ContactIndex:
+    sizes = [len(v) for v in contact_regions.verts]
+    flat = torch.as_tensor(
+        [i for v in contact_regions.verts for i in v], dtype=torch.long)
+    offsets = torch.zeros(len(sizes) + 1, dtype=torch.long)
+    offsets[1:] = torch.cumsum(torch.as_tensor(sizes), 0)
+    pos = torch.arange(max(sizes)).view(1, -1)
+    pad_mask = pos < torch.as_tensor(sizes).view(-1, 1)
+    pad_index = (offsets[:-1].view(-1, 1) + pos) * pad_mask  # padding -> 0
+    return ContactIndex(
+        flat=flat, offsets=offsets, pad_index=pad_index, pad_mask=pad_mask)
+
+
+def segment_min(src: torch.Tensor,
+                pad_index: torch.Tensor,
+                pad_mask: torch.Tensor):
+    """ Min over contiguous segments of dim 1, i.e.
+    torch_scatter.scatter_min(src, index, dim=1) for a sorted index,
+    without torch_scatter.
+
+    Args:
+        src: (B, CONTACT)
+        pad_index, pad_mask: (R, L) from build_contact_index()
+
+    Returns:
+        values: (B, R)
+        argmin: (B, R) positions into dim 1 of src
+    """
+    seg = src[:, pad_index]  # (B, R, L)
+    seg = seg.masked_fill(~pad_mask, float('inf'))
+    values, arg = seg.min(dim=-1)
+    argmin = pad_index.expand(src.size(0), -1, -1).gather(
+        2, arg.unsqueeze(-1)).squeeze(-1)
+    return values, argmin
@@ -0,0 +1,59 @@
+import unittest
+from functools import reduce
+import importlib.util
+import torch
+from homan.contact_prior import (
+    get_contact_regions, build_contact_index, segment_min)
+
+
+class TestSegmentMin(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.contact_regions = get_contact_regions()
+        self.contact_index = build_contact_index(self.contact_regions)
+        num_contact = sum(len(v) for v in self.contact_regions.verts)
+        self.src = torch.rand(120, num_contact)
+        # old loss_closeness() index
+        self.index = torch.cat(
+            [torch.zeros(len(v), dtype=torch.long) + i
+             for i, v in enumerate(self.contact_regions.verts)])
+
+    def test_flat_index(self):
+        ph_idx = reduce(lambda a, b: a + b, self.contact_regions.verts, [])
+        self.assertEqual(self.contact_index.flat.tolist(), ph_idx)
+        offsets = self.contact_index.offsets
+        for r, v in enumerate(self.contact_regions.verts):
+            self.assertEqual(
+                self.contact_index.flat[offsets[r]:offsets[r+1]].tolist(), v)
+
+    def test_matches_loop(self):
+        values, argmin = segment_min(
+            self.src, self.contact_index.pad_index, self.contact_index.pad_mask)
+        for r in range(len(self.contact_regions.verts)):
+            seg = self.src[:, self.index == r]
+            self.assertTrue(torch.equal(values[:, r], seg.min(dim=1).values))
+        self.assertTrue(torch.equal(self.index[argmin],
+                                    torch.arange(values.size(1)).expand_as(argmin)))
+        self.assertTrue(torch.equal(self.src.gather(1, argmin), values))
+
+    @unittest.skipUnless(importlib.util.find_spec('torch_scatter'), 'needs torch_scatter')
+    def test_matches_scatter_min(self):
+        from torch_scatter import scatter_min
+        expected, expected_arg = scatter_min(src=self.src, index=self.index, dim=1)
+        values, argmin = segment_min(
+            self.src, self.contact_index.pad_index, self.contact_index.pad_mask)
+        self.assertTrue(torch.equal(values, expected))
+        self.assertTrue(torch.equal(argmin, expected_arg))
+
+    def test_grad(self):
+        src = self.src.clone().requires_grad_(True)
+        values, argmin = segment_min(
+            src, self.contact_index.pad_index, self.contact_index.pad_mask)
+        values.sum().backward()
+        expected = torch.zeros_like(src).scatter_(1, argmin, 1.0)
+        self.assertTrue(torch.equal(src.grad, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,20 @@
 from hydra.utils import to_absolute_path
 from typing import Tuple, List
-from functools import reduce
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import neural_renderer as nr
 from pytorch3d.ops import knn_points, knn_gather
 from pytorch3d.transforms import rotation_6d_to_matrix, matrix_to_rotation_6d
-from torch_scatter import scatter_min
 
 from nnutils.handmocap import get_hand_faces
 from nnutils.mesh_utils_extra import compute_vert_normals
-from homan.contact_prior import get_contact_regions
+from homan.contact_prior import (
+    get_contact_regions, build_contact_index, segment_min)
 from homan.homan_ManoModel import HomanManoModel
+from homan.step_profiler import NULL_PROFILER
 from homan.ho_utils import (
-    compute_transformation_ortho, compute_transformation_persp)
+    compute_transformation_ortho, compute_transformation_persp, render_hand_object_batch)
 from homan.utils.geometry import combine_meshes
 
 from homan.interactions import scenesdf
@@ -31,6 +31,7 @@ from libyana.metrics.iou import batch_mask_iou
 
 
 class HOForwarderV2(nn.Module):
+    profiler = NULL_PROFILER  # set a StepProfiler to time train_loss() terms
 
     def __init__(self,
                  camintr: torch.Tensor):
@@ -45,6 +46,13 @@ class HOForwarderV2(nn.Module):
         self.mask_size = 256
         self.register_buffer("camintr", camintr)
         self.contact_regions = get_contact_regions()
+        contact_index = build_contact_index(self.contact_regions)
+        self.register_buffer(
+            'contact_verts', contact_index.flat, persistent=False)
+        self.register_buffer(
+            'contact_pad_index', contact_index.pad_index, persistent=False)
+        self.register_buffer(
+            'contact_pad_mask', contact_index.pad_mask, persistent=False)
 
         """ Set-up silhouettes renderer """
         self.renderer = nr.renderer.Renderer(
@@ -904,8 +912,7 @@ class HOForwarderV2Impl(HOForwarderV2):
             v_obj = v_obj[:, v_obj_select, :]
             vn_obj = vn_obj[:, v_obj_select, :]
 
-        ph_idx = reduce(lambda a, b: a + b, self.contact_regions.verts, [])
-        ph = v_hand[:, ph_idx, :]
+        ph = v_hand[:, self.contact_verts, :]
         ph_copied = ph.unsqueeze(1).expand(-1, num_obj, -1, -1).reshape(
             bsize * num_obj, -1, 3)  # (B*N, CONTACT, 3)
         _, idx, nn = knn_points(ph_copied, v_obj, K=k1, return_nn=True)
@@ -915,13 +922,11 @@ class HOForwarderV2Impl(HOForwarderV2):
         ph_copied = ph_copied.view(bsize*num_obj, -1, 1, 3).expand(-1, -1, k1, -1)
         prod = torch.sum((ph_copied - nn) * vn_obj_nn, dim=-1)  # (B*N, CONTACT, k1, 3) => (B*N, CONTACT, k1)
         prod = prod**2 if squared_dist else prod.abs_()
-        index = torch.cat(
-            [prod.new_zeros(len(v), dtype=torch.long) + i
-             for i, v in enumerate(self.contact_regions.verts)])
-        
+
         # Use mean for k1 nearest points
         prod = prod.mean(-1)    # (B*N, CONTACT, k1) => (B*N, CONTACT)
-        regions_min, _ = scatter_min(src=prod, index=index, dim=1)  # (B*N, 8)
+        regions_min, _ = segment_min(
+            prod, self.contact_pad_index, self.contact_pad_mask)  # (B*N, 8)
         regions_min = regions_min[..., :num_priors]
 
         if reduce_type == 'min':
@@ -965,9 +970,8 @@ class HOForwarderV2Impl(HOForwarderV2):
         bsize, num_obj, v_obj_size = v_hand.size(0), v_obj.size(1), v_obj.size(-2)
         p_obj = v_obj.view(bsize, num_obj * v_obj_size, 3)  # 
 
-        p2_idx = reduce(lambda a, b: a + b, self.contact_regions.verts, [])
-        p2 = v_hand[:, p2_idx, :]
-        vn_hand_part = vn_hand[:, p2_idx, :]  # (B, CONTACT, 3)
+        p2 = v_hand[:, self.contact_verts, :]
+        vn_hand_part = vn_hand[:, self.contact_verts, :]  # (B, CONTACT, 3)
 
         _, idx, nn = knn_points(p_obj, p2, K=k2, return_nn=True)  # idx: (B, N*V, k2), nn: (B, N*V, k2, 3)
         nn_normals = knn_gather(vn_hand_part, idx)  # (B, N*V, k2, 3)
@@ -1023,48 +1027,62 @@ class HOForwarderV2Impl(HOForwarderV2):
             return h_to_o
     
     """ system objectives """
-    def train_loss(self, cfg, print_metric=False):
-        """ cfg: `optim` section of the config """
-        with torch.no_grad():
-            v_hand = self.get_verts_hand()[self.sample_indices, ...]
-        v_obj = self.get_verts_object()[self.sample_indices, ...]
+    def train_loss(self, cfg, print_metric=False, per_init=False):
+        """ cfg: `optim` section of the config 
+
+        Args:
+            per_init: if True, return (N,) loss of each object init summed over B
+
+        Returns:
+            scalar, or (N,) if per_init
+        """
+        prof = self.profiler
+        with prof.section('verts'):
+            with torch.no_grad():
+                v_hand = self.get_verts_hand()[self.sample_indices, ...]
+            v_obj = self.get_verts_object()[self.sample_indices, ...]
 
-        l_obj_dict = self.forward_obj_pose_render(
-            v_obj=v_obj)  # (B, N)
-        l_obj_mask = l_obj_dict['mask'].sum()
+        with prof.section('obj_sil'):
+            l_obj_dict = self.forward_obj_pose_render(
+                v_obj=v_obj)  # (B, N)
+            l_obj_mask = l_obj_dict['mask'].sum(0)
 
         if cfg.obj_part_prior:
             v_obj_select = self.obj_part_verts
         else:
             v_obj_select = None
-        l_inside = self.loss_insideness(
-            v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
-            num_nearest_points=cfg.loss.inside.num_nearest_points)
-        l_inside = l_inside.sum()
-
-        l_close = self.loss_closeness(
-            v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
-            num_priors=cfg.loss.close.num_priors,
-            reduce_type=cfg.loss.close.reduce,
-            num_nearest_points=cfg.loss.close.num_nearest_points)
-        l_close = l_close.sum()
+        with prof.section('inside'):
+            l_inside = self.loss_insideness(
+                v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
+                num_nearest_points=cfg.loss.inside.num_nearest_points)
+            l_inside = l_inside.sum(0)
+
+        with prof.section('close'):
+            l_close = self.loss_closeness(
+                v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
+                num_priors=cfg.loss.close.num_priors,
+                reduce_type=cfg.loss.close.reduce,
+                num_nearest_points=cfg.loss.close.num_nearest_points)
+            l_close = l_close.sum(0)
 
         # Accumulate
         tot_loss = cfg.loss.mask.weight * l_obj_mask +\
             cfg.loss.inside.weight * l_inside +\
-            cfg.loss.close.weight * l_close
+            cfg.loss.close.weight * l_close  # (N,)
 
         if print_metric:
             min_dist = self.loss_nearest_dist(
                 v_hand=v_hand, v_obj=v_obj).min()
             print(
-                f"obj_mask:{l_obj_mask.item():.3f} "
-                f"inside:{l_inside.item():.3f} "
-                f"close:{l_close.item():.3f} "
+                f"obj_mask:{l_obj_mask.sum().item():.3f} "
+                f"inside:{l_inside.sum().item():.3f} "
+                f"close:{l_close.sum().item():.3f} "
                 f"min_dist: {min_dist:.3f} "
                 )
 
-        return tot_loss
+        if per_init:
+            return tot_loss
+        return tot_loss.sum()
     
     def eval_metrics(self, unsafe=False, avg=False):
         """ Evaluate metric on ALL frames
@@ -1497,3 +1515,28 @@ class HOForwarderV2Vis(HOForwarderV2Impl):
             all_mask = np.uint8(255*all_mask)
             img = cv2.addWeighted(np.uint8(img*255), 0.9, all_mask, 0.5, 1.0)
         return img
+
+    def render_global_batch(self,
+                            global_cam: BatchCameraManager,
+                            global_images: np.ndarray,
+                            scene_indices,
+                            obj_idx=0,
+                            chunk_size=16,
+                            **mesh_kwargs):
+        """ Same as render_global(with_hand=True) over many scenes.
+        Vertices are computed once, and moved to cpu chunk by chunk,
+        instead of re-running get_verts_hand/object() for every frame.
+
+        Yields:
+            (H, W, 3) for each scene in scene_indices
+        """
+        hand_color = mesh_kwargs.pop('hand_color', 'light_blue')
+        obj_color = mesh_kwargs.pop('obj_color', 'yellow')
+        scene_indices = list(scene_indices)
+        with torch.no_grad():
+            verts_hand = self.get_verts_hand(**mesh_kwargs)
+            verts_obj = self.get_verts_object(**mesh_kwargs)[:, obj_idx]
+        yield from render_hand_object_batch(
+            global_cam, global_images, scene_indices, scene_indices,
+            verts_hand, self.faces_hand, verts_obj, self.faces_object,
+            chunk_size=chunk_size, hand_color=hand_color, obj_color=obj_color)
@@ -2,6 +2,7 @@ import numpy as np
 import torch
 
 from libzhifan.numeric import check_shape
+from libzhifan.geometry import SimpleMesh, projection
 
 
 def batch_weakcam2persptrans(weak_cams, K, focal_scale):
@@ -22,6 +23,55 @@ def weakcam2persptrans(weak_cam, K, focal_scale=1):
     return np.array([tx, ty, tz])
 
 
+def render_hand_object_batch(global_cam,
+                             global_images: np.ndarray,
+                             scene_indices,
+                             rows,
+                             verts_hand: torch.Tensor,
+                             faces_hand: torch.Tensor,
+                             verts_obj: torch.Tensor,
+                             faces_obj: torch.Tensor,
+                             chunk_size=16,
+                             hand_color='light_blue',
+                             obj_color='yellow'):
+    """ Hand and object of many scenes over their global images,
+    vertices are moved to cpu chunk by chunk.
+
+    Args:
+        global_cam: BatchCameraManager, indexed by scene
+        scene_indices: list of scenes to render
+        rows: list, row of verts_hand / faces_hand / verts_obj for each scene
+        verts_hand: (N, V, 3)
+        faces_hand: (N, F, 3)
+        verts_obj: (N, V_o, 3)
+        faces_obj: (F_o, 3)
+
+    Yields:
+        (H, W, 3) for each scene in scene_indices
+    """
+    for c in range(0, len(scene_indices), chunk_size):
+        chunk = scene_indices[c:c+chunk_size]
+        chunk_rows = rows[c:c+chunk_size]
+        chunk_v_hand = verts_hand[chunk_rows].cpu()
+        chunk_v_obj = verts_obj[chunk_rows].cpu()
+        chunk_f_hand = faces_hand[chunk_rows].cpu()
+        for j, scene_idx in enumerate(chunk):
+            mhand = SimpleMesh(
+                chunk_v_hand[j], chunk_f_hand[j], tex_color=hand_color)
+            mobj = SimpleMesh(
+                chunk_v_obj[j], faces_obj, tex_color=obj_color)
+            yield projection.perspective_projection_by_camera(
+                [mhand, mobj],
+                global_cam[scene_idx],
+                method=dict(
+                    name='pytorch3d',
+                    coor_sys='nr',
+                    in_ndc=False
+                ),
+                image=global_images[scene_idx],
+            )
+
+
 def compute_transformation_ortho(meshes,
                                  cams,
                                  rotations=None,
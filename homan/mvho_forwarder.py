@@ -1,20 +1,22 @@
 from hydra.utils import to_absolute_path
 from typing import Tuple, List, NamedTuple
-from functools import reduce
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import neural_renderer as nr
-from pytorch3d.ops import knn_points, knn_gather
+from pytorch3d.ops import knn_gather
 from pytorch3d.transforms import rotation_6d_to_matrix
-from torch_scatter import scatter_min
 
 from config.epic_constants import REND_SIZE
 from nnutils.handmocap import get_hand_faces
 from nnutils.mesh_utils_extra import compute_vert_normals
-from homan.contact_prior import get_contact_regions
+from nnutils.image_utils import distance_transform_edt
+from homan.contact_prior import (
+    get_contact_regions, build_contact_index, segment_min)
+from homan.proximity import HandObjectProximity
+from homan.step_profiler import NULL_PROFILER
 from homan.homan_ManoModel import HomanManoModel
-from homan.ho_utils import compute_transformation_persp
+from homan.ho_utils import compute_transformation_persp, render_hand_object_batch
 from homan.interactions import scenesdf
 
 from homan.lossutils import (
@@ -332,6 +334,7 @@ class MVHO(nn.Module):
     rather than (B, N) taking two dimensions.
     This works naturally with nr_renderer, though the performance improvement is not clear.
     """
+    profiler = NULL_PROFILER  # set a StepProfiler to time train_loss() terms
 
     def __init__(self):
         """
@@ -340,7 +343,15 @@ class MVHO(nn.Module):
         self.num_inits = None
         self.train_size = None
         self.mask_size = REND_SIZE
+        self.sil_size = REND_SIZE  # resolution of object silhouette loss, see set_sil_size()
         self.contact_regions = get_contact_regions()
+        contact_index = build_contact_index(self.contact_regions)
+        self.register_buffer(
+            'contact_verts', contact_index.flat, persistent=False)
+        self.register_buffer(
+            'contact_pad_index', contact_index.pad_index, persistent=False)
+        self.register_buffer(
+            'contact_pad_mask', contact_index.pad_mask, persistent=False)
 
         """ Set-up silhouettes renderer """
         self.renderer = nr.renderer.Renderer(
@@ -378,6 +389,10 @@ class MVHO(nn.Module):
             hand_data.v_hand_global.detach().clone().requires_grad_(False))
         self.faces_hand = hand_data.faces_hand
         self.ref_mask_hand = hand_data.ref_mask_hand
+        """ v_hand is fixed during object optimization, so are its normals """
+        self.register_buffer(
+            'vn_hand',
+            compute_vert_normals(self.v_hand, faces=self.faces_hand[0]))
     
     @property
     def rot_mat_hand(self) -> torch.Tensor:
@@ -405,6 +420,11 @@ class MVHO(nn.Module):
         self.register_buffer(
             "textures_object",
             torch.ones(faces_object.shape[0], 1, 1, 1, 3))
+        """ Object is only rotated, translated and uniformly scaled,
+        so its normals are the canonical normals rotated. """
+        self.register_buffer(
+            "vn_object_og",
+            compute_vert_normals(verts_object_og, faces=faces_object))
 
     def set_obj_transform(self,
                           translations_object,
@@ -443,20 +463,88 @@ class MVHO(nn.Module):
         self.obj_part_verts = part_verts
 
     def set_obj_target(self, target_masks_object: torch.Tensor,
-                       check_shape=True):
+                       check_shape=True,
+                       pyramid_sizes=(),
+                       edge_chamfer=False):
         """
         Args:
             target_masks_object: (N*T, W, W)
+            pyramid_sizes: list of int, lower resolutions the silhouette loss
+                will be computed at, see set_sil_size(). Each must divide W.
+            edge_chamfer: if True, also build the distance transforms of the
+                target edges, and forward_obj_pose_render() returns a 'chamfer' loss.
         """
         target_masks_object = target_masks_object
         self.register_buffer("ref_mask_object",
                              (target_masks_object > 0).float())
         self.register_buffer("keep_mask_object",
                              (target_masks_object >= 0).float())
+        for size in getattr(self, 'obj_pyramid_sizes', []):
+            delattr(self, f"ref_mask_object_{size}")
+            delattr(self, f"keep_mask_object_{size}")
+            if hasattr(self, f"edt_ref_edge_object_{size}"):
+                delattr(self, f"edt_ref_edge_object_{size}")
+        self.obj_pyramid_sizes = [v for v in pyramid_sizes if v != self.mask_size]
+        for size in self.obj_pyramid_sizes:
+            ref, keep = self._downsample_obj_target(size)
+            self.register_buffer(f"ref_mask_object_{size}", ref, persistent=False)
+            self.register_buffer(f"keep_mask_object_{size}", keep, persistent=False)
+
+        self.edge_chamfer = edge_chamfer
+        if edge_chamfer:
+            for size in [self.mask_size] + self.obj_pyramid_sizes:
+                ref, _ = self.obj_target_at(size)
+                self.register_buffer(
+                    f"edt_ref_edge_object_{size}", self._edge_edt(ref), persistent=False)
+        elif hasattr(self, f"edt_ref_edge_object_{self.mask_size}"):
+            delattr(self, f"edt_ref_edge_object_{self.mask_size}")
         self.cuda()
         if check_shape:
             self._check_shape_object()
 
+    def _downsample_obj_target(self, size: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """ Box-filtered targets, i.e. pixel coverage, at (N*T, size, size) """
+        w = self.ref_mask_object.size(-1)
+        if w % size != 0:
+            raise ValueError(f"Silhouette size {size} does not divide mask size {w}")
+        k = w // size
+        ref = F.avg_pool2d(self.ref_mask_object[:, None], k)[:, 0]
+        keep = F.avg_pool2d(self.keep_mask_object[:, None], k)[:, 0]
+        return ref, keep
+
+    def obj_target_at(self, size: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        """ (ref_mask_object, keep_mask_object) at resolution `size`,
+        from the pyramid built in set_obj_target() if available. """
+        if size == self.ref_mask_object.size(-1):
+            return self.ref_mask_object, self.keep_mask_object
+        if size in getattr(self, 'obj_pyramid_sizes', []):
+            return getattr(self, f"ref_mask_object_{size}"), \
+                getattr(self, f"keep_mask_object_{size}")
+        return self._downsample_obj_target(size)
+
+    def compute_obj_edges(self, silhouette: torch.Tensor) -> torch.Tensor:
+        """ Outer band of the silhouette, as PoseRenderer.compute_edges(),
+        7 pixels wide at mask_size and scaled with the resolution.
+
+        Args:
+            silhouette: (N*T, W, W)
+        """
+        k = max(3, 7 * silhouette.size(-1) // self.mask_size) | 1
+        pooled = F.max_pool2d(silhouette[:, None], k, stride=1, padding=k // 2)[:, 0]
+        return pooled - silhouette
+
+    def _edge_edt(self, ref: torch.Tensor, power=0.25) -> torch.Tensor:
+        """ Distance to the nearest target edge pixel, in pixels of mask_size,
+        raised to `power`*2 as PoseRenderer.edt_ref_edge. (N*T, W, W) """
+        edges = self.compute_obj_edges((ref > 0.5).float())
+        edt = distance_transform_edt(edges <= 0) * (self.mask_size / ref.size(-1))
+        return edt**(power * 2)
+
+    def set_sil_size(self, size: int = None):
+        """ Resolution of the object silhouette in forward_obj_pose_render(),
+        None for full mask_size. """
+        self.sil_size = self.mask_size if size is None else size
+
     def _check_shape_object(self):
         num_inits = self.num_inits
         check_shape(self.verts_object_og, (-1, 3))
@@ -535,6 +623,20 @@ class MVHO(nn.Module):
             raise ValueError("scale_mode not understood")
         return rots, transl, scale
 
+    def rotate_obj_normals(self, vn_og: torch.Tensor) -> torch.Tensor:
+        """ Canonical object normals to camera space, valid unless scale_mode == 'xyz'.
+
+        Args:
+            vn_og: (N*T, ..., 3) canonical normals, e.g. self.vn_object_og gathered by knn indices
+
+        Returns:
+            (N*T, ..., 3)
+        """
+        rots, _, _ = self.get_obj_transform_world()  # (N*T, 3, 3)
+        shape = vn_og.shape
+        vn = torch.matmul(vn_og.reshape(shape[0], -1, 3), rots.permute(0, 2, 1))
+        return vn.view(shape)
+
     def get_verts_object(self, hand_space=False) -> torch.Tensor:
         """
             V_out = (V_model x R_o2h + T_o2h) x R_hand + T_hand
@@ -565,15 +667,18 @@ class MVHO(nn.Module):
 class MVHOImpl(MVHO):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.rigid_obj_normals = True  # False: recompute normals from v_obj every call
 
     """ Object functions """
 
-    def render_obj(self, verts) -> torch.Tensor:
+    def render_obj(self, verts, image_size: int = None) -> torch.Tensor:
         """
         Renders objects according to current rotation and translation.
 
         Args:
             verts: (N*, V, 3)
+            image_size: render resolution, default mask_size.
+                camintr is normalized (orig_size=1), so any size sees the same view.
 
         Returns:
             images: ndarray (N*T, W, W)
@@ -581,8 +686,13 @@ class MVHOImpl(MVHO):
         batch_faces = self._expand_obj_faces(self.num_inits, self.train_size)  # (N*T, F, 3)
         batch_K = self.camintr
 
-        images = self.renderer(
-            verts, batch_faces, K=batch_K, mode='silhouettes')
+        full_size = self.renderer.image_size
+        self.renderer.image_size = full_size if image_size is None else image_size
+        try:
+            images = self.renderer(
+                verts, batch_faces, K=batch_K, mode='silhouettes')
+        finally:
+            self.renderer.image_size = full_size
         return images
 
     def forward_obj_pose_render(self,
@@ -594,18 +704,20 @@ class MVHOImpl(MVHO):
         Args:
             v_obj (torch.Tensor): (N*T, V, 3)
 
+        Silhouettes are rendered and compared at self.sil_size.
+
         Returns:
             loss_dict: dict with
                 - mask: (N*T)
+                - chamfer: (N*T), only if set_obj_target(edge_chamfer=True)
                 - offscreen: (N*T)
             iou: (N*T)
         """
-        n, t, w = self.num_inits, self.train_size, self.mask_size
+        n, t, w = self.num_inits, self.train_size, self.sil_size
 
-        image = self.render_obj(v_obj)  # (N*T, W, W)
-        keep = self.keep_mask_object  # (N*T, W, W)
+        image = self.render_obj(v_obj, image_size=w)  # (N*T, W, W)
+        image_ref, keep = self.obj_target_at(w)  # (N*T, W, W)
         image = keep * image
-        image_ref = self.ref_mask_object  # (N*T, W, W)
 
         loss_dict = {}
         if func == 'l2':
@@ -622,6 +734,10 @@ class MVHOImpl(MVHO):
             loss_mask = loss_mask * iou_factor
 
         loss_dict["mask"] = loss_mask
+        if getattr(self, 'edge_chamfer', False):
+            edt = getattr(self, f"edt_ref_edge_object_{w}")
+            loss_chamfer = torch.sum(self.compute_obj_edges(image) * edt, dim=(-2, -1))
+            loss_dict["chamfer"] = loss_chamfer / (n*image_ref.sum(dim=(-2,-1)))
         if not loss_only:
             with torch.no_grad():
                 iou = batch_mask_iou(
@@ -722,31 +838,49 @@ class MVHOImpl(MVHO):
         l_chamfer = (l_chamfer**2).sum()
         return l_chamfer
 
-    def loss_nearest_dist(self, v_hand=None, v_obj=None, phy_factor=True) -> torch.Tensor:
+    def loss_nearest_dist(self, v_hand=None, v_obj=None, phy_factor=True,
+                          proximity=None) -> torch.Tensor:
         """ 
         Args:
             v_hand: (N*T, V, 3)
             v_obj: (N*, V, 3)
+            proximity: HandObjectProximity, if given, v_hand/v_obj are ignored
+                and the distance is over its points.
         returns (N*T) 
         """
-        v_hand = self.v_hand if v_hand is None else v_hand
-        v_obj = self.get_verts_object() if v_obj is None else v_obj
-        l_min_d = compute_nearest_dist(v_obj, v_hand)
+        if proximity is not None:
+            l_min_d = proximity.nearest_dist()
+        else:
+            v_hand = self.v_hand if v_hand is None else v_hand
+            v_obj = self.get_verts_object() if v_obj is None else v_obj
+            l_min_d = compute_nearest_dist(v_obj, v_hand)
         if phy_factor:
             phy_factor = self.physical_factor()
             l_min_d = l_min_d * phy_factor
         return l_min_d
 
-    def max_min_dist(self, v_hand=None, v_obj=None) -> float:
+    def max_min_dist(self, v_hand=None, v_obj=None, proximity=None) -> float:
         """ max of min_dist over temporal dimension
         Args:
             v_hand: (N*T, V, 3)
             v_obj: (N*, V, 3)
+            proximity: see loss_nearest_dist()
+        """
+        max_min_d = self.loss_nearest_dist(
+            v_hand=v_hand, v_obj=v_obj, phy_factor=False,
+            proximity=proximity).max()
+        return max_min_d.item()
+
+    def hand_object_proximity(self, v_hand=None, v_obj=None, v_obj_select=None) -> HandObjectProximity:
+        """ Shared nearest-neighbour state over the contact vertices for
+        loss_closeness(), loss_insideness() and loss_nearest_dist().
+        Metrics over all hand vertices use loss_nearest_dist() without it (knn_points).
         """
         v_hand = self.v_hand if v_hand is None else v_hand
         v_obj = self.get_verts_object() if v_obj is None else v_obj
-        max_min_d = compute_nearest_dist(v_obj, v_hand).max()
-        return max_min_d.item()
+        if v_obj_select is not None:
+            v_obj = v_obj[:, v_obj_select, :]
+        return HandObjectProximity(v_hand[:, self.contact_verts, :], v_obj)
 
     def loss_collision(self,
                        v_hand=None, v_obj=None, phy_factor=True):
@@ -830,7 +964,8 @@ class MVHOImpl(MVHO):
                        squared_dist=False,
                        num_priors=8, 
                        reduce_type='avg',
-                       num_nearest_points=1):
+                       num_nearest_points=1,
+                       proximity=None):
         """
         L = distance from finger tips to their nearest vertices
         average over 8(=5+3) regions.
@@ -843,6 +978,8 @@ class MVHOImpl(MVHO):
             squared_dist: whether to calc loss as squared distance
             num_priors: 5 or 8
             reduce: 'min' or 'avg'
+            proximity: HandObjectProximity from self.hand_object_proximity()
+                with the same v_hand, v_obj, v_obj_select
 
         Returns:
             loss: (N*T)
@@ -852,27 +989,37 @@ class MVHOImpl(MVHO):
         v_obj = self.get_verts_object() if v_obj is None else v_obj
 
         n, t, obj_size = self.num_inits, self.train_size, v_obj.size(-2)
-        vn_obj = compute_vert_normals(v_obj, faces=self.faces_object)
+        rigid_normals = self.rigid_obj_normals and self.scale_mode != 'xyz'
+        if rigid_normals:
+            vn_og = self.vn_object_og
+            if v_obj_select is not None:
+                vn_og = vn_og[v_obj_select, :]
+        else:
+            vn_obj = compute_vert_normals(v_obj, faces=self.faces_object)
+            if v_obj_select is not None:
+                vn_obj = vn_obj[:, v_obj_select, :]
         if v_obj_select is not None:
             v_obj = v_obj[:, v_obj_select, :]
-            vn_obj = vn_obj[:, v_obj_select, :]
 
-        ph_idx = reduce(lambda a, b: a + b, self.contact_regions.verts, [])
-        ph = v_hand[:, ph_idx, :]  # (N*T, CONTACT, 3)
-        _, idx, nn = knn_points(ph, v_obj, K=k1, return_nn=True)
+        if proximity is None:
+            proximity = HandObjectProximity(v_hand[:, self.contact_verts, :], v_obj)
+        ph = proximity.p_hand  # (N*T, CONTACT, 3)
+        idx, nn = proximity.hand_to_obj(k=k1)
         # idx: (N*T, CONTACT, k1),  nn: (N*T, CONTACT, k1, 3)
-        vn_obj_nn = knn_gather(vn_obj, idx)  # (N*T, CONTACT, k1, 3)
+        if rigid_normals:
+            # only rotate the gathered normals
+            vn_obj_nn = self.rotate_obj_normals(vn_og[idx])  # (N*T, CONTACT, k1, 3)
+        else:
+            vn_obj_nn = knn_gather(vn_obj, idx)  # (N*T, CONTACT, k1, 3)
 
         ph = ph.view(n*t, -1, 1, 3).expand(-1, -1, k1, -1)
         prod = torch.sum((ph - nn) * vn_obj_nn, dim=-1)  # (N*T, CONTACT, k1, 3) => (N*T, CONTACT, k1)
         prod = prod**2 if squared_dist else prod.abs_()
-        index = torch.cat(
-            [prod.new_zeros(len(v), dtype=torch.long) + i
-             for i, v in enumerate(self.contact_regions.verts)])
-        
+
         # Use mean for k1 nearest points
         prod = prod.mean(-1)    # (N*T, CONTACT, k1) => (N*T, CONTACT)
-        regions_min, _ = scatter_min(src=prod, index=index, dim=1)  # (N*T, 8)
+        regions_min, _ = segment_min(
+            prod, self.contact_pad_index, self.contact_pad_mask)  # (N*T, 8)
         regions_min = regions_min[..., :num_priors]
 
         if reduce_type == 'min':
@@ -890,6 +1037,7 @@ class MVHOImpl(MVHO):
                         v_hand=None, v_obj=None, v_obj_select=None,
                         squared_dist=False,
                         num_nearest_points=3,
+                        proximity=None,
                         debug_viz=False):
         """
         For all p in object, find nearest K points in hand prior regions,
@@ -901,6 +1049,7 @@ class MVHOImpl(MVHO):
         Args:
             v_obj_select: List of vertices to compute loss
             num_nearest_points: number of nearest K points in hand
+            proximity: see loss_closeness()
 
         Returns:
             loss: (N*B)
@@ -908,7 +1057,10 @@ class MVHOImpl(MVHO):
         k2 = num_nearest_points
 
         v_hand = self.v_hand if v_hand is None else v_hand
-        vn_hand = compute_vert_normals(v_hand, faces=self.faces_hand[0])
+        if v_hand is self.v_hand:
+            vn_hand = self.vn_hand
+        else:
+            vn_hand = compute_vert_normals(v_hand, faces=self.faces_hand[0])
         v_obj = self.get_verts_object() if v_obj is None else v_obj
         if v_obj_select is not None:
             v_obj = v_obj[:, v_obj_select, :]
@@ -917,11 +1069,11 @@ class MVHOImpl(MVHO):
         p_obj = v_obj  # (n*t, V, 3)
         # p_obj = v_obj.view(bsize, num_obj * v_obj_size, 3)
 
-        p2_idx = reduce(lambda a, b: a + b, self.contact_regions.verts, [])
-        p2 = v_hand[:, p2_idx, :]
-        vn_hand_part = vn_hand[:, p2_idx, :]  # (N*T, CONTACT, 3)
+        if proximity is None:
+            proximity = HandObjectProximity(v_hand[:, self.contact_verts, :], p_obj)
+        vn_hand_part = vn_hand[:, self.contact_verts, :]  # (N*T, CONTACT, 3)
 
-        _, idx, nn = knn_points(p_obj, p2, K=k2, return_nn=True)  
+        idx, nn = proximity.obj_to_hand(k=k2)
         # idx: (N*T, V, k2), nn: (N*T, V, k2, 3)
         nn_normals = knn_gather(vn_hand_part, idx)  # (N*T, V, k2, 3)
 
@@ -953,48 +1105,71 @@ class MVHOImpl(MVHO):
         return loss
     
     """ system objectives """
-    def train_loss(self, optim_cfg, print_metric=False):
-        """ cfg: `optim` section of the config """
-        with torch.no_grad():
-            v_hand = self.v_hand  # (N*T, V, 3)
-        v_obj = self.get_verts_object()  # (N*T, V, 3)
+    def train_loss(self, optim_cfg, print_metric=False, per_init=False):
+        """ cfg: `optim` section of the config 
+
+        Args:
+            per_init: if True, return (N,) loss of each init summed over T,
+                so diverged inits can be told apart from the rest.
+
+        Returns:
+            scalar, or (N,) if per_init
+        """
+        n, t = self.num_inits, self.train_size
+        prof = self.profiler
+        with prof.section('verts'):
+            with torch.no_grad():
+                v_hand = self.v_hand  # (N*T, V, 3)
+            v_obj = self.get_verts_object()  # (N*T, V, 3)
 
-        l_obj_dict = self.forward_obj_pose_render(
-            v_obj=v_obj, func=optim_cfg.obj_sil_func)  # (N*T)
-        l_obj_mask = l_obj_dict['mask'].sum()
+        with prof.section('obj_sil'):
+            l_obj_dict = self.forward_obj_pose_render(
+                v_obj=v_obj, func=optim_cfg.obj_sil_func)  # (N*T)
+            l_obj_mask = l_obj_dict['mask'].view(n, t).sum(1)
 
         if hasattr(optim_cfg, 'obj_part_prior') and optim_cfg.obj_part_prior:
             v_obj_select = self.obj_part_verts
         else:
             v_obj_select = None
-        l_inside = self.loss_insideness(
-            v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
-            num_nearest_points=optim_cfg.loss.inside.num_nearest_points)
-        l_inside = l_inside.sum()
-
-        l_close = self.loss_closeness(
-            v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
-            num_priors=optim_cfg.loss.close.num_priors,
-            reduce_type=optim_cfg.loss.close.reduce,
-            num_nearest_points=optim_cfg.loss.close.num_nearest_points)
-        l_close = l_close.sum()
+        with prof.section('proximity'):
+            proximity = self.hand_object_proximity(v_hand, v_obj, v_obj_select)
+        with prof.section('inside'):
+            l_inside = self.loss_insideness(
+                v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
+                num_nearest_points=optim_cfg.loss.inside.num_nearest_points,
+                proximity=proximity)
+            l_inside = l_inside.view(n, t).sum(1)
+
+        with prof.section('close'):
+            l_close = self.loss_closeness(
+                v_hand=v_hand, v_obj=v_obj, v_obj_select=v_obj_select,
+                num_priors=optim_cfg.loss.close.num_priors,
+                reduce_type=optim_cfg.loss.close.reduce,
+                num_nearest_points=optim_cfg.loss.close.num_nearest_points,
+                proximity=proximity)
+            l_close = l_close.view(n, t).sum(1)
 
         # Accumulate
         tot_loss = optim_cfg.loss.mask.weight * l_obj_mask +\
             optim_cfg.loss.inside.weight * l_inside +\
-            optim_cfg.loss.close.weight * l_close
+            optim_cfg.loss.close.weight * l_close  # (N,)
+        if 'chamfer' in l_obj_dict:
+            l_obj_chamfer = l_obj_dict['chamfer'].view(n, t).sum(1)
+            tot_loss = tot_loss + optim_cfg.loss.chamfer.weight * l_obj_chamfer
 
         if print_metric:
-            max_min_dist = self.loss_nearest_dist(
-                v_hand=v_hand, v_obj=v_obj).max()
+            # over contact regions only
+            max_min_dist = self.loss_nearest_dist(proximity=proximity).max()
             print(
-                f"obj_mask:{l_obj_mask.item():.3f} "
-                f"inside:{l_inside.item():.3f} "
-                f"close:{l_close.item():.3f} "
-                f"max_min_dist: {max_min_dist:.3f} "
+                f"obj_mask:{l_obj_mask.sum().item():.3f} "
+                f"inside:{l_inside.sum().item():.3f} "
+                f"close:{l_close.sum().item():.3f} "
+                f"contact_max_min_dist: {max_min_dist:.3f} "
                 )
 
-        return tot_loss
+        if per_init:
+            return tot_loss
+        return tot_loss.sum()
     
     def eval_metrics(self, unsafe=False, avg=False,
                      post_homan=None):
@@ -1009,8 +1184,8 @@ class MVHOImpl(MVHO):
             v_obj = self.get_verts_object()
             _, oious, _ = self.forward_obj_pose_render(
                 v_obj=v_obj, loss_only=False)
-            max_min_dist = self.max_min_dist(
-                v_hand=v_hand, v_obj=v_obj)
+            # all hand vertices: knn_points, the dense proximity matrix is for contact points
+            max_min_dist = self.max_min_dist(v_hand=v_hand, v_obj=v_obj)
             if unsafe:
                 pd_h2o = self.penetration_depth(h2o_only=True)
             if post_homan:
@@ -1040,6 +1215,7 @@ import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('svg')  # seems svg renders plt faster
 import cv2
+from nnutils.image_utils import VideoWriter
 
 
 class MVHOVis(MVHOImpl):
@@ -1417,6 +1593,46 @@ class MVHOVis(MVHOImpl):
             img = cv2.addWeighted(np.uint8(img*255), 0.9, all_mask, 0.5, 1.0)
         return img
 
+    def render_global_batch(self,
+                            global_cam: BatchCameraManager,
+                            global_images: np.ndarray,
+                            pose_idx: int,
+                            scene_indices,
+                            chunk_size=16,
+                            **mesh_kwargs):
+        """ Same as render_global(with_hand=True) over many scenes.
+        Vertices are computed once, and moved to cpu chunk by chunk,
+        instead of re-running get_verts_object() for every frame.
+
+        Yields:
+            (H, W, 3) for each scene in scene_indices
+        """
+        hand_color = mesh_kwargs.pop('hand_color', 'light_blue')
+        obj_color = mesh_kwargs.pop('obj_color', 'yellow')
+        scene_indices = list(scene_indices)
+        offset = pose_idx * self.train_size
+        with torch.no_grad():
+            verts_hand = self.v_hand
+            verts_obj = self.get_verts_object(**mesh_kwargs)
+        yield from render_hand_object_batch(
+            global_cam, global_images, scene_indices,
+            [offset + i for i in scene_indices],
+            verts_hand, self.faces_hand, verts_obj, self.faces_object,
+            chunk_size=chunk_size, hand_color=hand_color, obj_color=obj_color)
+
+    def iter_compare_frames(self,
+                            global_cam: BatchCameraManager,
+                            global_images: np.ndarray,
+                            pose_idx: int = 0,
+                            chunk_size=16):
+        """ Lazy version of make_compare_video(), yields one frame at a time. """
+        scene_indices = range(self.train_size)
+        img_meshes = self.render_global_batch(
+            global_cam, global_images, pose_idx=pose_idx,
+            scene_indices=scene_indices, chunk_size=chunk_size)
+        for i, img_mesh in zip(scene_indices, img_meshes):
+            yield np.vstack([global_images[i], img_mesh * 255])
+
     def make_compare_video(self,
                            global_cam: BatchCameraManager,
                            global_images: np.ndarray,
@@ -1425,17 +1641,16 @@ class MVHOVis(MVHOImpl):
         Args:
             pose_idx: usually 0 for drawing eval frames
         """
-        frames = []
-        scene_indices = range(self.train_size)
-
-        for i in scene_indices:
-            img_mesh = self.render_global(
-                global_cam=global_cam,
-                global_images=global_images,
-                pose_idx=pose_idx,
-                scene_idx=i,
-                with_hand=True,
-                overlay_gt=False)
-            img = np.vstack([global_images[i], img_mesh * 255])
-            frames.append(img)
-        return frames
+        return list(self.iter_compare_frames(
+            global_cam, global_images, pose_idx=pose_idx))
+
+    def write_compare_video(self,
+                            save_file: str,
+                            global_cam: BatchCameraManager,
+                            global_images: np.ndarray,
+                            pose_idx: int = 0,
+                            fps=5):
+        """ Stream compare frames into save_file (.mp4) without keeping them. """
+        with VideoWriter(save_file, fps=fps) as writer:
+            writer.write_frames(self.iter_compare_frames(
+                global_cam, global_images, pose_idx=pose_idx))
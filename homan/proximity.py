@@ -0,0 +1,77 @@
+import torch
+
+
+class HandObjectProximity:
+    """ One squared-distance matrix between object points and hand (contact) points,
+    shared by
+        - loss_closeness: hand -> obj nearest,
+        - loss_insideness: obj -> hand nearest,
+        - nearest distance metric,
+    instead of a knn_points() call for each.
+
+    Contact points are a few hundred, so the dense (B, Vo, C) matrix is cheap.
+    It is computed without grad and only used to select neighbours;
+    returned points are gathered from the inputs, so they carry gradients as knn_points(return_nn=True).
+    """
+
+    def __init__(self, p_hand: torch.Tensor, p_obj: torch.Tensor):
+        """
+        Args:
+            p_hand: (B, C, 3) e.g. v_hand[:, contact_verts]. For all 778 hand verts
+                use knn_points instead, the (B, Vo, 778) matrix is hundreds of MB.
+            p_obj: (B, Vo, 3) after v_obj_select, if any
+        """
+        self.p_hand = p_hand
+        self.p_obj = p_obj
+        with torch.no_grad():
+            # centering keeps |a|^2 + |b|^2 - 2ab accurate for points far from the camera
+            center = p_hand.mean(dim=1, keepdim=True)
+            a = p_obj - center
+            b = p_hand - center
+            d2 = torch.baddbmm(
+                b.pow(2).sum(-1).unsqueeze(1),  # (B, 1, C)
+                a, b.transpose(1, 2), alpha=-2)  # (B, Vo, C)
+            d2.add_(a.pow(2).sum(-1, keepdim=True))
+            self.d2 = d2.clamp_min_(0)
+
+    @staticmethod
+    def _gather(points, idx):
+        """ points: (B, P, 3), idx: (B, Q, k) -> (B, Q, k, 3) """
+        b, q, k = idx.shape
+        nn = points.gather(1, idx.reshape(b, q*k, 1).expand(-1, -1, 3))
+        return nn.view(b, q, k, 3)
+
+    def obj_to_hand(self, k=1):
+        """ For each object point, k nearest hand points.
+
+        Returns:
+            idx: (B, Vo, k) into p_hand
+            nn: (B, Vo, k, 3)
+        """
+        idx = torch.topk(self.d2, k=k, dim=2, largest=False, sorted=True).indices
+        return idx, self._gather(self.p_hand, idx)
+
+    def hand_to_obj(self, k=1):
+        """ For each hand point, k nearest object points.
+
+        Returns:
+            idx: (B, C, k) into p_obj
+            nn: (B, C, k, 3)
+        """
+        idx = torch.topk(self.d2, k=k, dim=1, largest=False, sorted=True).indices
+        idx = idx.transpose(1, 2).contiguous()
+        return idx, self._gather(self.p_obj, idx)
+
+    def nearest_dist(self) -> torch.Tensor:
+        """ Squared distance of the closest (obj, hand) pair,
+        same as lossutils.compute_nearest_dist(p_obj, p_hand).
+
+        Returns:
+            (B,)
+        """
+        b, _, c = self.d2.shape
+        flat = self.d2.view(b, -1).argmin(dim=1)  # (B,)
+        i_obj = (flat // c).view(b, 1, 1).expand(-1, -1, 3)
+        i_hand = (flat % c).view(b, 1, 1).expand(-1, -1, 3)
+        diff = self.p_obj.gather(1, i_obj) - self.p_hand.gather(1, i_hand)
+        return diff.pow(2).sum(dim=(1, 2))
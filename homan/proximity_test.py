@@ -0,0 +1,42 @@
+import unittest
+import torch
+from pytorch3d.ops import knn_points
+from homan.lossutils import compute_nearest_dist
+from homan.proximity import HandObjectProximity
+
+
+class TestHandObjectProximity(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        # camera-space-like points, 0.5m away
+        offset = torch.tensor([0, 0, 0.5], dtype=torch.float64)
+        self.p_hand = (0.05 * torch.randn(6, 200, 3, dtype=torch.float64) + offset).requires_grad_(True)
+        self.p_obj = (0.05 * torch.randn(6, 300, 3, dtype=torch.float64) + offset).requires_grad_(True)
+        self.prox = HandObjectProximity(self.p_hand, self.p_obj)
+
+    def test_hand_to_obj(self):
+        _, idx, nn = knn_points(self.p_hand, self.p_obj, K=3, return_nn=True)
+        idx_p, nn_p = self.prox.hand_to_obj(k=3)
+        self.assertTrue(torch.equal(idx_p, idx))
+        self.assertTrue(torch.allclose(nn_p, nn))
+
+    def test_obj_to_hand(self):
+        _, idx, nn = knn_points(self.p_obj, self.p_hand, K=3, return_nn=True)
+        idx_p, nn_p = self.prox.obj_to_hand(k=3)
+        self.assertTrue(torch.equal(idx_p, idx))
+        self.assertTrue(torch.allclose(nn_p, nn))
+
+    def test_nearest_dist(self):
+        expected = compute_nearest_dist(self.p_obj, self.p_hand)
+        out = self.prox.nearest_dist()
+        self.assertTrue(torch.allclose(out, expected))
+
+        g_expected = torch.autograd.grad(expected.sum(), [self.p_hand, self.p_obj])
+        g_out = torch.autograd.grad(out.sum(), [self.p_hand, self.p_obj])
+        for a, b in zip(g_out, g_expected):
+            self.assertTrue(torch.allclose(a, b))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+from contextlib import contextmanager, nullcontext
+import time
+import torch
+
+
+class NullProfiler:
+    """ Disabled profiler, the default `profiler` of the forwarders.
+    section() and step() return one shared no-op context, nothing is recorded. """
+    enabled = False
+    _null = nullcontext()
+
+    def section(self, name):
+        return self._null
+
+    def step(self):
+        return self._null
+
+    def start_epoch(self, epoch):
+        pass
+
+    def end_epoch(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StepProfiler:
+    """ Wall time and CUDA allocations of the parts of an optimization step.
+
+    Usage:
+        profiler = homan.profiler = StepProfiler()
+        for e in epochs:
+            profiler.start_epoch(e)
+            for step in range(num_iters):
+                with profiler.step():
+                    with profiler.section('zero_grad'):
+                        optimizer.zero_grad()
+                    loss = homan.train_loss(cfg)  # sections inside
+                    with profiler.section('backward'):
+                        loss.backward()
+                    ...
+            profiler.end_epoch()
+        io.write_json(profiler.summary(), path)
+
+    Sections must not nest. Time that falls in a step but in no section
+    is reported as `untracked`.
+    The GPU is synchronized on entering and leaving each section (if `sync`),
+    so that asynchronous kernels are charged to the section launching them;
+    this slows the loop down, hence opt-in.
+    """
+    enabled = True
+
+    def __init__(self, sync=True):
+        self.cuda = torch.cuda.is_available()
+        self.sync = sync and self.cuda
+        self.epochs = []
+        self._cur = None
+
+    def _now(self) -> float:
+        if self.sync:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def start_epoch(self, epoch):
+        self._cur = {
+            'epoch': epoch, 'steps': 0, 'step_time': 0.0,
+            'sections': {},
+        }
+
+    def end_epoch(self):
+        if self._cur is None:
+            return
+        tracked = sum(v['time'] for v in self._cur['sections'].values())
+        self._cur['untracked'] = self._cur['step_time'] - tracked
+        self.epochs.append(self._cur)
+        self._cur = None
+
+    def _current(self) -> dict:
+        if self._cur is None:
+            self.start_epoch(len(self.epochs))
+        return self._cur
+
+    @contextmanager
+    def step(self):
+        cur = self._current()
+        st = self._now()
+        yield
+        cur['step_time'] += self._now() - st
+        cur['steps'] += 1
+
+    @contextmanager
+    def section(self, name: str):
+        cur = self._current()
+        if self.cuda:
+            mem_start = torch.cuda.memory_allocated()
+            torch.cuda.reset_peak_memory_stats()
+        st = self._now()
+        yield
+        elapsed = self._now() - st
+        rec = cur['sections'].setdefault(name, {
+            'time': 0.0, 'calls': 0, 'alloc_bytes': 0, 'peak_bytes': 0})
+        rec['time'] += elapsed
+        rec['calls'] += 1
+        if self.cuda:
+            rec['alloc_bytes'] += torch.cuda.memory_allocated() - mem_start
+            rec['peak_bytes'] = max(
+                rec['peak_bytes'], torch.cuda.max_memory_allocated() - mem_start)
+
+    def summary(self) -> dict:
+        """ JSON-serializable.
+
+        Returns:
+            - epochs: list of dict, per epoch
+                - epoch, steps, step_time (s), untracked (s)
+                - sections: name -> {time (s), calls, alloc_bytes, peak_bytes}
+                    alloc_bytes: net change of allocated memory, summed over calls
+                    peak_bytes: max over calls of the peak above the allocation at entry
+            - total: same as an epoch entry, summed over epochs, without `epoch`
+        """
+        self.end_epoch()
+        total = {'steps': 0, 'step_time': 0.0, 'untracked': 0.0, 'sections': {}}
+        for ep in self.epochs:
+            for k in ['steps', 'step_time', 'untracked']:
+                total[k] += ep[k]
+            for name, rec in ep['sections'].items():
+                tot = total['sections'].setdefault(name, {
+                    'time': 0.0, 'calls': 0, 'alloc_bytes': 0, 'peak_bytes': 0})
+                tot['time'] += rec['time']
+                tot['calls'] += rec['calls']
+                tot['alloc_bytes'] += rec['alloc_bytes']
+                tot['peak_bytes'] = max(tot['peak_bytes'], rec['peak_bytes'])
+        return {'epochs': self.epochs, 'total': total}
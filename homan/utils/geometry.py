@@ -118,11 +118,18 @@ def generate_rotations(rot_init: dict, device='cuda'):
 
     Args:
         rot_init: dict
+            -symmetry: see symmetric_rotations(), about the y-axis
+            -dedup_angle: if set, drop rotations within this many degrees
+                of an earlier one, under the symmetry
 
     Returns:
         rot: (B, 3, 3) apply to col-vec
     """
     method = rot_init['method']
+    symmetry = rot_init.get('symmetry', None)
+    dedup_angle = rot_init.get('dedup_angle', None)
+    if dedup_angle and method == 'random':
+        raise ValueError("dedup_angle would change the number of random inits")
     if method == 'spiral':
         num_sphere_pts = rot_init['num_sphere_pts']
         num_sym_rots = rot_init['num_sym_rots']
@@ -138,8 +145,13 @@ def generate_rotations(rot_init: dict, device='cuda'):
         R_o2h = upright_spiral(
             num_sphere_pts, num_sym_rots, to_axis=to_axis,
             lim_ratio=upright_lim, from_axis='y').to(device)
+    elif method == 'symmetric':
+        R_o2h = symmetric_rotations(
+            rot_init['resolution'], symmetry, sym_axis='y', device=device)
     else:
         raise ValueError(f"Unknown method: {method}")
+    if dedup_angle:
+        R_o2h = R_o2h[dedup_rotations(R_o2h, dedup_angle, symmetry, sym_axis='y')]
     return R_o2h
 
 
@@ -395,4 +407,195 @@ def spiral_rotations_z(num_sphere_pts: int,
     Rxy = Rxy.unsqueeze(1).tile(1, num_sphere_pts, 1, 1).view(num_rots, 3, 3)
     Rz = Rz.unsqueeze(0).tile(num_xy_rots, 1, 1, 1).view(num_rots, 3, 3)
     rot_mats = Rz.matmul(Rxy)
-    return rot_mats
\ No newline at end of file
+    return rot_mats
+
+""" Symmetry-aware rotation hypotheses.
+
+`symmetry` of an object about its `sym_axis` ('x', 'y' or 'z') is one of:
+    None: no symmetry
+    'axial': continuous rotations about the axis, e.g. bowl, plate, bottle
+    'axial_flip': 'axial', plus flipping the axis upside-down, e.g. can
+    'cyclic{n}': discrete rotations by 2*pi/n about the axis, e.g. 'cyclic4'
+
+Rotations R and R @ S, for S in the symmetry group, give the same object pose,
+all distances below are between such equivalence classes.
+"""
+
+
+def _axis_index(sym_axis: str) -> int:
+    if sym_axis not in ('x', 'y', 'z'):
+        raise ValueError(f"Unknown sym_axis: {sym_axis}")
+    return 'xyz'.index(sym_axis)
+
+
+def _cyclic_order(symmetry) -> int:
+    """ n of 'cyclic{n}', 1 for no symmetry """
+    if symmetry is None:
+        return 1
+    if symmetry.startswith('cyclic') and symmetry[len('cyclic'):].isdigit():
+        return int(symmetry[len('cyclic'):])
+    raise ValueError(f"Unknown symmetry: {symmetry}")
+
+
+def axis_rotations(rads: torch.Tensor, sym_axis: str) -> torch.Tensor:
+    """
+    Args:
+        rads: (K,)
+
+    Returns:
+        (K, 3, 3) rotations about sym_axis, apply to col-vec
+    """
+    a = _axis_index(sym_axis)
+    i, j = (a + 1) % 3, (a + 2) % 3
+    R = torch.zeros(len(rads), 3, 3, dtype=rads.dtype, device=rads.device)
+    R[:, a, a] = 1
+    R[:, i, i] = torch.cos(rads)
+    R[:, j, j] = torch.cos(rads)
+    R[:, i, j] = -torch.sin(rads)
+    R[:, j, i] = torch.sin(rads)
+    return R
+
+
+def geodesic_distance(R1: torch.Tensor, R2: torch.Tensor) -> torch.Tensor:
+    """ Angle of R1^T R2.
+
+    Args:
+        R1: (N1, 3, 3)
+        R2: (N2, 3, 3)
+
+    Returns:
+        (N1, N2) in radians
+    """
+    return torch.acos(_geodesic_cos(R1, R2).clamp(-1, 1))
+
+
+def _geodesic_cos(R1: torch.Tensor, R2: torch.Tensor) -> torch.Tensor:
+    """ (N1, N2) cosine of geodesic_distance(), (tr(R1^T R2) - 1) / 2 """
+    return (R1.reshape(-1, 9) @ R2.reshape(-1, 9).T - 1) / 2
+
+
+def _symmetric_cos(R1: torch.Tensor,
+                   R2: torch.Tensor,
+                   symmetry=None,
+                   sym_axis='y') -> torch.Tensor:
+    """ (N1, N2) cosine of symmetric_geodesic() """
+    if symmetry in ('axial', 'axial_flip'):
+        a = _axis_index(sym_axis)
+        cos = R1[:, :, a] @ R2[:, :, a].T
+        return cos.abs() if symmetry == 'axial_flip' else cos
+
+    n = _cyclic_order(symmetry)
+    if n == 1:
+        return _geodesic_cos(R1, R2)
+    rads = 2 * math.pi / n * torch.arange(n, dtype=R2.dtype, device=R2.device)
+    R2_sym = R2.unsqueeze(1) @ axis_rotations(rads, sym_axis)  # (N2, n, 3, 3)
+    cos = _geodesic_cos(R1, R2_sym.reshape(-1, 3, 3))
+    return cos.view(len(R1), len(R2), n).max(dim=2).values
+
+
+def symmetric_geodesic(R1: torch.Tensor,
+                       R2: torch.Tensor,
+                       symmetry=None,
+                       sym_axis='y') -> torch.Tensor:
+    """ Smallest geodesic_distance(R1, R2 @ S) over the symmetry group.
+    For 'axial' that is the angle between the rotated axes.
+
+    Args:
+        R1: (N1, 3, 3)
+        R2: (N2, 3, 3)
+
+    Returns:
+        (N1, N2) in radians
+    """
+    return torch.acos(_symmetric_cos(R1, R2, symmetry, sym_axis).clamp(-1, 1))
+
+
+def dedup_rotations(rots: torch.Tensor,
+                    min_angle_deg: float,
+                    symmetry=None,
+                    sym_axis='y',
+                    chunk_size=1024) -> torch.Tensor:
+    """ Greedily keep rotations, in order, that are more than `min_angle_deg`
+    away from all kept ones, under symmetric_geodesic().
+    Rotations are compared to the kept ones `chunk_size` at a time.
+
+    Args:
+        rots: (N, 3, 3)
+
+    Returns:
+        (K,) increasing indices of the kept rotations
+    """
+    cos_radius = math.cos(math.radians(min_angle_deg))
+    keep = []
+    for start in range(0, len(rots), chunk_size):
+        chunk = rots[start:start+chunk_size]
+        alive = torch.ones(len(chunk), dtype=torch.bool, device=rots.device)
+        if keep:
+            cos = _symmetric_cos(chunk, rots[keep], symmetry, sym_axis)
+            alive = (cos < cos_radius).all(dim=1)
+        close = _symmetric_cos(chunk, chunk, symmetry, sym_axis) >= cos_radius
+        while alive.any():
+            i = int(alive.to(torch.uint8).argmax())
+            keep.append(start + i)
+            alive &= ~close[i]
+    return torch.as_tensor(keep, dtype=torch.long, device=rots.device)
+
+
+def fibonacci_sphere(n: int) -> torch.Tensor:
+    """ (n, 3) unit vectors, evenly spread """
+    goldenRatio = (1 + 5**0.5)/2
+    i = torch.arange(n, dtype=torch.float64)
+    theta = 2 * math.pi * i / goldenRatio
+    z = 1 - (2 * i + 1) / n
+    r = torch.sqrt(1 - z**2)
+    return torch.stack([r * torch.cos(theta), r * torch.sin(theta), z], 1)
+
+
+def align_axis(dirs: torch.Tensor, sym_axis: str) -> torch.Tensor:
+    """ Rotations taking sym_axis to each of `dirs`, rotation about
+    the axis is arbitrary.
+
+    Args:
+        dirs: (N, 3) unit vectors
+
+    Returns:
+        (N, 3, 3) apply to col-vec
+    """
+    a = _axis_index(sym_axis)
+    i, j = (a + 1) % 3, (a + 2) % 3
+    helper = torch.zeros_like(dirs)
+    near_i = dirs[:, i].abs() > 0.9
+    helper[~near_i, i] = 1
+    helper[near_i, j] = 1
+    u = F.normalize(torch.cross(helper, dirs, dim=1), dim=1)
+    v = torch.cross(dirs, u, dim=1)
+    R = torch.empty(len(dirs), 3, 3, dtype=dirs.dtype, device=dirs.device)
+    R[:, :, a], R[:, :, i], R[:, :, j] = dirs, u, v
+    return R
+
+
+def symmetric_rotations(resolution_deg: float,
+                        symmetry=None,
+                        sym_axis='y',
+                        device='cuda') -> torch.Tensor:
+    """ A small set of rotations such that any pose is within
+    `resolution_deg` of one of them, under symmetric_geodesic().
+
+    Dense candidates, a spiral of axis directions times rotations about
+    the axis (only over one period of a cyclic symmetry, none for axial),
+    are thinned by dedup_rotations(). The spacing of the candidates and the
+    thinning radius are set so the covering radius stays below `resolution_deg`.
+
+    Returns:
+        (K, 3, 3) apply to col-vec
+    """
+    spacing = math.radians(resolution_deg) / 3
+    dirs = fibonacci_sphere(math.ceil(4 * math.pi / spacing**2))
+    R = align_axis(dirs, sym_axis)
+    if symmetry not in ('axial', 'axial_flip'):
+        period = 2 * math.pi / _cyclic_order(symmetry)
+        num_rads = math.ceil(period / spacing)
+        rads = period / num_rads * torch.arange(num_rads, dtype=R.dtype)
+        R = (R.unsqueeze(1) @ axis_rotations(rads, sym_axis)).view(-1, 3, 3)
+    keep = dedup_rotations(R, resolution_deg * 0.8, symmetry, sym_axis)
+    return R[keep].float().to(device)
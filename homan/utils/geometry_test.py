@@ -0,0 +1,104 @@
+import math
+import unittest
+import torch
+
+from homan.utils.geometry import (
+    axis_rotations, dedup_rotations, generate_rotations, geodesic_distance,
+    random_avro_rotations, symmetric_geodesic, symmetric_rotations)
+
+
+SYMMETRIES = [None, 'axial', 'axial_flip', 'cyclic4']
+
+
+class SymmetricGeodesicTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.R1 = random_avro_rotations(50, 'cpu').double()
+        self.R2 = random_avro_rotations(40, 'cpu').double()
+
+    def test_no_symmetry(self):
+        d = symmetric_geodesic(self.R1, self.R2)
+        self.assertTrue(torch.allclose(d, geodesic_distance(self.R1, self.R2)))
+        self.assertTrue(torch.allclose(
+            geodesic_distance(self.R1, self.R1).diagonal(), torch.zeros(50, dtype=torch.float64),
+            atol=1e-3))
+        S = axis_rotations(torch.tensor([0.3], dtype=torch.float64), 'y')
+        self.assertTrue(torch.allclose(
+            geodesic_distance(self.R1[:1], self.R1[:1] @ S), torch.tensor([[0.3]], dtype=torch.float64)))
+
+    def test_invariance(self):
+        flip = axis_rotations(torch.tensor([math.pi], dtype=torch.float64), 'x')
+        group = {
+            'axial': axis_rotations(torch.tensor([0.7], dtype=torch.float64), 'y'),
+            'axial_flip': flip @ axis_rotations(torch.tensor([1.9], dtype=torch.float64), 'y'),
+            'cyclic4': axis_rotations(torch.tensor([3 * math.pi / 2], dtype=torch.float64), 'y'),
+        }
+        for symmetry, S in group.items():
+            d = symmetric_geodesic(self.R1, self.R2, symmetry)
+            d_sym = symmetric_geodesic(self.R1, self.R2 @ S, symmetry)
+            self.assertTrue(torch.allclose(d, d_sym, atol=1e-6), symmetry)
+            self.assertTrue(torch.all(d <= geodesic_distance(self.R1, self.R2) + 1e-6), symmetry)
+
+
+class SymmetricRotationsTest(unittest.TestCase):
+
+    def test_coverage(self):
+        """ The max geodesic gap to the hypotheses is within the resolution """
+        torch.manual_seed(0)
+        queries = random_avro_rotations(20000, 'cpu').double()
+        for symmetry in SYMMETRIES:
+            for resolution in [30, 45]:
+                rots = symmetric_rotations(resolution, symmetry, device='cpu').double()
+                self.assertTrue(torch.allclose(
+                    rots.transpose(1, 2) @ rots, torch.eye(3, dtype=torch.float64), atol=1e-5))
+                gap = symmetric_geodesic(queries, rots, symmetry).min(dim=1).values.max()
+                self.assertLessEqual(math.degrees(gap), resolution, (symmetry, resolution))
+
+    def test_counts(self):
+        counts = {s: len(symmetric_rotations(30, s, device='cpu')) for s in SYMMETRIES}
+        self.assertLess(counts['axial'], counts['cyclic4'])
+        self.assertLess(counts['cyclic4'], counts[None])
+        self.assertLess(counts['axial_flip'], 0.6 * counts['axial'])
+        self.assertLess(counts['cyclic4'], 0.3 * counts[None])
+
+
+class DedupRotationsTest(unittest.TestCase):
+
+    def test_dedup(self):
+        torch.manual_seed(0)
+        rots = random_avro_rotations(300, 'cpu').double()
+        for symmetry in SYMMETRIES:
+            keep = dedup_rotations(rots, 40, symmetry, chunk_size=64)
+            self.assertTrue(torch.all(keep[1:] > keep[:-1]))
+            self.assertEqual(keep[0], 0)
+            d = symmetric_geodesic(rots[keep], rots[keep], symmetry)
+            d.fill_diagonal_(math.pi)
+            self.assertGreater(math.degrees(d.min()), 40)
+            covered = symmetric_geodesic(rots, rots[keep], symmetry).min(dim=1).values
+            self.assertLessEqual(math.degrees(covered.max()), 40 + 1e-6)
+            self.assertTrue(torch.equal(keep, dedup_rotations(rots, 40, symmetry)))
+
+    def test_symmetric_copies(self):
+        rots = random_avro_rotations(20, 'cpu')
+        S = axis_rotations(torch.tensor([math.pi / 2]), 'y')
+        copies = torch.cat([rots, rots @ S])
+        self.assertEqual(len(dedup_rotations(copies, 1, 'cyclic4')), 20)
+        self.assertEqual(len(dedup_rotations(copies, 1, 'axial')), 20)
+        self.assertEqual(len(dedup_rotations(copies, 1, None)), 40)
+
+    def test_generate_rotations(self):
+        rot_init = dict(method='spiral', num_sphere_pts=200, num_sym_rots=1,
+                        symmetry='axial', dedup_angle=None)
+        self.assertEqual(len(generate_rotations(rot_init, device='cpu')), 200)
+        rot_init['dedup_angle'] = 20
+        self.assertLess(len(generate_rotations(rot_init, device='cpu')), 200)
+        with self.assertRaises(ValueError):
+            generate_rotations(dict(method='random', num_inits=10, dedup_angle=20), device='cpu')
+        rots = generate_rotations(
+            dict(method='symmetric', resolution=30, symmetry='axial'), device='cpu')
+        self.assertEqual(len(rots), len(symmetric_rotations(30, 'axial', device='cpu')))
+
+
+if __name__ == '__main__':
+    unittest.main()
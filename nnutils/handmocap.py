@@ -257,12 +257,12 @@ def extract_forwarder_input(data_elem: DataElement,
     hand_bboxes = torch.as_tensor(np.stack([v[side] for v in hand_bbox_dicts]))
     bbox_squared = image_utils.square_bbox_xywh(
         hand_bboxes if USE_HAND_BBOX else obj_bboxes, ihoi_box_expand).int()
-    obj_mask_patch = image_utils.batch_crop_resize(
-        object_masks, bbox_squared, rend_size)
-    hand_mask_patch = image_utils.batch_crop_resize(
-        hand_masks, bbox_squared, rend_size)
-    image_patch = image_utils.batch_crop_resize(
-        images, bbox_squared, rend_size)
+    obj_mask_patch = image_utils.batch_crop_resize_grid(
+        object_masks, bbox_squared, rend_size, mode='nearest')
+    hand_mask_patch = image_utils.batch_crop_resize_grid(
+        hand_masks, bbox_squared, rend_size, mode='nearest')
+    image_patch = image_utils.batch_crop_resize_grid(
+        images, bbox_squared, rend_size, mode='bilinear')
     ihoi_h = torch.ones([len(global_cam)]) * rend_size
     ihoi_w = torch.ones([len(global_cam)]) * rend_size
     ihoi_cam = global_cam.crop(bbox_squared).resize(ihoi_h, ihoi_w)
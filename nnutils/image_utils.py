@@ -6,6 +6,7 @@ from __future__ import print_function
 from typing import Union
 import os
 import os.path as osp
+import subprocess
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -13,6 +14,7 @@ import cv2
 import imageio
 import numpy as np
 import torch
+import torch.nn.functional as F_torch
 import torchvision.utils as vutils
 import torchvision.transforms.functional as F
 from torchvision import transforms
@@ -344,6 +346,79 @@ def batch_crop_resize(images: Union[np.ndarray, torch.Tensor],
     return img_crops
 
 
+def batch_crop_resize_grid(images: Union[np.ndarray, torch.Tensor],
+                           boxes: torch.Tensor,
+                           out_size: int,
+                           mode='nearest',
+                           device=None) -> Union[np.ndarray, torch.Tensor]:
+    """ Vectorized batch_crop_resize(): one sampling grid per box,
+    all boxes cropped, zero-padded and resized in a single F.grid_sample.
+
+    mode='nearest' reproduces batch_crop_resize() (pad 0 outside the image,
+    torchvision nearest resize), so use it for masks; 'bilinear' for RGB.
+
+    Args:
+        images: ndarray (B, H, W, C) uint8 or (B, H, W),
+            or torch.Tensor (B, ..., H, W)
+        boxes: (B, 4) xywh
+        out_size: int
+        mode: 'nearest' or 'bilinear'
+        device: where to run grid_sample, default to images' device
+
+    Returns:
+        img_crops: same type/dtype/layout as images,
+            (B, out_size, out_size, C) for ndarray, (B, ..., out_size, out_size) for Tensor
+    """
+    if isinstance(images, (list, tuple)):
+        images = np.asarray(images)
+    is_np = isinstance(images, np.ndarray)
+    if is_np:
+        src = torch.from_numpy(images)
+        if src.ndim == 4:
+            src = src.permute(0, 3, 1, 2)
+    else:
+        src = images
+    device = src.device if device is None else device
+    dtype = src.dtype
+    lead_shape = src.shape[1:-2]
+    bsize, img_h, img_w = src.size(0), src.size(-2), src.size(-1)
+    src = src.reshape(bsize, -1, img_h, img_w).to(device=device, dtype=torch.float32)
+
+    boxes = torch.as_tensor(boxes, device=device)
+    x0, y0, w, h = boxes.long().float().unbind(-1)  # crop_resize_v2 truncates to int
+    steps = torch.arange(out_size, device=device, dtype=torch.float32)
+    sx = (w / out_size).view(-1, 1)
+    sy = (h / out_size).view(-1, 1)
+    if mode == 'nearest':
+        # grid_sample rounds to nearest pixel, torchvision nearest takes floor(i * s);
+        # shift by less than the 1/out_size sub-pixel step to land on the same pixel.
+        eps = 0.25 / out_size
+        xs = x0.view(-1, 1) + steps * sx - 0.5 + eps
+        ys = y0.view(-1, 1) + steps * sy - 0.5 + eps
+    elif mode == 'bilinear':
+        xs = x0.view(-1, 1) + (steps + 0.5) * sx - 0.5
+        ys = y0.view(-1, 1) + (steps + 0.5) * sy - 0.5
+    else:
+        raise ValueError(f"mode {mode} not understood")
+    gx = (2 * xs + 1) / img_w - 1  # (B, out)
+    gy = (2 * ys + 1) / img_h - 1
+    grid = torch.stack([
+        gx.view(bsize, 1, out_size).expand(-1, out_size, -1),
+        gy.view(bsize, out_size, 1).expand(-1, -1, out_size)], dim=-1)
+
+    out = F_torch.grid_sample(
+        src, grid, mode=mode, padding_mode='zeros', align_corners=False)
+    if not dtype.is_floating_point:
+        out = out.round_()
+    out = out.to(dtype).view(bsize, *lead_shape, out_size, out_size)
+
+    if is_np:
+        if out.ndim == 4:
+            out = out.permute(0, 2, 3, 1)
+        return out.cpu().numpy()
+    return out
+
+
 def affine_image(image, res, affine_trans=None, augment=None):
     """ apply 2D afine transformation to image
     :param image: numpy / Image of (H, W, C)
@@ -739,21 +814,101 @@ def write_gif(image_list, gif_name):
     print('save to ', gif_name + '.gif')
 
 
-def write_mp4(video, save_file):
-    tmp_dir = save_file + '.tmp'
-    os.makedirs(tmp_dir, exist_ok=True)
-    for t, image in enumerate(video):
-        imageio.imwrite(osp.join(tmp_dir, '%02d.jpg' % t), image.astype(np.uint8))
+class VideoWriter:
+    """ Stream (H, W, 3) frames into an ffmpeg encoder through a pipe.
+
+    Frames are encoded as soon as they are written, so memory stays at one
+    frame regardless of clip length, and nothing touches a temp dir.
 
-    if osp.exists(save_file + '.mp4'):
-        os.system('rm %s.mp4' % (save_file))
-    src_list_dir = osp.join(tmp_dir, '%02d.jpg')
-    cmd = 'ffmpeg -framerate 10 -i %s -c:v libx264 -pix_fmt yuv420p %s.mp4' % (src_list_dir, save_file)
-    cmd += ' -hide_banner -loglevel error'
-    print(cmd)
-    os.system(cmd)
-    cmd = 'rm -r %s' % tmp_dir
-    os.system(cmd)
+    Usage:
+        with VideoWriter('out.mp4', fps=5) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+    def __init__(self, save_file, fps=10, codec='libx264', pix_fmt='yuv420p'):
+        """
+        Args:
+            save_file: output path, including extension
+        """
+        self.save_file = save_file
+        self.fps = fps
+        self.codec = codec
+        self.pix_fmt = pix_fmt
+        self.num_frames = 0
+        self._proc = None
+        self._size = None
+
+    @staticmethod
+    def ffmpeg_exe() -> str:
+        try:
+            import imageio_ffmpeg
+            return imageio_ffmpeg.get_ffmpeg_exe()
+        except ImportError:
+            return 'ffmpeg'
+
+    def _open(self, height, width):
+        save_dir = osp.dirname(self.save_file)
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        cmd = [
+            self.ffmpeg_exe(), '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', '%dx%d' % (width, height), '-r', str(self.fps),
+            '-i', '-',
+            '-an', '-c:v', self.codec, '-pix_fmt', self.pix_fmt,
+            # yuv420p requires even width and height
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            self.save_file]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        self._size = (height, width)
+
+    def write(self, frame: np.ndarray):
+        """
+        Args:
+            frame: (H, W, 3) uint8, or float in [0, 255]
+        """
+        if frame.dtype != np.uint8:
+            frame = np.clip(frame, 0, 255).astype(np.uint8)
+        if frame.ndim == 2:
+            frame = np.repeat(frame[..., None], 3, axis=-1)
+        frame = frame[..., :3]
+        if self._proc is None:
+            self._open(*frame.shape[:2])
+        if frame.shape[:2] != self._size:
+            raise ValueError(
+                f"Frame size {frame.shape[:2]} differs from {self._size}")
+        self._proc.stdin.write(np.ascontiguousarray(frame).tobytes())
+        self.num_frames += 1
+
+    def write_frames(self, frames):
+        for frame in frames:
+            self.write(frame)
+        return self
+
+    def close(self):
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        ret = self._proc.wait()
+        self._proc = None
+        if ret != 0:
+            raise RuntimeError(f"ffmpeg exited with code {ret} for {self.save_file}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_mp4(video, save_file, fps=10):
+    """
+    Args:
+        video: iterable of (H, W, 3), consumed lazily
+        save_file: path without '.mp4'
+    """
+    with VideoWriter(save_file + '.mp4', fps=fps) as writer:
+        writer.write_frames(video)
 
 
 def blend_images(fg, bg, mask=None, r=0.9):
@@ -1119,6 +1274,50 @@ def blur(image, k, mask):
         (1 - non_zero) * torch_result / ((2*k+1) ** 2 * C)
     return out
 
+
+def _nearest_zero_sq_last_dim(mask: torch.Tensor) -> torch.Tensor:
+    """ Squared distance to the nearest zero along the last dim, inf if none """
+    w = mask.size(-1)
+    idx = torch.arange(w, dtype=torch.float32, device=mask.device).expand(mask.shape)
+    bg = mask == 0
+    prev = torch.where(bg, idx, torch.full_like(idx, -float('inf'))).cummax(-1).values
+    nxt = torch.where(bg, idx, torch.full_like(idx, float('inf')))
+    nxt = nxt.flip(-1).cummin(-1).values.flip(-1)
+    return torch.minimum(idx - prev, nxt - idx)**2
+
+
+def _lower_envelope_last_dim(f: torch.Tensor, max_elements: int) -> torch.Tensor:
+    """ out[..., i] = min_j f[..., j] + (i - j)^2, in chunks of i """
+    w = f.size(-1)
+    idx = torch.arange(w, dtype=f.dtype, device=f.device)
+    sq = (idx[:, None] - idx[None, :])**2  # (W_out, W_in)
+    step = max(1, max_elements // max(f.numel(), 1))
+    out = torch.empty_like(f)
+    for s in range(0, w, step):
+        out[..., s:s+step] = (f.unsqueeze(-2) + sq[s:s+step]).amin(dim=-1)
+    return out
+
+
+def distance_transform_edt(mask: torch.Tensor, max_elements=2**25) -> torch.Tensor:
+    """ Exact euclidean distance of each pixel to the nearest zero pixel,
+    as scipy.ndimage.distance_transform_edt but batched and on mask.device.
+
+    The squared distance is separable: a 1D scan along W gives the distance
+    to the nearest zero in each row, then a min-plus pass along H combines rows.
+    The latter is O(H) per pixel, done in chunks of at most `max_elements`.
+
+    Args:
+        mask: (B, H, W) bool or float, nonzero for foreground
+    Returns:
+        (B, H, W) float32, 0 on background.
+            Images without background get the image diagonal everywhere.
+    """
+    h, w = mask.shape[-2:]
+    f = _nearest_zero_sq_last_dim(mask)
+    f = _lower_envelope_last_dim(f.transpose(-1, -2).contiguous(), max_elements)
+    f = f.transpose(-1, -2)
+    return f.clamp_(max=h*h + w*w).sqrt_().contiguous()
+
 ########################
 def display_gif(filename):
     with open(filename,'rb') as f:
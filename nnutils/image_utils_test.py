@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import torch
+from scipy.ndimage import distance_transform_edt as scipy_edt
+from nnutils.image_utils import (
+    batch_crop_resize, batch_crop_resize_grid, distance_transform_edt)
+
+
+class TestBatchCropResizeGrid(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.images = rng.integers(0, 255, size=(6, 90, 160, 3), dtype=np.uint8)
+        self.masks = torch.as_tensor(
+            rng.integers(-1, 2, size=(6, 90, 160)))
+        # inside, crossing each border, and larger than the image
+        self.boxes = torch.as_tensor([
+            [10, 5, 60, 60],
+            [-20, 10, 50, 50],
+            [130, 50, 64, 64],
+            [40, -30, 45, 45],
+            [100, 70, 33, 33],
+            [-40, -60, 240, 240],
+        ]).int()
+
+    def test_nearest_matches_loop_masks(self):
+        expected = batch_crop_resize(self.masks, self.boxes, 32)
+        out = batch_crop_resize_grid(self.masks, self.boxes, 32, mode='nearest')
+        self.assertEqual(out.dtype, self.masks.dtype)
+        self.assertTrue(torch.equal(out, expected))
+
+    def test_nearest_matches_loop_images(self):
+        expected = batch_crop_resize(self.images, self.boxes, 48)
+        out = batch_crop_resize_grid(self.images, self.boxes, 48, mode='nearest')
+        self.assertEqual(out.shape, expected.shape)
+        self.assertLessEqual(np.abs(out.astype(int) - expected.astype(int)).max(), 1)
+
+    def test_bilinear_padding(self):
+        out = batch_crop_resize_grid(self.images, self.boxes, 48, mode='bilinear')
+        self.assertEqual(out.shape, (6, 48, 48, 3))
+        self.assertEqual(out.dtype, np.uint8)
+        # box 1 starts 20px left of the image: left columns are zero padded
+        self.assertTrue((out[1, :, :10] == 0).all())
+
+
+class TestDistanceTransformEdt(unittest.TestCase):
+
+    def check(self, masks, device='cpu', **kwargs):
+        out = distance_transform_edt(torch.as_tensor(masks, device=device), **kwargs)
+        self.assertEqual(out.shape, masks.shape)
+        for mask, d in zip(masks, out.cpu().numpy()):
+            np.testing.assert_allclose(d, scipy_edt(mask), rtol=1e-5, atol=1e-4)
+
+    def test_matches_scipy(self):
+        rng = np.random.default_rng(0)
+        masks = rng.random((5, 40, 56)) > 0.02  # sparse background
+        self.check(masks)
+        self.check(masks, max_elements=1)  # one output column per chunk
+
+    def test_shapes(self):
+        masks = np.ones((3, 64, 64), dtype=bool)
+        masks[0, 10:20, 30:50] = False  # block
+        masks[1, 63, 0] = False  # corner, distances up to the diagonal
+        masks[2, :, 32] = False  # line
+        self.check(masks)
+
+    def test_no_background(self):
+        out = distance_transform_edt(torch.ones(1, 6, 8))
+        self.assertTrue(torch.allclose(out, torch.full_like(out, 10.0)))
+
+    @unittest.skipUnless(torch.cuda.is_available(), 'no cuda')
+    def test_cuda(self):
+        rng = np.random.default_rng(1)
+        self.check(rng.random((4, 64, 64)) > 0.01, device='cuda')
+
+
+if __name__ == '__main__':
+    unittest.main()
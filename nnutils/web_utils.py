@@ -1,11 +1,26 @@
 # --------------------------------------------------------
 # Written by Yufei Ye (https://github.com/JudyYe)
 # --------------------------------------------------------
-"""Usage: make_web.run(root, 2D_cell_list, wdith) """
+"""Usage: make_web.run(root, 2D_cell_list, wdith)
+
+For large sweeps, stream rows with thumbnails into paginated pages:
+    with WebReport(root, width) as report:
+        for row in rows:
+            report.add_row(row, key)
+"""
 from __future__ import print_function
 
+import html
+import json
 import os
+import os.path as osp
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List
+
+import imageio
+from PIL import Image
 
 from flask_table import Table, Col, create_table
 from flask import Markup
@@ -85,6 +100,262 @@ def html_add_col_text(src_file, vis_dir, width, pref):
     return Markup(col_text)
 
 
+IMAGE_EXT = ['png', 'jpg', 'jpeg']
+PREVIEW_EXT = ['gif', 'mp4']
+MESH_EXT = ['obj', 'ply', 'glb']
+THUMB_DIR = 'thumbs'
+
+
+def resize_to_width(image: Image.Image, width) -> Image.Image:
+    """ Downscale keeping the aspect ratio, never upscale """
+    if image.width <= width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.BILINEAR)
+
+
+def make_thumbnail(src_file, dst_file, width):
+    image = resize_to_width(Image.open(src_file), width)
+    if dst_file.endswith(('jpg', 'jpeg')):
+        image = image.convert('RGB')
+    image.save(dst_file)
+
+
+def make_gif_preview(src_file, dst_file, width, num_frames=8, stride=2, fps=5):
+    """ GIF of frames 0, stride, ... of a gif/mp4, downscaled to `width`.
+    Frames are quantized with FASTOCTREE and no dithering, ~10x faster than the default.
+    """
+    frames = []
+    reader = imageio.get_reader(src_file)
+    try:
+        for t, frame in enumerate(reader.iter_data()):
+            if len(frames) == num_frames:
+                break
+            if t % stride:
+                continue
+            image = resize_to_width(Image.fromarray(frame).convert('RGB'), width)
+            frames.append(image.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE))
+    finally:
+        reader.close()
+    frames[0].save(dst_file, save_all=True, append_images=frames[1:],
+                   duration=int(1000 / fps), loop=0)
+
+
+def make_preview(cell: dict, vis_dir, width, preview_frames=8) -> dict:
+    """ cell with a thumbnail of cell['src'] at `width`, under THUMB_DIR/w{width}/ """
+    src = cell['src']
+    thumb = osp.join(THUMB_DIR, 'w%d' % width, src)
+    os.makedirs(osp.dirname(osp.join(vis_dir, thumb)), exist_ok=True)
+    if src.split('.')[-1].lower() in PREVIEW_EXT:
+        thumb = osp.splitext(thumb)[0] + '.gif'
+        make_gif_preview(osp.join(vis_dir, src), osp.join(vis_dir, thumb), width, preview_frames)
+    else:
+        make_thumbnail(osp.join(vis_dir, src), osp.join(vis_dir, thumb), width)
+    return dict(cell, thumb=thumb)
+
+
+def process_cell(src_file, vis_dir, width, pref, preview_frames=8) -> dict:
+    """ Copy one cell's asset into vis_dir as html_add_col_text() and make its thumbnail.
+
+    Returns:
+        cell: json-able, {'text': } for plain strings,
+            else {'kind': image/video/mesh/file, 'src': full asset, 'thumb': preview}
+    """
+    if not isinstance(src_file, str) or not osp.exists(src_file):
+        return {'text': str(src_file)}
+    name = '%s_%s' % (pref, osp.basename(src_file))
+    ext = src_file.split('.')[-1].lower()
+    if ext in MESH_EXT:
+        dst_file = name[:-3] + 'glb'
+        mesh_utils.meshfile_to_glb(src_file, osp.join(vis_dir, dst_file))
+        return {'kind': 'mesh', 'src': dst_file}
+
+    shutil.copyfile(src_file, osp.join(vis_dir, name))
+    if ext in IMAGE_EXT + PREVIEW_EXT:
+        cell = {'kind': 'video' if ext == 'mp4' else 'image', 'src': name}
+        return make_preview(cell, vis_dir, width, preview_frames)
+    return {'kind': 'file', 'src': name}
+
+
+def process_row(row, vis_dir, width, pref, preview_frames=8) -> List[dict]:
+    return [process_cell(src, vis_dir, width, '%sc%02d' % (pref, c), preview_frames)
+            for c, src in enumerate(row)]
+
+
+def remake_previews(cells, vis_dir, width, preview_frames=8) -> List[dict]:
+    """ cells of process_row() with thumbnails at another width """
+    return [make_preview(cell, vis_dir, width, preview_frames) if 'thumb' in cell else cell
+            for cell in cells]
+
+
+def render_cell(cell: dict, width) -> str:
+    """ Thumbnails link to the full-size asset """
+    if 'text' in cell:
+        return cell['text']
+    if cell['kind'] in ['image', 'video']:
+        return '<a href="{0}"><img src="{1}" width="{2}" loading="lazy"> </a> <br/> {0} <br/>'.format(
+            cell['src'], cell['thumb'], width)
+    if cell['kind'] == 'mesh':
+        return ('<model-viewer src="{0}" style="width:{1}" loading="lazy" shadow-intensity="1" '
+                'camera-controls="" auto-rotate=""></model-viewer>').format(cell['src'], width)
+    return '<a href="{0}">{0}</a>'.format(cell['src'])
+
+
+class WebReport:
+    """ Streaming, paginated version of run().
+
+    Rows are appended to the current page as soon as their assets are ready,
+    in the order they were added. Pages are index.html, page_001.html, ...
+    of `rows_per_page` rows, showing thumbnails and GIF previews made in a
+    process pool. index.json keeps the finished rows, a re-run over the same
+    html_root skips rows whose key is already there. Thumbnails are kept per
+    width, a re-run at another width makes them again from the copied assets.
+    A row whose assets fail shows the error and is retried in place when
+    added again.
+    """
+    def __init__(self, html_root, width=200, rows_per_page=100, num_workers=8, preview_frames=8):
+        self.html_root = html_root
+        self.width = width
+        self.rows_per_page = rows_per_page
+        self.preview_frames = preview_frames
+        os.makedirs(osp.join(html_root, THUMB_DIR), exist_ok=True)
+        self.pool = ProcessPoolExecutor(num_workers)
+
+        self.index_file = osp.join(html_root, 'index.json')
+        self.rows = []  # [{'key': str, 'cells': [cell, ], 'error': bool}, ]
+        if osp.exists(self.index_file):
+            with open(self.index_file) as fp:
+                index = json.load(fp)
+            self.rows = index['rows']
+            if index['width'] != width:
+                cells = self.pool.map(
+                    partial(remake_previews, vis_dir=html_root, width=width, preview_frames=preview_frames),
+                    [row['cells'] for row in self.rows])
+                for row, row_cells in zip(self.rows, cells):
+                    row['cells'] = row_cells
+            if index['rows_per_page'] != rows_per_page or index['width'] != width:
+                for page in range(len(self.rows) // rows_per_page):
+                    self._write_page(page)
+        self.keys = set(row['key'] for row in self.rows if not row.get('error'))
+        self.failed = {row['key']: i for i, row in enumerate(self.rows) if row.get('error')}
+        self.num_added = len(self.rows)  # rows finished or pending, names their assets
+        self.pending = []  # [(key, future), ] in add order
+        self._fp = None
+        self._open_page()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def page_name(page):
+        return 'index.html' if page == 0 else 'page_%03d.html' % page
+
+    def add_row(self, row: list, key=None) -> bool:
+        """
+        :param row: list of filepath of vid/image/mesh, or str, as a row of run()
+        :param key: identifies the row across re-runs, default to the joined row
+        :return: False if the row is already in the report
+        """
+        key = '|'.join(str(c) for c in row) if key is None else str(key)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        if key in self.failed:  # retry, in place of the failed row
+            pref = 'r%05d' % self.failed[key]
+        else:
+            pref = 'r%05d' % self.num_added
+            self.num_added += 1
+        self.pending.append((key, self.pool.submit(
+            process_row, row, self.html_root, self.width, pref, self.preview_frames)))
+        self.flush(block=False)
+        return True
+
+    def flush(self, block=True):
+        """ Write the rows finished so far, keeping the add order """
+        while self.pending and (block or self.pending[0][1].done()):
+            key, future = self.pending.pop(0)
+            try:
+                row = {'key': key, 'cells': future.result()}
+            except Exception as e:
+                row = {'key': key, 'cells': [{'text': html.escape(key)}, {'text': html.escape('failed: %r' % e)}],
+                       'error': True}
+                self.keys.discard(key)
+            if key in self.failed:
+                i = self.failed.pop(key)
+                if row.get('error'):
+                    self.failed[key] = i
+                self.rows[i] = row
+                self._rewrite_page(i // self.rows_per_page)
+                continue
+            if row.get('error'):
+                self.failed[key] = len(self.rows)
+            self.rows.append(row)
+            self._fp.write(self._render_row(self.rows[-1]))
+            if len(self.rows) % self.rows_per_page == 0:
+                self._close_page(has_next=True)
+                self.save_index()
+                self._open_page()
+        self._fp.flush()
+
+    def close(self):
+        if self._fp is None:
+            return
+        self.flush(block=True)
+        self.pool.shutdown()
+        self._close_page(has_next=False)
+        self.save_index()
+        print('write to %s' % osp.join(self.html_root, 'index.html'))
+
+    def save_index(self):
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as fp:
+            json.dump({'width': self.width, 'rows_per_page': self.rows_per_page, 'rows': self.rows}, fp)
+        os.replace(tmp_file, self.index_file)
+
+    def _render_row(self, row) -> str:
+        return '<tr>%s</tr>\n' % ''.join('<td>%s</td>' % render_cell(cell, self.width) for cell in row['cells'])
+
+    def _header(self, page) -> str:
+        nav = '' if page == 0 else '<a href="%s">prev</a> ' % self.page_name(page - 1)
+        return ('<script type="module" src="https://unpkg.com/@google/model-viewer/dist/model-viewer.min.js"></script>\n'
+                '<p>%spage %d</p>\n<table>\n' % (nav, page))
+
+    def _footer(self, page, has_next) -> str:
+        nav = '<p><a href="%s">next</a></p>\n' % self.page_name(page + 1) if has_next else ''
+        return '</table>\n' + nav
+
+    def _write_page(self, page):
+        rows = self.rows[page * self.rows_per_page: (page + 1) * self.rows_per_page]
+        with open(osp.join(self.html_root, self.page_name(page)), 'w') as fp:
+            fp.write(self._header(page))
+            fp.writelines(self._render_row(row) for row in rows)
+            fp.write(self._footer(page, has_next=len(rows) == self.rows_per_page))
+
+    def _rewrite_page(self, page):
+        if page == len(self.rows) // self.rows_per_page:  # the open one
+            self._fp.close()
+            self._open_page()
+        else:
+            self._write_page(page)
+
+    def _open_page(self):
+        """ (Re)write the current page with its finished rows, then append to it """
+        page = len(self.rows) // self.rows_per_page
+        self._fp = open(osp.join(self.html_root, self.page_name(page)), 'w')
+        self._fp.write(self._header(page))
+        self._fp.writelines(self._render_row(row) for row in self.rows[page * self.rows_per_page:])
+
+    def _close_page(self, has_next):
+        page = (len(self.rows) - 1) // self.rows_per_page if has_next else len(self.rows) // self.rows_per_page
+        self._fp.write(self._footer(page, has_next))
+        self._fp.close()
+        self._fp = None
+
 if __name__ == '__main__':
     args = parse_args()
     data_dir = '../output/'
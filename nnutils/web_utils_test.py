@@ -0,0 +1,132 @@
+import glob
+import json
+import os.path as osp
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+from nnutils.web_utils import WebReport, make_gif_preview
+
+
+def write_assets(tmp, num):
+    """ num (image, gif) pairs of 160 x 120 """
+    rng = np.random.default_rng(0)
+    assets = []
+    for i in range(num):
+        frames = [Image.fromarray(rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)) for _ in range(6)]
+        image_file, gif_file = osp.join(tmp, 'img_%d.png' % i), osp.join(tmp, 'clip_%d.gif' % i)
+        frames[0].save(image_file)
+        frames[0].save(gif_file, save_all=True, append_images=frames[1:], duration=100, loop=0)
+        assets.append((image_file, gif_file))
+    return assets
+
+
+def read(path):
+    with open(path) as fp:
+        return fp.read()
+
+
+def count_rows(html_root):
+    return sum(read(f).count('<tr>') for f in glob.glob(osp.join(html_root, '*.html')))
+
+
+class WebReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.assets = write_assets(self.tmp.name, 3)
+        self.html_root = osp.join(self.tmp.name, 'vis')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def rows(self, start, end):
+        return [['step %d' % i, *self.assets[i % len(self.assets)]] for i in range(start, end)]
+
+    def test_pages_and_thumbnails(self):
+        with WebReport(self.html_root, width=64, rows_per_page=10, num_workers=4) as report:
+            for row in self.rows(0, 25):
+                self.assertTrue(report.add_row(row))
+        self.assertEqual(len(report), 25)
+        self.assertEqual(sorted(osp.basename(f) for f in glob.glob(osp.join(self.html_root, '*.html'))),
+                         ['index.html', 'page_001.html', 'page_002.html'])
+        first = read(osp.join(self.html_root, 'index.html'))
+        self.assertEqual(first.count('<tr>'), 10)
+        self.assertIn('step 0<', first)
+        self.assertIn('href="page_001.html">next', first)
+        last = read(osp.join(self.html_root, 'page_002.html'))
+        self.assertIn('href="page_001.html">prev', last)
+        self.assertNotIn('next', last)
+        self.assertIn('step 24<', last)
+
+        cells = report.rows[3]['cells']
+        self.assertEqual(cells[0], {'text': 'step 3'})
+        self.assertEqual(Image.open(osp.join(self.html_root, cells[1]['thumb'])).size, (64, 48))
+        self.assertEqual(Image.open(osp.join(self.html_root, cells[1]['src'])).size, (160, 120))
+        self.assertTrue(cells[2]['thumb'].endswith('.gif'))
+
+    def test_rerun_adds_new_rows(self):
+        with WebReport(self.html_root, rows_per_page=10) as report:
+            for row in self.rows(0, 12):
+                report.add_row(row)
+        with WebReport(self.html_root, rows_per_page=10) as report:
+            added = [report.add_row(row) for row in self.rows(0, 17)]
+        self.assertEqual(added, [False] * 12 + [True] * 5)
+        self.assertEqual(count_rows(self.html_root), 17)
+        with open(osp.join(self.html_root, 'index.json')) as fp:
+            index = json.load(fp)
+        self.assertEqual([row['cells'][0]['text'] for row in index['rows']],
+                         ['step %d' % i for i in range(17)])
+        # another page size re-renders the pages
+        with WebReport(self.html_root, rows_per_page=5):
+            pass
+        self.assertEqual(read(osp.join(self.html_root, 'page_003.html')).count('<tr>'), 2)
+        self.assertEqual(count_rows(self.html_root), 17)
+
+    def test_width_change_remakes_thumbnails(self):
+        with WebReport(self.html_root, width=64, rows_per_page=10) as report:
+            for row in self.rows(0, 12):
+                report.add_row(row)
+        with WebReport(self.html_root, width=32, rows_per_page=10) as report:
+            pass
+        for page in ['index.html', 'page_001.html']:
+            self.assertNotIn('w64', read(osp.join(self.html_root, page)))
+        cells = report.rows[11]['cells']
+        self.assertEqual(Image.open(osp.join(self.html_root, cells[1]['thumb'])).size, (32, 24))
+        self.assertEqual(Image.open(osp.join(self.html_root, cells[2]['thumb'])).size, (32, 24))
+        self.assertIn('src="%s"' % cells[1]['thumb'], read(osp.join(self.html_root, 'page_001.html')))
+
+    def test_failed_row_is_retried(self):
+        broken = osp.join(self.tmp.name, 'broken.png')
+        with open(broken, 'w') as fp:
+            fp.write('not an image')
+        rows = self.rows(0, 3)
+        rows[1] = ['step 1', broken]
+        with WebReport(self.html_root, rows_per_page=10) as report:
+            self.assertEqual([report.add_row(row) for row in rows], [True] * 3)
+        self.assertEqual(len(report), 3)
+        self.assertTrue(report.rows[1]['error'])
+        self.assertIn('failed: ', read(osp.join(self.html_root, 'index.html')))
+
+        shutil.copyfile(self.assets[0][0], broken)
+        with WebReport(self.html_root, rows_per_page=10) as report:
+            self.assertEqual([report.add_row(row) for row in rows], [False, True, False])
+        self.assertEqual(len(report), 3)
+        self.assertNotIn('error', report.rows[1])
+        first = read(osp.join(self.html_root, 'index.html'))
+        self.assertNotIn('failed: ', first)
+        self.assertEqual(first.count('<tr>'), 3)
+        self.assertTrue(report.rows[1]['cells'][1]['src'].startswith('r00001'))
+
+    def test_gif_preview(self):
+        dst_file = osp.join(self.tmp.name, 'preview.gif')
+        make_gif_preview(self.assets[0][1], dst_file, width=40, num_frames=2, stride=2)
+        gif = Image.open(dst_file)
+        self.assertEqual(gif.size, (40, 30))
+        self.assertEqual(gif.n_frames, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@ from typing import NamedTuple
 from libzhifan.geometry import SimpleMesh
 from libzhifan import io
 
+from obj_pose.quadric_decimation import LOD_LEVELS, load_lod_pyramid
+
 
 class MeshHolder(NamedTuple):
     vertices: torch.Tensor
@@ -54,35 +56,72 @@ class OBJLoader:
 
     def __init__(self,
                  obj_models_root='./weights/obj_models',
-                 suffix='V2'):
+                 suffix='V2',
+                 lod_levels=LOD_LEVELS,
+                 lod_cache_dir=None):
+        """
+        Args:
+            lod_levels: number of vertices of each level of detail, finest first,
+                see load_obj_by_name(lod=...)
+            lod_cache_dir: where the decimated levels are cached,
+                defaults to <obj_models_root>/lod_cache
+        """
         self.obj_models_root = to_absolute_path(obj_models_root)
         self.obj_parts_root = to_absolute_path('./weights')
         self.obj_models_cache = dict()
         self.suffix = self.SUFFIX[suffix]
-
-    def load_obj_by_name(self, name, return_mesh=False):
+        self.lod_levels = tuple(lod_levels)
+        if lod_cache_dir is None:
+            lod_cache_dir = os.path.join(self.obj_models_root, 'lod_cache')
+        self.lod_cache_dir = lod_cache_dir
+
+    def _normalize(self, name, verts, ref_verts=None):
+        """ Center and scale `verts` to OBJ_SCALES[name],
+        using the center and radius of `ref_verts` if given. """
+        verts = np.float32(verts)
+        ref_verts = verts if ref_verts is None else np.float32(ref_verts)
+        center = ref_verts.mean(0)
+        radius = np.linalg.norm(ref_verts - center, 2, 1).max()
+        return (verts - center) / radius * self.OBJ_SCALES[name] / 2
+
+    def _load_default(self, name) -> trimesh.Trimesh:
+        suffix = self.suffix[name]
+        obj_path = os.path.join(self.obj_models_root, f"{name}_{suffix}.obj")
+        return trimesh.load(obj_path, force='mesh')
+
+    def load_obj_by_name(self, name, return_mesh=False, lod=None):
         """
         Args:
             return_mesh:
                 if True, return a SimpleMesh object
+            lod: int, level of detail, index into self.lod_levels (0 the finest),
+                decimated from the original <name>.obj and cached on disk.
+                None for the default <name>_<suffix>.obj.
+                All levels are normalized with the default mesh's center and radius,
+                so poses carry over between levels.
 
         Returns:
             a Mesh Object that has attributes:
                 `vertices` and `faces`
         """
-        if name not in self.obj_models_cache:
-            suffix = self.suffix[name]
-            obj_name = f"{name}_{suffix}.obj"
-            obj_path = os.path.join(self.obj_models_root, obj_name)
-            obj_scale = self.OBJ_SCALES[name]
-            obj = trimesh.load(obj_path, force='mesh')
-            verts = np.float32(obj.vertices)
-            verts = verts - verts.mean(0)
-            verts = verts / np.linalg.norm(verts, 2, 1).max() * obj_scale / 2
-            obj_mesh = MeshHolder(vertices=verts, faces=obj.faces)
-            self.obj_models_cache[name] = obj_mesh
-
-        obj_mesh = self.obj_models_cache[name]
+        key = name if lod is None else (name, lod)
+        if key not in self.obj_models_cache:
+            default = self._load_default(name)
+            if lod is None:
+                verts = self._normalize(name, default.vertices)
+                faces = default.faces
+            else:
+                src_path = os.path.join(self.obj_models_root, f"{name}.obj")
+                if not os.path.exists(src_path):
+                    src_path = os.path.join(
+                        self.obj_models_root, f"{name}_{self.suffix[name]}.obj")
+                pyramid = load_lod_pyramid(src_path, self.lod_cache_dir, self.lod_levels)
+                verts, faces = pyramid[lod]
+                verts = self._normalize(name, verts, ref_verts=default.vertices)
+            obj_mesh = MeshHolder(vertices=verts, faces=faces)
+            self.obj_models_cache[key] = obj_mesh
+
+        obj_mesh = self.obj_models_cache[key]
 
         if return_mesh:
             obj_mesh = SimpleMesh(obj_mesh.vertices, obj_mesh.faces)
@@ -6,16 +6,13 @@ import numpy as np
 import torch
 import torch.nn as nn
 import trimesh
-from pytorch3d.transforms import Transform3d
+from pytorch3d.transforms import Transform3d, matrix_to_rotation_6d
 
 from nnutils import image_utils, geom_utils
 from nnutils.handmocap import (
     get_hand_wrapper, compute_hand_transform)
 from obj_pose.pose_renderer import PoseRenderer
-from homan.utils.geometry import (
-    compute_random_rotations,
-    matrix_to_rot6d,
-)
+from homan.utils.geometry import compute_random_rotations
 from temporal.utils import init_6d_pose_from_bboxes
 
 from libzhifan.geometry import (
@@ -36,6 +33,7 @@ Origin: homan/pose_optimization.py
 class PoseOptimizer:
 
     NUM_CLUSTERS = 10
+    CLUSTER_TOP_M = None  # e.g. 200: cluster only the best inits by IoU, see PoseRenderer.clustered_results()
 
     """
     This class 1) parses mocap_prediction, and 2) performs obj pose fitting.
@@ -187,7 +185,7 @@ class PoseOptimizer:
         if with_obj:
             if clustered:
                 verts = self.pose_model.clustered_results(
-                    self.NUM_CLUSTERS).verts
+                    self.NUM_CLUSTERS, top_m=self.CLUSTER_TOP_M).verts
             else:
                 verts = self.pose_model.fitted_results.verts
             verts = verts[cam_idx, pose_idx]
@@ -257,7 +255,7 @@ class PoseOptimizer:
         hand_mesh = self.hand_simplemesh(cam_idx=cam_idx)
         if clustered:
             verts = self.pose_model.clustered_results(
-                self.NUM_CLUSTERS).verts
+                self.NUM_CLUSTERS, top_m=self.CLUSTER_TOP_M).verts
         else:
             verts = self.pose_model.fitted_results.verts
         verts = verts[cam_idx, pose_idx]
@@ -292,12 +290,12 @@ class PoseOptimizer:
             obj_bbox, self.ihoi_box_expand).int()
 
         bsize = len(image)
-        obj_mask_patch = image_utils.batch_crop_resize(
-            object_mask, obj_bbox_squared, self.rend_size)
+        obj_mask_patch = image_utils.batch_crop_resize_grid(
+            object_mask, obj_bbox_squared, self.rend_size, mode='nearest')
 
         # Extra care for image_patch with (H, W, 3) shape
-        image_patch = image_utils.batch_crop_resize(
-            image, obj_bbox_squared, self.rend_size)
+        image_patch = image_utils.batch_crop_resize_grid(
+            image, obj_bbox_squared, self.rend_size, mode='bilinear')
 
         """ Get camera """
         global_cam = self.global_cam
@@ -328,6 +326,9 @@ class PoseOptimizer:
                      lr=1e-2,
 
                      put_hand_transform=False,
+                     chunk_size=None,
+                     coarse_lod=None,
+                     coarse_iterations=0,
                      ):
         """
         Args: See EpicInference dataset output.
@@ -338,6 +339,9 @@ class PoseOptimizer:
             hand_bbox:processed: (B, 4)
                 Note this differs from `hand_bbox` directly from dataset
 
+            coarse_lod: int, level of detail (see OBJLoader) to optimize
+                the first `coarse_iterations` iterations with, None to disable.
+
         Returns:
             PoseRenderer
         """
@@ -347,6 +351,11 @@ class PoseOptimizer:
         obj_mesh = self.obj_loader.load_obj_by_name(cat, return_mesh=False)
         vertices = torch.as_tensor(obj_mesh.vertices, device='cuda')
         faces = torch.as_tensor(obj_mesh.faces, device='cuda')
+        coarse_mesh = None
+        if coarse_lod is not None and coarse_iterations > 0:
+            coarse = self.obj_loader.load_obj_by_name(cat, lod=coarse_lod)
+            coarse_mesh = (torch.as_tensor(coarse.vertices, device='cuda'),
+                           torch.as_tensor(coarse.faces, device='cuda'))
 
         if rotations_init is not None and translations_init is not None:
             assert len(rotations_init) == len(translations_init)
@@ -374,12 +383,69 @@ class PoseOptimizer:
             debug=debug,
             sort_best=sort_best,
             lr=lr,
+            chunk_size=chunk_size,
+            coarse_mesh=coarse_mesh,
+            coarse_iterations=coarse_iterations,
         )
 
         self._fit_model = model
         return self._fit_model
 
 
+class BestPoses:
+    """ Per-init best-ever loss and pose, kept on device.
+
+    update() is a masked copy with torch.where, it never reads values back to host,
+    so tracking doesn't stall the optimization loop.
+    """
+    def __init__(self, rotations, translations):
+        """
+        Args:
+            rotations: (N, ...) initial rotations
+            translations: (N, ...) initial translations
+        """
+        self.losses = torch.full(
+            [len(rotations)], np.inf, dtype=rotations.dtype, device=rotations.device)
+        self.rotations = rotations.detach().clone()
+        self.translations = translations.detach().clone()
+        self.extras = None
+
+    @staticmethod
+    def _where(better, new, old):
+        return torch.where(better.view(-1, *[1] * (old.dim() - 1)), new.detach(), old)
+
+    def update(self, losses, rotations, translations, extras: dict = None):
+        """
+        Args:
+            losses: (N,)
+            rotations, translations: poses to keep for inits whose loss improved
+            extras: dict of (N, ...), e.g. iou, kept along with the poses
+        """
+        better = losses.detach() < self.losses
+        self.losses = torch.where(better, losses.detach(), self.losses)
+        self.rotations = self._where(better, rotations, self.rotations)
+        self.translations = self._where(better, translations, self.translations)
+        if extras is not None:
+            if self.extras is None:
+                self.extras = {k: v.detach().clone() for k, v in extras.items()}
+            self.extras = {
+                k: self._where(better, extras[k], v) for k, v in self.extras.items()}
+
+    def result(self, sort=True):
+        """
+        Returns:
+            losses: (N,), rotations, translations, extras (dict or None)
+                sorted by ascending loss if `sort`, otherwise in init order.
+        """
+        if not sort:
+            return self.losses, self.rotations, self.translations, self.extras
+        inds = torch.argsort(self.losses)
+        extras = None
+        if self.extras is not None:
+            extras = {k: v[inds] for k, v in self.extras.items()}
+        return self.losses[inds], self.rotations[inds], self.translations[inds], extras
+
+
 def find_optimal_pose(
     vertices,
     faces,
@@ -397,7 +463,10 @@ def find_optimal_pose(
     rotations_init=None,
     translations_init=None,
     base_rotation=None,
-    base_translation=None):
+    base_translation=None,
+    chunk_size=None,
+    coarse_mesh=None,
+    coarse_iterations=0):
     """
     Args:
         vertices: torch.Tensor (V, 3)
@@ -412,6 +481,12 @@ def find_optimal_pose(
             captures the original image.
         base_rotation: torch.Tensor (B, 3, 3)
         base_translation: torch.Tensor (B, 1, 3)
+        chunk_size: int, inits rendered per forward/backward, None for all at once.
+            Use e.g. model.chunk_size_for_memory() for large num_initializations.
+        coarse_mesh: (vertices, faces) of a decimated mesh, e.g. OBJLoader lod,
+            rendered for the first `coarse_iterations` iterations instead of
+            (vertices, faces). Best poses are only tracked on the full mesh,
+            so coarse_iterations must be less than num_iterations.
 
     Returns:
         A PoseRenderer Object,
@@ -425,15 +500,15 @@ def find_optimal_pose(
             - translations
             - K
     """
+    use_coarse = coarse_mesh is not None and coarse_iterations > 0
+    if use_coarse and coarse_iterations >= num_iterations:
+        raise ValueError(
+            f"coarse_iterations ({coarse_iterations}) must be less than "
+            f"num_iterations ({num_iterations}), the full mesh is never optimized")
     bsize = bbox.size(0)
     os.makedirs(viz_folder, exist_ok=True)
     device = vertices.device
 
-    # Stuff to keep around
-    best_losses = torch.tensor(np.inf)
-    best_loss_single = torch.tensor(np.inf)
-    best_rots_single = None
-    best_trans_single = None
     loop = tqdm(total=num_iterations)
     K_global = K_global.to(device)
     K_ihoi_nr = K_ihoi_nr.to(device)
@@ -469,20 +544,25 @@ def find_optimal_pose(
 
     model = PoseRenderer(
         ref_image=mask,
-        vertices=vertices,
-        faces=faces,
-        rotation_init=matrix_to_rot6d(rotations_init),
+        vertices=coarse_mesh[0] if use_coarse else vertices,
+        faces=coarse_mesh[1] if use_coarse else faces,
+        rotation_init=matrix_to_rotation_6d(rotations_init),
         translation_init=translations_init,
         num_initializations=num_initializations,
         camera_K=K_ihoi_nr,
         base_rotation=base_rotation,
-        base_translation=base_translation
+        base_translation=base_translation,
+        chunk_size=chunk_size,
     )
     # model.to(device)
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    best = BestPoses(model.rotations, model.translations)
     for step in range(num_iterations):
+        if use_coarse and step == coarse_iterations:
+            model.set_mesh(vertices, faces)
+            best = BestPoses(model.rotations, model.translations)
         optimizer.zero_grad()
-        loss_dict, _, sil = model()
+        losses, loss_dict, iou, sil = model.forward_backward()
         if debug and (step % viz_step == 0):
             mask_viz = mask[0]  # select 0-th mask for visualization
             debug_viz_folder = os.path.join(viz_folder, "poseoptim")
@@ -491,36 +571,21 @@ def find_optimal_pose(
                 sil[0], overlays=[mask_viz,]*len(sil[0]), viz_nb=4,
                 path=os.path.join(debug_viz_folder, f"{step:04d}.png"))
 
-        losses = sum(loss_dict.values())
-        loss = losses.sum()
-        loss.backward()
+        # Before the step, so the loss and IoU are kept with the pose they were computed on;
+        # update() copies with torch.where, step() can't change the stored poses.
+        if not use_coarse or step >= coarse_iterations:
+            best.update(losses, model.rotations, model.translations,
+                        extras=dict(loss_dict, iou=iou))
         optimizer.step()
-        if losses.min() < best_loss_single:
-            ind = torch.argmin(losses)
-            best_loss_single = losses[ind]
-            best_rots_single = model.rotations[ind].detach().clone()
-            best_trans_single = model.translations[ind].detach().clone()
-        loop.set_description(f"obj loss: {best_loss_single.item():.3g}")
         loop.update()
     loop.close()
 
-    best_rots = model.rotations
-    best_trans = model.translations
-    best_losses = losses
-    if sort_best:
-        inds = torch.argsort(best_losses)
-        best_losses = best_losses[inds][:num_initializations].detach().clone()
-        best_trans = best_trans[inds][:num_initializations].detach().clone()
-        best_rots = best_rots[inds][:num_initializations].detach().clone()
-    # Add best ever:
-
-    if sort_best:
-        best_rots = torch.cat((best_rots_single.unsqueeze(0), best_rots[:-1]),
-                              0)
-        best_trans = torch.cat(
-            (best_trans_single.unsqueeze(0), best_trans[:-1]), 0)
+    best_losses, best_rots, best_trans, extras = best.result(sort=sort_best)
+    loop.write(f"obj loss: {best_losses.min().item():.3g}")
     model.rotations = nn.Parameter(best_rots)
     model.translations = nn.Parameter(best_trans)
+    iou = extras.pop('iou')
+    model.set_last_results(extras, iou)
     return model
 
 
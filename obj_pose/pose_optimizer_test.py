@@ -1,9 +1,10 @@
+import unittest
 import numpy as np 
 from PIL import Image
 import torch
 import trimesh
 
-from obj_pose.pose_optimizer import find_optimal_pose
+from obj_pose.pose_optimizer import find_optimal_pose, BestPoses
 import neural_renderer as nr
 
 
@@ -83,5 +84,69 @@ def nr_test():
     )
 
 
+class BestPosesTest(unittest.TestCase):
+
+    def run_steps(self, num_steps=30, num_inits=50):
+        """ Random-walk poses and losses, as an optimization loop would produce """
+        torch.manual_seed(0)
+        rots = torch.randn(num_inits, 6)
+        trans = torch.randn(num_inits, 1, 3)
+        for _ in range(num_steps):
+            losses = torch.rand(num_inits) + 0.1 * torch.randn(num_inits)
+            rots = rots + 0.1 * torch.randn_like(rots)
+            trans = trans + 0.1 * torch.randn_like(trans)
+            yield losses, rots, trans
+
+    def test_top1_matches_single_tracking(self):
+        """ Same selection as the single best-pose tracking of the old loop, given the same
+        (loss, pose) pairs. The old loop paired each loss with the pose after the Adam step,
+        find_optimal_pose() now passes the pose the loss was computed on. """
+        best_loss_single = torch.tensor(np.inf)
+        for losses, rots, trans in self.run_steps():
+            if losses.min() < best_loss_single:
+                ind = torch.argmin(losses)
+                best_loss_single = losses[ind]
+                best_rots_single = rots[ind].clone()
+                best_trans_single = trans[ind].clone()
+
+        best = None
+        for losses, rots, trans in self.run_steps():
+            if best is None:
+                best = BestPoses(rots, trans)
+            best.update(losses, rots, trans)
+        b_losses, b_rots, b_trans, _ = best.result(sort=True)
+        self.assertEqual(b_losses[0], best_loss_single)
+        self.assertTrue(torch.equal(b_rots[0], best_rots_single))
+        self.assertTrue(torch.equal(b_trans[0], best_trans_single))
+        self.assertTrue(torch.all(b_losses[1:] >= b_losses[:-1]))
+
+    def test_per_init_best(self):
+        steps = list(self.run_steps())
+        all_losses = torch.stack([v[0] for v in steps])  # (S, N)
+        all_rots = torch.stack([v[1] for v in steps])
+        best = BestPoses(steps[0][1], steps[0][2])
+        for step, (losses, rots, trans) in enumerate(steps):
+            best.update(losses, rots, trans,
+                        extras=dict(iou=1 - losses, step=torch.full_like(losses, step)))
+        b_losses, b_rots, _, extras = best.result(sort=False)
+        min_losses, argmin = all_losses.min(0)
+        self.assertTrue(torch.equal(b_losses, min_losses))
+        self.assertTrue(torch.equal(b_rots, all_rots[argmin, torch.arange(len(argmin))]))
+        self.assertTrue(torch.equal(extras['iou'], 1 - min_losses))
+        self.assertTrue(torch.equal(extras['step'], argmin.float()))
+
+
+class CoarseScheduleTest(unittest.TestCase):
+
+    def test_coarse_iterations_checked(self):
+        box = trimesh.creation.box()
+        vertices, faces = torch.FloatTensor(box.vertices), torch.IntTensor(box.faces)
+        with self.assertRaises(ValueError):
+            find_optimal_pose(vertices, faces, mask=None, bbox=torch.zeros(1, 4),
+                              K_global=None, K_ihoi_nr=None, num_iterations=10,
+                              coarse_mesh=(vertices, faces), coarse_iterations=10)
+
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
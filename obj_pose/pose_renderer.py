@@ -3,12 +3,12 @@ import numpy as np
 import torch
 import torch.nn as nn
 import neural_renderer as nr
-from scipy.ndimage.morphology import distance_transform_edt
 from functools import cached_property
 
 from obj_pose.utils import compute_pairwise_dist
 from obj_pose.cluster_distance_matrix import cluster_distance_matrix
-from homan.utils.geometry import rot6d_to_matrix
+from pytorch3d.transforms import rotation_6d_to_matrix
+from nnutils.image_utils import distance_transform_edt
 
 from libyana.metrics import iou as ioumetrics
 from libzhifan.numeric import check_shape
@@ -45,6 +45,8 @@ class PoseRenderer(nn.Module):
                  camera_K=None,
                  power=0.25,
                  lw_chamfer=0,
+                 chunk_size=None,
+                 num_dist_verts=256,
                  device='cuda'):
         """
         For B `images`, `base transformations`, `camera_K`
@@ -61,6 +63,11 @@ class PoseRenderer(nn.Module):
             base_translation:  (B, 1, 3)
             camera_K: (B, 3, 3)
                 local camera of the object
+            chunk_size: number of inits rendered at once in forward_backward()
+                and fitted_results, None for all N_init.
+                Peak memory grows with B * chunk_size, see chunk_size_for_memory().
+            num_dist_verts: size of the vertex subset pose distances are computed on
+                in clustered_results(top_m=...)
 
         """
         assert ref_image.shape[-1] == ref_image.shape[-2], "Must be square."
@@ -72,8 +79,10 @@ class PoseRenderer(nn.Module):
 
         vertices = torch.as_tensor(vertices, device=device)
         faces = torch.as_tensor(faces, device=device)
+        self.num_dist_verts = num_dist_verts
         self.register_buffer("vertices", vertices)
         self.register_buffer("faces", faces)
+        self.register_buffer("dist_vertices", self._dist_vertices(vertices))
         if base_rotation is None:
             base_rotation = torch.eye(
                 3, dtype=dtype, device=device).unsqueeze_(0)
@@ -103,9 +112,9 @@ class PoseRenderer(nn.Module):
                 num_initializations, 1, 1)
         self.translations = nn.Parameter(translation_init.clone().float(),
                                          requires_grad=True)
-        mask_edge = self.compute_edges(image_ref).cpu().numpy()
-        edt = distance_transform_edt(1 - (mask_edge > 0))**(power * 2)
-        self.register_buffer("edt_ref_edge", torch.from_numpy(edt))
+        mask_edge = self.compute_edges(image_ref)
+        edt = distance_transform_edt(mask_edge <= 0)**(power * 2)
+        self.register_buffer("edt_ref_edge", edt)
         # Setup renderer.
         if camera_K is None:
             camera_K = torch.FloatTensor([
@@ -121,6 +130,9 @@ class PoseRenderer(nn.Module):
             anti_aliasing=False,
         )
         self.lw_chamfer = lw_chamfer
+        self.chunk_size = chunk_size
+        self.last_loss_dict = None
+        self.last_iou = None
 
         self.to(device)
         self._check_shape(self.bsize, num_init=num_initializations)
@@ -139,10 +151,27 @@ class PoseRenderer(nn.Module):
     @property
     def rotations_matrix(self) -> torch.Tensor:
         """ (N, 3, 3) where N = num_initializations """
-        rot_mats = rot6d_to_matrix(self.rotations)
+        rot_mats = rotation_6d_to_matrix(self.rotations)
         return rot_mats
 
-    def apply_transformation(self):
+    @property
+    def num_inits(self) -> int:
+        return len(self.rotations)
+
+    def chunks(self, chunk_size=None) -> list:
+        """ slices over N_init of at most chunk_size (default self.chunk_size) """
+        n = self.num_inits
+        chunk_size = chunk_size or self.chunk_size or n
+        return [slice(st, min(st + chunk_size, n)) for st in range(0, n, chunk_size)]
+
+    def chunk_size_for_memory(self, budget_bytes: int, bytes_per_pixel: int = 48) -> int:
+        """ Rough number of inits per chunk so that one forward/backward stays within budget.
+        Rendering and the silhouette losses keep about a dozen float32 (B, W, W) maps
+        per init alive for backward, hence the default bytes_per_pixel. """
+        per_init = self.bsize * self.image_size**2 * bytes_per_pixel
+        return max(1, int(budget_bytes // per_init))
+
+    def apply_transformation(self, inds=None):
         """
         Applies current rotation and translation to vertices.
 
@@ -150,12 +179,19 @@ class PoseRenderer(nn.Module):
         which first apply transformation in hand-space,
         then transform hand-space to camera-space.
 
+        Args:
+            inds: slice into N_init, None for all
+
         Out shape: (B, N_init, V, 3)
         """
-        rots = self.rotations_matrix.unsqueeze(0) @ self.base_rotation.unsqueeze(1)
+        if inds is None:
+            rotations, translations = self.rotations, self.translations
+        else:
+            rotations, translations = self.rotations[inds], self.translations[inds]
+        rots = rotation_6d_to_matrix(rotations).unsqueeze(0) @ self.base_rotation.unsqueeze(1)
         transl = torch.add(
                 torch.matmul(
-                    self.translations.unsqueeze(0),  # (N, 1, 3) -> (1, N, 1, 3)
+                    translations.unsqueeze(0),  # (N, 1, 3) -> (1, N, 1, 3)
                     self.base_rotation.unsqueeze(1),  # (B, 3, 3) -> (B, 1, 3, 3)
                 ),  # (B, N, 1, 3)
                 self.base_translation.unsqueeze(1),  # (B, 1, 3) -> (B, 1, 1, 3)
@@ -175,10 +211,10 @@ class PoseRenderer(nn.Module):
         """
         # On-screen means coord_xy between [-1, 1] and far > depth > 0
         b, n = verts.size(0), verts.size(1)
-        batch_K = self.renderer.K.unsqueeze(1).repeat(1, n, 1, 1)  # (B, N, 3, 3)
+        batch_K = self.renderer.K.unsqueeze(1).expand(b, n, 3, 3)  # (B, N, 3, 3)
         proj = nr.projection(
-            verts.view(b*n, -1, 3),
-            batch_K.view(b*n, 3, 3),
+            verts.reshape(b*n, -1, 3),
+            batch_K.reshape(b*n, 3, 3),
             self.renderer.R,
             self.renderer.t,
             self.renderer.dist_coeffs,
@@ -198,13 +234,18 @@ class PoseRenderer(nn.Module):
     def compute_edges(self, silhouette: torch.Tensor) -> torch.Tensor:
         return self.pool(silhouette) - silhouette
 
-    def forward(self):
+    def forward(self, inds=None):
         """
         For losses, sum over dim=(2, 3) which are (H, W), 
         and take mean over dim=0 which is batch dimension.
+
+        Args:
+            inds: slice into N_init, None for all.
+                Every loss of init i depends only on init i,
+                so losses of chunks can be backpropagated separately.
         """
-        verts = self.apply_transformation()
-        image = self.keep_mask[:, None] * self.render()  # (B, N, W, W)
+        verts = self.apply_transformation(inds)
+        image = self.keep_mask[:, None] * self.render(verts)  # (B, N, W, W)
         image_ref = self.image_ref[:, None]
         b, n, w = image.size(0), image.size(1), self.image_size
         loss_dict = {}
@@ -212,7 +253,7 @@ class PoseRenderer(nn.Module):
         with torch.no_grad():
             iou = ioumetrics.batch_mask_iou(
                 image.view(b*n, w, w).detach(),
-                image_ref.repeat(1, n, 1, 1).view(b*n, w, w).detach())  # (B*N,)
+                image_ref.expand(b, n, w, w).reshape(b*n, w, w))  # (B*N,)
             iou = iou.view(b, n).mean(0)  # (N,)
         loss_dict["chamfer"] = self.lw_chamfer * torch.sum(
             self.compute_edges(image) * self.edt_ref_edge[:, None], 
@@ -220,13 +261,72 @@ class PoseRenderer(nn.Module):
         loss_dict["offscreen"] = 100000 * self.compute_offscreen_loss(verts)
         return loss_dict, iou, image
 
+    def forward_backward(self):
+        """ forward() and backward of the summed loss, chunk by chunk over inits,
+        so that only one chunk of silhouettes is alive at a time.
+        Gradients accumulate into self.rotations / self.translations
+        as a single backward of forward() would.
+
+        Returns:
+            losses: (N,) detached, sum of the loss terms
+            loss_dict: of (N,) detached
+            iou: (N,)
+            image: (B, n, W, W) detached silhouettes of the first chunk, for visualization
+        """
+        losses, loss_dicts, ious = [], [], []
+        first_image = None
+        for inds in self.chunks():
+            loss_dict, iou, image = self.forward(inds)
+            chunk_losses = sum(loss_dict.values())
+            chunk_losses.sum().backward()
+            losses.append(chunk_losses.detach())
+            loss_dicts.append({k: v.detach() for k, v in loss_dict.items()})
+            ious.append(iou)
+            if first_image is None:
+                first_image = image.detach()
+        loss_dict = {
+            k: torch.cat([d[k] for d in loss_dicts]) for k in loss_dicts[0]}
+        iou = torch.cat(ious)
+        self.set_last_results(loss_dict, iou)
+        return torch.cat(losses), loss_dict, iou, first_image
+
+    def _dist_vertices(self, vertices):
+        dist_inds = torch.linspace(
+            0, len(vertices) - 1, min(len(vertices), self.num_dist_verts), device=vertices.device)
+        return vertices[dist_inds.round().long()]
+
+    def set_mesh(self, vertices, faces):
+        """ Render (vertices, faces) from now on, e.g. the full mesh after a coarse one.
+        dist_vertices are picked again from the new vertices. """
+        self.vertices = torch.as_tensor(vertices, device=self.vertices.device)
+        self.faces = torch.as_tensor(faces, device=self.faces.device)
+        self.dist_vertices = self._dist_vertices(self.vertices)
+
+    def set_last_results(self, loss_dict: dict, iou: torch.Tensor):
+        """ Per-init loss terms and IoU of the current poses, as reused by top_results().
+        forward_backward() sets them to the poses it was called with. """
+        self.last_loss_dict = loss_dict
+        self.last_iou = iou
+        # top_results() / clustered_results(top_m=...) were selected from the previous ones
+        for attr in [k for k in vars(self) if k.startswith('_top_results_')
+                     or (k.startswith('_clustered_results_') and '_top' in k)]:
+            delattr(self, attr)
+
     @cached_property
     def fitted_results(self):
         """ At test-time, one should call self.fitted_results
         instead of self.forward() to get sorted version of
         (verts, loss, iou, image)
         """
-        loss_dict, iou, _ = self.forward()
+        with torch.no_grad():
+            loss_dicts, ious = [], []
+            for chunk in self.chunks():
+                loss_dict, iou, _ = self.forward(chunk)
+                loss_dicts.append(loss_dict)
+                ious.append(iou)
+            loss_dict = {
+                k: torch.cat([d[k] for d in loss_dicts]) for k in loss_dicts[0]}
+            iou = torch.cat(ious)
         inds = torch.argsort(iou, descending=True)
         for k, v in loss_dict.items():
             loss_dict[k] = v[inds]
@@ -237,12 +337,50 @@ class PoseRenderer(nn.Module):
         translations = self.translations[inds]
         return FitResult(verts, rotations, translations, loss_dict, iou)
 
-    def clustered_results(self, K):
-        _attr = f'_clustered_results_{K}'
+    def top_results(self, M) -> FitResult:
+        """ The M inits of highest IoU, sorted, as in fitted_results.
+        Selected with topk on the loss and IoU of the last evaluation
+        (see set_last_results()) instead of rendering all inits again.
+        """
+        _attr = f'_top_results_{M}'
         if hasattr(self, _attr):
             return getattr(self, _attr)
-        verts_orig = self.vertices
-        fitted_results = self.fitted_results
+        if getattr(self, 'last_iou', None) is None:
+            fitted_results = self.fitted_results
+            res = FitResult(
+                fitted_results.verts[:, :M], fitted_results.rotations[:M],
+                fitted_results.translations[:M],
+                {k: v[:M] for k, v in fitted_results.loss_dict.items()},
+                fitted_results.iou[:M])
+        else:
+            iou, inds = torch.topk(self.last_iou, min(M, len(self.last_iou)))
+            loss_dict = {k: v[inds] for k, v in self.last_loss_dict.items()}
+            with torch.no_grad():
+                verts = self.apply_transformation(inds)
+            res = FitResult(
+                verts, self.rotations_matrix[inds], self.translations[inds],
+                loss_dict, iou)
+        setattr(self, _attr, res)
+        return res
+
+    def clustered_results(self, K, top_m=None):
+        """
+        Args:
+            K: number of clusters
+            top_m: if set, cluster only the top_m inits of top_results(),
+                with pose distances on the vertex subset `dist_vertices`.
+                None to cluster all fitted_results on all vertices.
+        """
+        _attr = f'_clustered_results_{K}' if top_m is None \
+            else f'_clustered_results_{K}_top{top_m}'
+        if hasattr(self, _attr):
+            return getattr(self, _attr)
+        if top_m is None:
+            verts_orig = self.vertices
+            fitted_results = self.fitted_results
+        else:
+            verts_orig = getattr(self, 'dist_vertices', self.vertices)
+            fitted_results = self.top_results(top_m)
         rots = fitted_results.rotations
         # If with base, rots is rotation in hands space,
         # since they are applied to all B base poses, it's safe to compute just with rots
@@ -266,22 +404,25 @@ class PoseRenderer(nn.Module):
         setattr(self, _attr, res)
         return res
 
-    def render(self) -> torch.Tensor:
+    def render(self, verts=None) -> torch.Tensor:
         """
         Renders objects according to current rotation and translation.
 
+        Args:
+            verts: (B, n, V, 3) e.g. apply_transformation(inds), default all inits
+
         Returns:
             images: ndarray (B, N_init, W, W)
         """
-        verts = self.apply_transformation()  # (B, N, V, 3)
+        verts = self.apply_transformation() if verts is None else verts  # (B, N, V, 3)
         b = verts.size(0)
         n = verts.size(1)
-        batch_faces = self.faces.repeat(b, n, 1, 1)
-        batch_K = self.renderer.K.unsqueeze(1).repeat(1, n, 1, 1)  # (B, 3, 3) -> (B, N, 3, 3)
+        batch_faces = self.faces.expand(b*n, -1, -1)  # view, no copy
+        batch_K = self.renderer.K.unsqueeze(1).expand(b, n, 3, 3)  # (B, 3, 3) -> (B, N, 3, 3)
         images = self.renderer(
-            verts.view(b*n, -1, 3),
-            batch_faces.view(b*n, -1, 3),
-            K=batch_K.view(b*n, -1, 3),
+            verts.reshape(b*n, -1, 3),
+            batch_faces,
+            K=batch_K.reshape(b*n, 3, 3),
             mode='silhouettes')
         images = images.view(b, n, self.image_size, self.image_size)
         return images
@@ -0,0 +1,170 @@
+import unittest
+import numpy as np
+import torch
+import trimesh
+from pytorch3d.transforms import matrix_to_rotation_6d, rotation_6d_to_matrix
+
+from homan.utils.geometry import compute_random_rotations
+
+
+class Rot6dTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        """ Inits are stored with matrix_to_rotation_6d and read back with rotation_6d_to_matrix """
+        rots = compute_random_rotations(100, upright=False, device='cpu')
+        torch.testing.assert_close(
+            rotation_6d_to_matrix(matrix_to_rotation_6d(rots)), rots, atol=1e-5, rtol=0)
+
+
+@unittest.skipUnless(torch.cuda.is_available(), 'neural_renderer needs cuda')
+class ChunkedForwardBackwardTest(unittest.TestCase):
+
+    def make_model(self, chunk_size):
+        from obj_pose.pose_renderer import PoseRenderer
+        torch.manual_seed(0)
+        bsize, num_init, w = 2, 7, 64
+        mesh = trimesh.creation.icosphere(subdivisions=2, radius=0.1)
+        ref = torch.zeros(bsize, w, w, device='cuda')
+        ref[:, 20:44, 16:40] = 1
+        ref[:, :4] = -1  # occluded rows
+        rots = compute_random_rotations(num_init, upright=False, device='cuda')
+        transl = torch.tensor([[[0.0, 0.0, 0.6]]], device='cuda') \
+            + 0.05 * torch.randn(num_init, 1, 3, device='cuda')
+        K = torch.tensor([[1., 0, 0.5], [0, 1., 0.5], [0, 0, 1.]], device='cuda')
+        return PoseRenderer(
+            ref_image=ref,
+            vertices=torch.as_tensor(mesh.vertices, dtype=torch.float32, device='cuda'),
+            faces=torch.as_tensor(mesh.faces, dtype=torch.int32, device='cuda'),
+            rotation_init=matrix_to_rotation_6d(rots),
+            translation_init=transl,
+            num_initializations=num_init,
+            camera_K=K.expand(bsize, 3, 3).contiguous(),
+            base_rotation=torch.eye(3, device='cuda').repeat(bsize, 1, 1),
+            base_translation=torch.zeros(bsize, 1, 3, device='cuda'),
+            lw_chamfer=1.0,
+            chunk_size=chunk_size)
+
+    def test_gradients_match(self):
+        full = self.make_model(chunk_size=None)
+        loss_dict, iou, _ = full()
+        losses = sum(loss_dict.values())
+        losses.sum().backward()
+
+        for chunk_size in [1, 3, 7]:
+            chunked = self.make_model(chunk_size=chunk_size)
+            c_losses, c_loss_dict, c_iou, _ = chunked.forward_backward()
+            self.assertEqual(len(chunked.chunks()), -(-7 // chunk_size))
+            self.assertTrue(torch.allclose(c_losses, losses.detach(), rtol=1e-5))
+            self.assertTrue(torch.allclose(c_iou, iou))
+            for k in loss_dict:
+                self.assertTrue(torch.allclose(c_loss_dict[k], loss_dict[k].detach(), rtol=1e-5))
+            for name in ['rotations', 'translations']:
+                g_full = getattr(full, name).grad
+                g_chunk = getattr(chunked, name).grad
+                self.assertTrue(
+                    torch.allclose(g_chunk, g_full, rtol=1e-4, atol=1e-6),
+                    f'{name} grad, chunk_size={chunk_size}')
+
+
+def rotation_about(axis: int, degrees: float) -> torch.Tensor:
+    """ (3, 3) """
+    w = torch.zeros(3, 3)
+    i, j = [v for v in range(3) if v != axis]
+    w[i, j], w[j, i] = -1, 1
+    return torch.linalg.matrix_exp(w * degrees * np.pi / 180)
+
+
+def nearest_bases(rotations, bases) -> list:
+    """ sorted index of the closest base of each rotation """
+    dists = torch.stack([
+        (rotations.detach().cpu() - b).flatten(1).norm(dim=1) for b in bases])
+    return sorted(dists.argmin(0).tolist())
+
+
+class TopResultsTest(unittest.TestCase):
+    """ top_results() reuses the last IoU, so all but the rendered full method runs on cpu """
+
+    def test_top_m_clusters_agree(self):
+        """ Three groups of noisy rotations of a box: clustering the top-M inits
+        on the vertex subset finds the same groups as clustering all inits. """
+        from obj_pose.pose_renderer import PoseRenderer
+        from obj_pose.utils import compute_pairwise_dist
+        from obj_pose.cluster_distance_matrix import cluster_distance_matrix
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        torch.manual_seed(0)
+        K, per_group, M, bsize, w = 3, 20, 30, 2, 64
+        bases = [torch.eye(3), rotation_about(0, 90), rotation_about(2, 90)]
+        rots = torch.stack([
+            b @ rotation_about(int(torch.randint(3, [])), float(5 * torch.rand([])))
+            for b in bases for _ in range(per_group)])
+        mesh = trimesh.creation.box(extents=[0.05, 0.1, 0.2]).subdivide().subdivide()
+        ref = torch.zeros(bsize, w, w, device=device)
+        ref[:, 20:44, 16:40] = 1
+        K_cam = torch.tensor([[1., 0, 0.5], [0, 1., 0.5], [0, 0, 1.]], device=device)
+        model = PoseRenderer(
+            ref_image=ref,
+            vertices=torch.as_tensor(mesh.vertices, dtype=torch.float32, device=device),
+            faces=torch.as_tensor(mesh.faces, dtype=torch.int32, device=device),
+            rotation_init=matrix_to_rotation_6d(rots.to(device)),
+            translation_init=torch.tensor([[[0.0, 0.0, 0.6]]], device=device),
+            num_initializations=K * per_group,
+            camera_K=K_cam.expand(bsize, 3, 3).contiguous(),
+            base_rotation=torch.eye(3, device=device).repeat(bsize, 1, 1),
+            base_translation=torch.zeros(bsize, 1, 3, device=device),
+            num_dist_verts=32,
+            device=device)
+        torch.testing.assert_close(model.rotations_matrix.cpu(), rots, atol=1e-5, rtol=0)
+        # the same IoU ranks in each group, so the top-M contain all groups
+        rank = torch.arange(per_group, device=device).repeat(K).float()
+        model.set_last_results({'mask': rank}, 1 - rank / per_group)
+        # clustered_results(K) on all inits and all vertices; its centers don't depend on the IoU
+        full_centers, _ = cluster_distance_matrix(
+            compute_pairwise_dist(model.vertices, model.rotations_matrix, verbose=False), K=K)
+        top = model.clustered_results(K, top_m=M)
+        self.assertEqual(len(model.dist_vertices), 32)
+        self.assertEqual(model.top_results(M).iou.shape, (M,))
+        self.assertEqual(nearest_bases(model.rotations_matrix[full_centers], bases), list(range(K)))
+        self.assertEqual(nearest_bases(top.rotations, bases), list(range(K)))
+        self.assertTrue(torch.all(top.iou > 1 - M / K / per_group))
+
+        # new results invalidate the cached top-M selections
+        model.set_last_results({'mask': -rank}, rank / per_group)
+        self.assertTrue(torch.all(model.top_results(M).iou >= 1 - M / K / per_group))
+        self.assertIsNot(model.clustered_results(K, top_m=M), top)
+
+        # switching mesh picks the vertex subset again
+        model.set_mesh(model.vertices[:16], model.faces[:4])
+        torch.testing.assert_close(model.dist_vertices, model.vertices)
+
+    @unittest.skipUnless(torch.cuda.is_available(), 'neural_renderer needs cuda')
+    def test_full_method_renders(self):
+        """ clustered_results(K) ranks all inits by rendering them """
+        from obj_pose.pose_renderer import PoseRenderer
+        torch.manual_seed(0)
+        K, per_group, bsize, w = 3, 10, 2, 64
+        bases = [torch.eye(3), rotation_about(0, 90), rotation_about(2, 90)]
+        rots = torch.stack([
+            b @ rotation_about(int(torch.randint(3, [])), float(5 * torch.rand([])))
+            for b in bases for _ in range(per_group)])
+        mesh = trimesh.creation.box(extents=[0.05, 0.1, 0.2]).subdivide()
+        ref = torch.zeros(bsize, w, w, device='cuda')
+        ref[:, 20:44, 16:40] = 1
+        K_cam = torch.tensor([[1., 0, 0.5], [0, 1., 0.5], [0, 0, 1.]], device='cuda')
+        model = PoseRenderer(
+            ref_image=ref,
+            vertices=torch.as_tensor(mesh.vertices, dtype=torch.float32, device='cuda'),
+            faces=torch.as_tensor(mesh.faces, dtype=torch.int32, device='cuda'),
+            rotation_init=matrix_to_rotation_6d(rots.cuda()),
+            translation_init=torch.tensor([[[0.0, 0.0, 0.6]]], device='cuda'),
+            num_initializations=K * per_group,
+            camera_K=K_cam.expand(bsize, 3, 3).contiguous(),
+            base_rotation=torch.eye(3, device='cuda').repeat(bsize, 1, 1),
+            base_translation=torch.zeros(bsize, 1, 3, device='cuda'))
+        full = model.clustered_results(K)
+        self.assertEqual(nearest_bases(full.rotations, bases), list(range(K)))
+        self.assertIs(model.clustered_results(K), full)
+        model.set_last_results(full.loss_dict, full.iou)
+        self.assertIs(model.clustered_results(K), full)
+
+if __name__ == '__main__':
+    unittest.main()
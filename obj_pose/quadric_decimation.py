@@ -0,0 +1,277 @@
+""" In-process mesh simplification by quadric error edge collapse
+(Garland & Heckbert, Surface Simplification Using Quadric Error Metrics, 1997),
+and level-of-detail pyramids of object meshes cached on disk.
+
+Unlike simplifymesh.py, this needs no external binaries.
+"""
+import hashlib
+import heapq
+import itertools
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import trimesh
+from scipy.spatial import cKDTree
+
+
+LOD_LEVELS = (2000, 500, 150)
+
+
+def _face_planes(vertices: np.ndarray, faces: np.ndarray):
+    """
+    Returns:
+        planes: (F, 4) unit normal n and offset d, n.x + d = 0
+        areas: (F,)
+    """
+    v0, v1, v2 = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    n = np.cross(v1 - v0, v2 - v0)
+    norm = np.linalg.norm(n, axis=1)
+    n = n / np.maximum(norm, 1e-12)[:, None]
+    d = -(n * v0).sum(1)
+    return np.concatenate([n, d[:, None]], 1), norm / 2
+
+
+def _plane_quadrics(planes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """ (P, 4, 4) weighted p p^T """
+    return weights[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+
+def vertex_quadrics(vertices: np.ndarray,
+                    faces: np.ndarray,
+                    boundary_weight: float = 100.0) -> np.ndarray:
+    """ Area weighted sum of the face plane quadrics around each vertex.
+    Open boundaries get an extra plane through each boundary edge,
+    perpendicular to its face, so they aren't eaten away.
+
+    Returns:
+        (V, 4, 4)
+    """
+    planes, areas = _face_planes(vertices, faces)
+    face_q = _plane_quadrics(planes, areas)
+    quadrics = np.zeros((len(vertices), 4, 4))
+    for k in range(3):
+        np.add.at(quadrics, faces[:, k], face_q)
+
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    edge_faces = np.tile(np.arange(len(faces)), 3)
+    _, inverse, counts = np.unique(
+        np.sort(edges, 1), axis=0, return_inverse=True, return_counts=True)
+    is_boundary = counts[inverse.reshape(-1)] == 1
+    if boundary_weight > 0 and is_boundary.any():
+        edges, edge_faces = edges[is_boundary], edge_faces[is_boundary]
+        a, b = vertices[edges[:, 0]], vertices[edges[:, 1]]
+        n = np.cross(b - a, planes[edge_faces, :3])
+        n = n / np.maximum(np.linalg.norm(n, axis=1), 1e-12)[:, None]
+        d = -(n * a).sum(1)
+        boundary_q = _plane_quadrics(
+            np.concatenate([n, d[:, None]], 1),
+            boundary_weight * ((b - a)**2).sum(1))
+        np.add.at(quadrics, edges[:, 0], boundary_q)
+        np.add.at(quadrics, edges[:, 1], boundary_q)
+    return quadrics
+
+
+def _quadric_cost(q: np.ndarray, v: np.ndarray) -> float:
+    vh = np.append(v, 1.0)
+    return float(vh @ q @ vh)
+
+
+def _collapse_target(q: np.ndarray, a: np.ndarray, b: np.ndarray):
+    """ Position minimizing the quadric `q` for collapsing edge (a, b).
+    The optimum of q is only used when well conditioned and near the edge,
+    otherwise the best of the end points and mid point.
+
+    Returns:
+        cost: float
+        v: (3,)
+    """
+    candidates = [a, b, (a + b) / 2]
+    A = q[:3, :3]
+    scale = np.trace(A) / 3
+    if scale > 0 and abs(np.linalg.det(A)) > 1e-8 * scale**3:
+        v = np.linalg.solve(A, -q[:3, 3])
+        if np.linalg.norm(v - candidates[2]) <= np.linalg.norm(b - a):
+            candidates.append(v)
+    costs = [_quadric_cost(q, v) for v in candidates]
+    best = int(np.argmin(costs))
+    return costs[best], candidates[best]
+
+
+def _normal(p0, p1, p2) -> np.ndarray:
+    return np.cross(p1 - p0, p2 - p0)
+
+
+def decimate(vertices,
+             faces,
+             target_verts: int,
+             boundary_weight: float = 100.0) -> Tuple[np.ndarray, np.ndarray]:
+    """ Collapse edges in order of quadric error until `target_verts` vertices are left.
+
+    An edge is only collapsed if it keeps the surface manifold around it
+    (link condition), doesn't flip any of the surrounding faces and doesn't
+    remove a connected component, so the result may have more vertices than asked for.
+
+    Args:
+        vertices: (V, 3)
+        faces: (F, 3) int
+        target_verts: int
+
+    Returns:
+        vertices: (V', 3) float32, V' <= V
+        faces: (F', 3) int64, indexing the new vertices
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).copy()
+    faces_np = np.asarray(faces, dtype=np.int64)
+    num_verts = len(vertices)
+
+    quadrics = vertex_quadrics(vertices, faces_np, boundary_weight)
+    faces = faces_np.tolist()
+    vert_faces = [set() for _ in range(num_verts)]
+    for fi, face in enumerate(faces):
+        for v in face:
+            vert_faces[v].add(fi)
+    version = [0] * num_verts
+    num_alive = sum(len(fs) > 0 for fs in vert_faces)
+
+    heap = []
+    counter = itertools.count()
+
+    def push(i, j):
+        cost, v = _collapse_target(quadrics[i] + quadrics[j], vertices[i], vertices[j])
+        heapq.heappush(heap, (cost, next(counter), i, j, version[i], version[j], v))
+
+    def neighbours(i):
+        return {u for fi in vert_faces[i] for u in faces[fi]} - {i}
+
+    edges = np.unique(np.sort(np.concatenate(
+        [faces_np[:, [0, 1]], faces_np[:, [1, 2]], faces_np[:, [2, 0]]]), 1), axis=0)
+    for i, j in edges.tolist():
+        push(i, j)
+
+    while num_alive > target_verts and heap:
+        _, _, i, j, ver_i, ver_j, v = heapq.heappop(heap)
+        if version[i] != ver_i or version[j] != ver_j \
+                or not vert_faces[i] or not vert_faces[j]:
+            continue  # stale
+        shared = vert_faces[i] & vert_faces[j]
+        if not shared:
+            continue
+        # Link condition: i and j may only share the neighbours of the edge
+        third = {u for fi in shared for u in faces[fi]} - {i, j}
+        if neighbours(i) & neighbours(j) != third:
+            continue
+        # Keep small components, e.g. a closed tetrahedron, from vanishing
+        if vert_faces[i] | vert_faces[j] == shared \
+                or any(vert_faces[u] <= shared for u in third):
+            continue
+        # Reject face flips and faces collapsing to zero area
+        flipped = False
+        for fi in (vert_faces[i] | vert_faces[j]) - shared:
+            pts = [vertices[u] for u in faces[fi]]
+            n_old = _normal(*pts)
+            pts = [v if u in (i, j) else p for u, p in zip(faces[fi], pts)]
+            n_new = _normal(*pts)
+            if n_old @ n_new <= 1e-3 * (n_old @ n_old):
+                flipped = True
+                break
+        if flipped:
+            continue
+
+        # Collapse j into i
+        vertices[i] = v
+        quadrics[i] = quadrics[i] + quadrics[j]
+        for fi in shared:
+            for u in faces[fi]:
+                vert_faces[u].discard(fi)
+        for fi in vert_faces[j]:
+            faces[fi] = [i if u == j else u for u in faces[fi]]
+            vert_faces[i].add(fi)
+        vert_faces[j] = set()
+        version[i] += 1
+        version[j] += 1
+        num_alive -= 1
+        for u in neighbours(i):
+            push(i, u)
+
+    alive_faces = sorted(set().union(*vert_faces))
+    faces_np = np.asarray([faces[fi] for fi in alive_faces], dtype=np.int64).reshape(-1, 3)
+    used, faces_np = np.unique(faces_np, return_inverse=True)
+    return np.float32(vertices[used]), faces_np.reshape(-1, 3)
+
+
+def sample_surface(vertices, faces, num_points, seed=0):
+    """ Area-uniform points on the mesh surface """
+    rng = np.random.default_rng(seed)
+    tris = np.asarray(vertices, dtype=np.float64)[faces]
+    areas = np.linalg.norm(
+        np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0]), axis=1)
+    inds = rng.choice(len(faces), num_points, p=areas / areas.sum())
+    uv = rng.random((num_points, 2))
+    flip = uv.sum(1) > 1
+    uv[flip] = 1 - uv[flip]
+    tris = tris[inds]
+    return tris[:, 0] + uv[:, :1] * (tris[:, 1] - tris[:, 0]) \
+        + uv[:, 1:] * (tris[:, 2] - tris[:, 0])
+
+
+def hausdorff(mesh_a, mesh_b, num_points=50000) -> float:
+    """ Symmetric Hausdorff distance between the surfaces, estimated on samples """
+    pa = sample_surface(*mesh_a, num_points, seed=0)
+    pb = sample_surface(*mesh_b, num_points, seed=1)
+    return max(cKDTree(pb).query(pa)[0].max(), cKDTree(pa).query(pb)[0].max())
+
+
+def build_lod_pyramid(vertices,
+                      faces,
+                      levels: Sequence[int] = LOD_LEVELS) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """ Decimate the source mesh to each of `levels` vertices.
+    Each level is decimated from the source, levels above the source size
+    keep the source mesh.
+
+    Returns:
+        list of (vertices, faces), one per level
+    """
+    pyramid = []
+    for num_verts in levels:
+        if num_verts >= len(vertices):
+            pyramid.append((np.float32(vertices), np.asarray(faces, dtype=np.int64)))
+        else:
+            pyramid.append(decimate(vertices, faces, num_verts))
+    return pyramid
+
+
+def file_hash(path: str) -> str:
+    with open(path, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()[:16]
+
+
+def load_lod_pyramid(mesh_path: str,
+                     cache_dir: str,
+                     levels: Sequence[int] = LOD_LEVELS) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """ build_lod_pyramid() of the mesh file, cached in `cache_dir`
+    under the hash of the file content, so editing the mesh rebuilds it.
+
+    Returns:
+        list of (vertices, faces), one per level, not normalized
+    """
+    stem = os.path.splitext(os.path.basename(mesh_path))[0]
+    levels_str = '-'.join(map(str, levels))
+    cache_path = os.path.join(
+        cache_dir, f"{stem}_{file_hash(mesh_path)}_lod{levels_str}.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            return [(data[f'vertices_{k}'], data[f'faces_{k}']) for k in range(len(levels))]
+
+    mesh = trimesh.load(mesh_path, force='mesh')
+    pyramid = build_lod_pyramid(mesh.vertices, mesh.faces, levels)
+    os.makedirs(cache_dir, exist_ok=True)
+    arrays = {}
+    for k, (verts, faces) in enumerate(pyramid):
+        arrays[f'vertices_{k}'] = verts
+        arrays[f'faces_{k}'] = faces
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as fp:
+        np.savez(fp, **arrays)
+    os.replace(tmp_path, cache_path)
+    return pyramid
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import trimesh
+
+from obj_pose.quadric_decimation import (
+    decimate, build_lod_pyramid, hausdorff, load_lod_pyramid)
+
+
+class DecimateTest(unittest.TestCase):
+
+    def check(self, vertices, faces, target, max_rel_hausdorff):
+        verts_d, faces_d = decimate(vertices, faces, target)
+        self.assertLessEqual(len(verts_d), target)
+        self.assertEqual(len(np.unique(faces_d)), len(verts_d))  # no unused vertices
+        self.assertTrue(np.all(faces_d[:, 0] != faces_d[:, 1]))
+        self.assertTrue(np.all(faces_d[:, 1] != faces_d[:, 2]))
+        self.assertTrue(np.all(faces_d[:, 0] != faces_d[:, 2]))
+        diag = np.linalg.norm(vertices.max(0) - vertices.min(0))
+        dist = hausdorff((vertices, faces), (verts_d, faces_d))
+        self.assertLess(dist / diag, max_rel_hausdorff, f'{target} vertices')
+        return verts_d, faces_d
+
+    def test_sphere(self):
+        sphere = trimesh.creation.icosphere(subdivisions=4)  # 2562 vertices
+        for target in [500, 150]:
+            verts, faces = self.check(
+                np.asarray(sphere.vertices), np.asarray(sphere.faces), target, 0.02)
+            self.assertEqual(len(verts), target)
+            decimated = trimesh.Trimesh(verts, faces, process=False)
+            self.assertTrue(decimated.is_watertight)
+            self.assertTrue(decimated.is_winding_consistent)
+
+    def test_open_mesh(self):
+        """ Open boundaries, several components """
+        mesh = trimesh.load('./weights/obj_models/bottle.obj', force='mesh')
+        verts, faces = np.asarray(mesh.vertices), np.asarray(mesh.faces)
+        self.check(verts, faces, 500, 0.03)
+        self.check(verts, faces, 150, 0.05)
+
+
+class LodPyramidTest(unittest.TestCase):
+
+    def test_levels(self):
+        sphere = trimesh.creation.icosphere(subdivisions=3)  # 642 vertices
+        pyramid = build_lod_pyramid(sphere.vertices, sphere.faces, levels=(2000, 300, 100))
+        self.assertEqual([len(v) for v, _ in pyramid], [642, 300, 100])
+        self.assertTrue(np.array_equal(pyramid[0][1], sphere.faces))
+
+    def test_cache(self):
+        sphere = trimesh.creation.icosphere(subdivisions=3)
+        levels = (300, 100)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'sphere.obj')
+            cache_dir = os.path.join(tmp, 'cache')
+            sphere.export(src)
+            first = load_lod_pyramid(src, cache_dir, levels)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            second = load_lod_pyramid(src, cache_dir, levels)
+            for (v1, f1), (v2, f2) in zip(first, second):
+                self.assertTrue(np.array_equal(v1, v2))
+                self.assertTrue(np.array_equal(f1, f2))
+            # a changed source mesh is decimated again
+            sphere.apply_scale(2.0).export(src)
+            third = load_lod_pyramid(src, cache_dir, levels)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            self.assertAlmostEqual(
+                np.linalg.norm(third[0][0], axis=1).max(),
+                2 * np.linalg.norm(first[0][0], axis=1).max(), delta=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+"""
+Batched hand-object distance of the HO3D annotations, used by ho3d_pre.filter_contact.
+
+Per split it writes one table `data_dir/<split>.csv` with columns
+index, vid, frame, split, dist (mm), instead of one tmp pkl per frame
+joined afterwards (ho3d_pre.closest_dist + filter_join):
+- meta pkls are read by a thread pool,
+- each object mesh is loaded and sampled once, in its own frame,
+- MANO runs on `batch_size` poses at once,
+- the closest point is a KNN query instead of the dense (K, M) distances.
+
+    python -m preprocess.ho3d_contact --split evaluation
+"""
+import argparse
+import os.path as osp
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from pytorch3d.ops import knn_points
+from pytorch3d.ops.sample_points_from_meshes import sample_points_from_meshes
+
+from nnutils import geom_utils
+from nnutils.hand_utils import ManopthWrapper, cvt_axisang_t_i2o
+
+
+def meta_path(data_dir, folder, index) -> str:
+    vid_idx, frame_idx = index.split('/')
+    meta_folder = 'meta_plus' if folder == 'evaluation' else 'meta'
+    return osp.join(data_dir, folder, vid_idx, meta_folder, '%s.pkl' % frame_idx)
+
+
+def _load_pkl(path):
+    with open(path, 'rb') as fp:
+        return pickle.load(fp)
+
+
+def load_metas(paths: List[str], num_workers=16) -> List[dict]:
+    """ Reading the pkls is IO bound, threads are enough """
+    with ThreadPoolExecutor(num_workers) as pool:
+        return list(pool.map(_load_pkl, paths))
+
+
+def annos_to_tensors(annos: List[dict], device='cpu') -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """ The camera frame transforms of ho3d_pre.closest_dist, for all annotations at once.
+
+    Returns:
+        hA: (N, 45) hand articulation
+        cTh: (N, 4, 4)
+        cTo: (N, 4, 4)
+    """
+    def stack(key):
+        arr = np.stack([np.asarray(anno[key], dtype=np.float32).reshape(-1) for anno in annos])
+        return torch.from_numpy(arr).to(device)
+
+    pose, trans = stack('handPose'), stack('handTrans')
+    hA = pose[..., 3:]
+    rot, trans = cvt_axisang_t_i2o(pose[..., :3], trans)
+    wTh = geom_utils.axis_angle_t_to_matrix(rot, trans)
+    wTo = geom_utils.axis_angle_t_to_matrix(stack('objRot'), stack('objTrans'))
+
+    rot = torch.FloatTensor([[[1, 0, 0],
+            [0, -1, 0],
+            [0, 0, -1]]]).to(device)
+    cTw = geom_utils.rt_to_homo(rot, )
+    # cTh @ hTo = cTw @ wTh @ inv(wTh) @ wTo
+    return hA, cTw @ wTh, cTw @ wTo
+
+
+def sample_object_points(obj_names: List[str], shape_dir, num_points=10000, device='cpu') -> torch.Tensor:
+    """ Surface points of each object mesh, in the object frame.
+    Sampling is area-uniform so it commutes with the rigid cTo.
+
+    Returns:
+        (O, num_points, 3) in the order of obj_names
+    """
+    from nnutils import mesh_utils
+
+    shape_temp = osp.join(shape_dir, 'models', '{}', 'textured_simple.obj')
+    points = []
+    for name in obj_names:
+        mesh = mesh_utils.load_mesh(shape_temp.format(name), scale_verts=1).to(device)
+        points.append(sample_points_from_meshes(mesh, num_points)[0])
+    return torch.stack(points)
+
+
+def transform_points(mat: torch.Tensor, points: torch.Tensor) -> torch.Tensor:
+    """
+    :param mat: (N, 4, 4)
+    :param points: (N, P, 3)
+    :return: (N, P, 3)
+    """
+    return points @ mat[:, :3, :3].transpose(1, 2) + mat[:, None, :3, 3]
+
+
+def nearest_dist(x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+    """ Smallest distance between the point sets x[i] and y[i].
+
+    :param x: (N, K, 3)
+    :param y: (N, M, 3)
+    :return: (N, )
+    """
+    dists = knn_points(x, y, K=1).dists[..., 0]  # (N, K) squared
+    return dists.min(-1)[0].sqrt()
+
+
+@torch.no_grad()
+def closest_dists(hA, cTh, cTo, obj_idx, oObj, hand_wrapper, num_points=10000, batch_size=64) -> torch.Tensor:
+    """ Hand-object distance in mm, as ho3d_pre.closest_dist on each item
+
+    Args:
+        hA, cTh, cTo: from annos_to_tensors()
+        obj_idx: (N, ) long, object of each item in oObj
+        oObj: (O, M, 3) from sample_object_points()
+        hand_wrapper: ManopthWrapper
+    Returns:
+        (N, )
+    """
+    device = hA.device
+    obj_idx = obj_idx.to(device)
+    dists = []
+    for st in range(0, len(hA), batch_size):
+        end = min(st + batch_size, len(hA))
+        cHand, _ = hand_wrapper(geom_utils.matrix_to_se3(cTh[st:end]), hA[st:end])
+        cHand = sample_points_from_meshes(cHand, num_points)  # (B, K, 3)
+        cObj = transform_points(cTo[st:end], oObj[obj_idx[st:end]])  # (B, M, 3)
+        dists.append(nearest_dist(cHand, cObj))
+    return torch.cat(dists) * 1000
+
+
+def contact_table(index_list: List[str], folder, data_dir, shape_dir, hand_wrapper,
+                  device='cpu', num_points=10000, batch_size=64, num_workers=16) -> pd.DataFrame:
+    """
+    Args:
+        index_list: 'vid/frame' as in <split>.txt
+        folder: 'train' or 'evaluation'
+    Returns:
+        DataFrame with columns index, vid, frame, split, dist
+    """
+    annos = load_metas([meta_path(data_dir, folder, index) for index in index_list], num_workers)
+    hA, cTh, cTo = annos_to_tensors(annos, device)
+
+    obj_names, obj_idx = np.unique([anno['objName'] for anno in annos], return_inverse=True)
+    oObj = sample_object_points(list(obj_names), shape_dir, num_points, device)
+    dist = closest_dists(hA, cTh, cTo, torch.from_numpy(obj_idx), oObj,
+                         hand_wrapper.to(device), num_points, batch_size)
+
+    vid, frame = zip(*[index.split('/') for index in index_list])
+    return pd.DataFrame({
+        'index': index_list,
+        'vid': vid,
+        'frame': frame,
+        'split': folder,
+        'dist': dist.cpu().numpy(),
+    })
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--split', type=str, default='evaluation')
+    parser.add_argument('--data_dir', type=str, default='/checkpoint/yufeiy2/datasets/HO3D/')
+    parser.add_argument('--shape_dir', type=str, default='~/hoi/data/ho3dobj')
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--num_workers', type=int, default=16)
+    parser.add_argument('--device', type=str, default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    folder = 'evaluation' if args.split == 'evaluation' else 'train'
+    index_list = [line.strip() for line in open(osp.join(args.data_dir, '%s.txt' % args.split))]
+    df = contact_table(index_list, folder, args.data_dir, osp.expanduser(args.shape_dir),
+                       ManopthWrapper(side='right'), args.device, batch_size=args.batch_size,
+                       num_workers=args.num_workers)
+    df.to_csv(osp.join(args.data_dir, '%s.csv' % args.split))
+    print(osp.join(args.data_dir, '%s.csv' % args.split))
+
+
+if __name__ == '__main__':
+    main(parse_args())
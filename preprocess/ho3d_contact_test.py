@@ -0,0 +1,106 @@
+import os
+import os.path as osp
+import pickle
+import tempfile
+import unittest
+import numpy as np
+import torch
+import trimesh
+from pytorch3d.structures import Meshes
+
+from nnutils import geom_utils
+from nnutils.hand_utils import cvt_axisang_t_i2o
+from preprocess.ho3d_contact import (
+    annos_to_tensors, closest_dists, load_metas, meta_path, nearest_dist,
+    transform_points)
+
+
+def random_annos(num, rng, obj_names=('003_cracker_box', '006_mustard_bottle')):
+    return [dict(
+        handPose=rng.normal(0, 0.3, 48).astype(np.float32),
+        handTrans=rng.normal(0, 0.1, 3).astype(np.float32),
+        objRot=rng.normal(0, 1, (3, 1)).astype(np.float32),
+        objTrans=rng.normal(0, 0.1, (3, 1)).astype(np.float32),
+        objName=obj_names[i % len(obj_names)],
+    ) for i in range(num)]
+
+
+class SphereHand:
+    """ Stands in for ManopthWrapper: a sphere of `radius` at the hand origin """
+
+    def __init__(self, radius):
+        sphere = trimesh.creation.icosphere(subdivisions=3, radius=radius)
+        self.verts = torch.FloatTensor(sphere.vertices)
+        self.faces = torch.LongTensor(sphere.faces)
+
+    def __call__(self, glb_se3, art_pose):
+        N = len(art_pose)
+        verts = transform_points(geom_utils.se3_to_matrix(glb_se3), self.verts.expand(N, -1, -1))
+        return Meshes(list(verts), [self.faces] * N), None
+
+
+class HO3DContactTest(unittest.TestCase):
+
+    def test_nearest_dist_matches_dense(self):
+        x, y = torch.randn(4, 300, 3), torch.randn(4, 500, 3) + 1
+        dense = ((x[:, :, None] - y[:, None]) ** 2).sum(-1).sqrt().flatten(1).min(-1)[0]
+        torch.testing.assert_close(nearest_dist(x, y), dense)
+
+    def test_transforms_match_per_item(self):
+        """ Same cTh, cTo as ho3d_pre.closest_dist on one annotation """
+        annos = random_annos(5, np.random.default_rng(0))
+        hA, cTh, cTo = annos_to_tensors(annos)
+        cTw = geom_utils.rt_to_homo(torch.FloatTensor([[[1, 0, 0], [0, -1, 0], [0, 0, -1]]]))
+        for i, anno in enumerate(annos):
+            pose = torch.FloatTensor(anno['handPose'][None])
+            trans = torch.FloatTensor(anno['handTrans'][None])
+            rot, trans = cvt_axisang_t_i2o(pose[..., :3], trans)
+            wTh = geom_utils.axis_angle_t_to_matrix(rot, trans)
+            wTo = geom_utils.axis_angle_t_to_matrix(
+                torch.FloatTensor(anno['objRot'].reshape(1, 3)),
+                torch.FloatTensor(anno['objTrans'].reshape(1, 3)))
+            hTo = geom_utils.inverse_rt(mat=wTh, return_mat=True) @ wTo
+            torch.testing.assert_close(hA[i:i+1], pose[..., 3:])
+            torch.testing.assert_close(cTh[i:i+1], cTw @ wTh)
+            torch.testing.assert_close(cTo[i:i+1], cTw @ wTh @ hTo, atol=1e-5, rtol=1e-5)
+
+    def test_sphere_distance(self):
+        """ Two spheres: the distance of their surfaces, in mm """
+        N, r_hand, r_obj = 6, 0.03, 0.05
+        cTh = geom_utils.rt_to_homo(geom_utils.axis_angle_t_to_matrix(
+            torch.randn(N, 3), homo=False), torch.zeros(N, 3))
+        centers = torch.randn(N, 3)
+        centers = centers / centers.norm(dim=-1, keepdim=True) * torch.linspace(0.1, 0.3, N)[:, None]
+        cTo = geom_utils.rt_to_homo(geom_utils.axis_angle_t_to_matrix(
+            torch.randn(N, 3), homo=False), centers)
+        sphere = trimesh.creation.icosphere(subdivisions=4, radius=r_obj)
+        oObj = torch.stack([
+            torch.FloatTensor(sphere.vertices),
+            torch.FloatTensor(sphere.vertices) * 0.5,
+        ])  # sphere vertices are on the surface, no need to sample
+        obj_idx = torch.arange(N) % 2
+        radius = torch.where(obj_idx == 0, r_obj, r_obj / 2)
+
+        dist = closest_dists(torch.zeros(N, 45), cTh, cTo, obj_idx, oObj,
+                             SphereHand(r_hand), num_points=20000, batch_size=4)
+        expected = (centers.norm(dim=-1) - r_hand - radius) * 1000
+        torch.testing.assert_close(dist, expected, atol=2, rtol=0)
+
+    def test_load_metas(self):
+        annos = random_annos(20, np.random.default_rng(0))
+        index_list = ['MC1/%04d' % i for i in range(len(annos))]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [meta_path(tmp, 'evaluation', index) for index in index_list]
+            self.assertEqual(paths[3], osp.join(tmp, 'evaluation', 'MC1', 'meta_plus', '0003.pkl'))
+            self.assertIn(osp.join('train', 'MC1', 'meta'), meta_path(tmp, 'train', index_list[0]))
+            os.makedirs(osp.dirname(paths[0]))
+            for path, anno in zip(paths, annos):
+                with open(path, 'wb') as fp:
+                    pickle.dump(anno, fp)
+            loaded = load_metas(paths, num_workers=4)
+        self.assertEqual([anno['objName'] for anno in loaded], [anno['objName'] for anno in annos])
+        np.testing.assert_array_equal(loaded[7]['handPose'], annos[7]['handPose'])
+
+
+if __name__ == '__main__':
+    unittest.main()
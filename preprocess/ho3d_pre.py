@@ -25,6 +25,7 @@ import numpy as np
 
 from nnutils.hand_utils import ManopthWrapper, cvt_axisang_t_i2o,  cvt_axisang_t_o2i
 from nnutils import mesh_utils, image_utils, geom_utils
+from preprocess.ho3d_contact import contact_table
 
 
 data_dir = '/checkpoint/yufeiy2/datasets/HO3D/'
@@ -351,23 +352,18 @@ def load_ho_pred(anno, i, hand_wrapper):
 
 
 def filter_contact(split, skip=False):
-    device = 'cpu'
-    hand_wrapper = ManopthWrapper().to(device)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    hand_wrapper = ManopthWrapper(side='right').to(device)
     # split = 'val'  # 'evaluation
     folder = 'evaluation' if split == 'evaluation' else 'train'
     
     index_file = osp.join(data_dir, '%s.txt' % split)
     index_list = [line.strip() for line in open(index_file)]
 
-
-    annotations_list = Parallel(n_jobs=16 ,verbose=5)(
-        delayed(closest_dist)(
-            index, folder, hand_wrapper, device, skip
-        )
-        for i, index in tqdm(enumerate(index_list), total=len(index_list))
-    )
-
-    # print(osp.join(data_dir, '%s.csv' % split))
+    # batched closest_dist, writes the csv of filter_join directly
+    data = contact_table(index_list, folder, data_dir, osp.expanduser(shape_dir), hand_wrapper, device)
+    data.to_csv(osp.join(data_dir, '%s.csv' % split))
+    print(osp.join(data_dir, '%s.csv' % split))
         
 
 def filter_join(split):
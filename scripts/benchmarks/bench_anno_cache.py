@@ -0,0 +1,98 @@
+""" Cold build and warm load of the Obman annotation cache.
+
+    python scripts/benchmarks/bench_anno_cache.py --num 20000 --workers 8
+
+old:  serial meta pickle parsing, pickle.dump of lists of tensors
+new:  datasets.anno_cache: process pool parsing, columnar float32 arrays, memory-mapped load
+"""
+import argparse
+import os.path as osp
+import pickle
+import tempfile
+import time
+import numpy as np
+import torch
+
+from datasets import anno_cache
+from datasets.obman import parse_meta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    return args
+
+
+def make_fake_meta(meta_dir, num):
+    rng = np.random.default_rng(0)
+    index_list = []
+    for i in range(num):
+        index = '%08d' % i
+        cTo = np.eye(4)
+        cTo[:3, 3] = rng.normal(size=3)
+        meta = {
+            'class_id': '02876657', 'sample_id': 'cad%03d' % (i % 100),
+            'cTo': cTo, 'cTh': np.eye(4),
+            'hA': rng.normal(size=45).astype(np.float32),
+            # real meta pickles carry more payload than what is used
+            'verts_3d': rng.normal(size=(778, 3)),
+        }
+        with open(osp.join(meta_dir, index + '.pkl'), 'wb') as fp:
+            pickle.dump(meta, fp)
+        index_list.append(index)
+    return index_list
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_list = make_fake_meta(tmp_dir, args.num)
+        meta_files = [osp.join(tmp_dir, index + '.pkl') for index in index_list]
+        index_file = osp.join(tmp_dir, 'train.txt')
+        with open(index_file, 'w') as fp:
+            fp.write('\n'.join(index_list))
+
+        # old: serial parse + pickle of lists
+        st = time.time()
+        anno = {'index': [], 'cad_index': [], 'cTh': [], 'hTo': [], 'hA': []}
+        for index, meta_file in zip(index_list, meta_files):
+            cad_index, cTh, hTo, hA = parse_meta(meta_file)
+            anno['index'].append(index)
+            anno['cad_index'].append(cad_index)
+            anno['cTh'].append(torch.as_tensor(cTh))
+            anno['hTo'].append(torch.as_tensor(hTo))
+            anno['hA'].append(hA)
+        old_pkl = osp.join(tmp_dir, 'old.pkl')
+        pickle.dump(anno, open(old_pkl, 'wb'))
+        old_cold = time.time() - st
+        st = time.time()
+        pickle.load(open(old_pkl, 'rb'))
+        old_warm = time.time() - st
+
+        # new: keyed, parallel, columnar
+        st = time.time()
+        key = anno_cache.cache_key(index_list, {'name': 'obman'}, [index_file])
+        cache_dir = osp.join(tmp_dir, 'Cache', 'obman_%s' % key)
+        metas = anno_cache.parallel_map(parse_meta, meta_files, args.workers)
+        anno = {'index': index_list,
+                'cad_index': [m[0] for m in metas], 'cTh': [m[1] for m in metas],
+                'hTo': [m[2] for m in metas], 'hA': [m[3] for m in metas]}
+        anno_cache.save_anno(anno, cache_dir)
+        new_cold = time.time() - st
+        st = time.time()
+        key = anno_cache.cache_key(index_list, {'name': 'obman'}, [index_file])
+        anno_cache.load_anno(cache_dir)
+        new_warm = time.time() - st
+        st = time.time()
+        anno_cache.cache_key(index_list, {'name': 'obman'}, [index_file] + meta_files)
+        t_check_meta = time.time() - st
+
+        print(f"N={args.num}")
+        print(f"old: cold {old_cold:.2f}s, warm {old_warm:.3f}s")
+        print(f"new: cold {new_cold:.2f}s, warm {new_warm:.3f}s (incl. key on the index file), "
+              f"+{t_check_meta:.3f}s with DB.CACHE_CHECK_META over {len(meta_files)} mtimes")
+
+
+if __name__ == '__main__':
+    main(parse_args())
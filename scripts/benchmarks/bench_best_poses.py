@@ -0,0 +1,66 @@
+""" Iterations/s of the find_optimal_pose() loop (forward_backward + Adam + best tracking)
+with the old single best-pose tracking, which reads the min loss back every step,
+vs the on-device per-init BestPoses.
+
+    python scripts/benchmarks/bench_best_poses.py --num_inits 2000 --iters 50
+"""
+import argparse
+import time
+import numpy as np
+import torch
+
+from obj_pose.obj_loader import OBJLoader
+from obj_pose.pose_optimizer import BestPoses
+from scripts.benchmarks.bench_pose_renderer_chunks import make_model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_inits', type=int, default=2000)
+    parser.add_argument('--iters', type=int, default=50)
+    parser.add_argument('--bsize', type=int, default=4)
+    parser.add_argument('--chunk_size', type=int, default=0)
+    parser.add_argument('--cat', type=str, default='bottle')
+    args = parser.parse_args()
+    return args
+
+
+def run(obj, args, use_best_poses: bool):
+    model = make_model(obj, args.bsize, args.num_inits, args.chunk_size)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+    best = BestPoses(model.rotations, model.translations)
+    best_single = (torch.tensor(np.inf), None, None)  # loss, rotation, translation
+    torch.cuda.synchronize()
+    st = time.time()
+    for _ in range(args.iters):
+        optimizer.zero_grad()
+        losses, _, _, _ = model.forward_backward()
+        # both record the pose the losses were computed on, before the step
+        if use_best_poses:
+            best.update(losses, model.rotations, model.translations)
+        elif losses.min() < best_single[0]:
+            ind = torch.argmin(losses)
+            best_single = (losses[ind],
+                           model.rotations[ind].detach().clone(),
+                           model.translations[ind].detach().clone())
+        optimizer.step()
+    if use_best_poses:
+        top1 = best.result(sort=True)[0][0]
+    else:
+        top1 = best_single[0]
+    torch.cuda.synchronize()
+    return args.iters / (time.time() - st), top1.item()
+
+
+def main(args):
+    obj = OBJLoader().load_obj_by_name(args.cat)
+    run(obj, args, True)  # warm-up
+    it_old, loss_old = run(obj, args, False)
+    it_new, loss_new = run(obj, args, True)
+    print(f"N={args.num_inits}, B={args.bsize}, {args.iters} iterations")
+    print(f"  single best, synced: {it_old:6.2f} it/s, top-1 loss {loss_old:.4g}")
+    print(f"  BestPoses:           {it_new:6.2f} it/s, top-1 loss {loss_new:.4g}")
+
+
+if __name__ == '__main__':
+    main(parse_args())
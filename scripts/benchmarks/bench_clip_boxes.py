@@ -0,0 +1,168 @@
+""" Frames/s of v3_clip_boxes box selection on a synthetic video,
+the old per-frame DataFrame filtering with per-label np.nonzero boxes
+vs FrameDetections + select_frame_boxes(),
+and the time to save the output after every clip, rewriting the pickle vs appending.
+
+    python scripts/benchmarks/bench_clip_boxes.py --num_dets 50000 --num_frames 2000 --num_clips 1000
+"""
+import argparse
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import cv2
+
+from config.epic_constants import EPIC_HOA_SIZE, VISOR_SIZE, HAND_MASK_KEEP_EXPAND
+from datasets.tools.v3_clip_boxes import (
+    FrameDetections, append_boxes, select_frame_boxes)
+
+
+CID, HID, SIDE = 3, 1, 'right'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_dets', type=int, default=50000)
+    parser.add_argument('--num_frames', type=int, default=2000, help='frames to run')
+    parser.add_argument('--num_masks', type=int, default=50)
+    parser.add_argument('--clip_len', type=int, default=30)
+    parser.add_argument('--num_clips', type=int, default=1000)
+    args = parser.parse_args()
+    return args
+
+
+def synthetic_video(num_dets, rng):
+    """ ~5 detections per frame, in EPIC pixels, in random row order """
+    num_epic_frames = num_dets // 5
+    frames = rng.integers(0, num_epic_frames, num_dets)
+    det_type = np.where(rng.random(num_dets) < 0.5, 'hand', 'object')
+    W, H = EPIC_HOA_SIZE
+    x, y = rng.uniform(0, W * 0.8, num_dets), rng.uniform(0, H * 0.8, num_dets)
+    w, h = rng.uniform(50, 300, num_dets), rng.uniform(50, 300, num_dets)
+    side = np.where(rng.random(num_dets) < 0.5, 'left', 'right')
+    df = pd.DataFrame(dict(
+        video_id='P01_01', frame=frames, score=0.9,
+        left=x, right=x + w, top=y, bottom=y + h, det_type=det_type))
+    df['side'] = np.where(det_type == 'hand', side, None)
+    return df
+
+
+def synthetic_masks(num_masks, rng):
+    masks = []
+    for _ in range(num_masks):
+        mask = np.zeros(VISOR_SIZE[::-1], dtype=np.uint8)
+        for label, count in [(CID, 3), (HID, 1)]:
+            for _ in range(count):
+                cx, cy = rng.integers(40, VISOR_SIZE[0] - 40), rng.integers(40, VISOR_SIZE[1] - 40)
+                cv2.circle(mask, (int(cx), int(cy)), int(rng.integers(10, 40)), label, -1)
+        masks.append(mask)
+    return masks
+
+
+def legacy_boxes_from_mask(mask, size_mul=1.0, pad=2):
+    n_cls, mask = cv2.connectedComponents(mask, connectivity=8)
+    boxes = []
+    for c in range(1, n_cls):
+        h, w = mask.shape[:2]
+        y, x = np.nonzero(mask == c)
+        x0, x1 = max(x.min()-pad, 0), min(x.max()+pad, w-1)
+        y0, y1 = max(y.min()-pad, 0), min(y.max()+pad, h-1)
+        boxes.append(np.asarray([x0, y0, x1-x0, y1-y0], dtype=np.float32))
+    if len(boxes) == 0:
+        return np.empty((0, 4), dtype=np.float32)
+    return np.stack(boxes)  # merging skipped, it is cheap for a few boxes
+
+
+def legacy_hand_box(det_box, mask, hid):
+    H, W = mask.shape
+    x, y, bw, bh = det_box.astype(int)
+    pad = max(bw, bh) * HAND_MASK_KEEP_EXPAND / 2
+    x0, y0 = max(int(x - pad), 0), max(int(y - pad), 0)
+    x1, y1 = min(int(x + bw + pad), W-1), min(int(y + bh + pad), H-1)
+    crop_mask = np.zeros_like(mask)
+    crop_mask[y0:y1, x0:x1] = mask[y0:y1, x0:x1]
+    y, x = np.nonzero(crop_mask == hid)
+    if len(y) == 0:
+        return None
+    x0, x1 = max(x.min()-1, 0), min(x.max()+1, W-1)
+    y0, y1 = max(y.min()-1, 0), min(y.max()+1, H-1)
+    return np.asarray([x0, y0, x1-x0, y1-y0], dtype=np.float32)
+
+
+def legacy_frame(df, mask, epic_frame):
+    """ The old per-frame path: DataFrame filters and full-image masks per row """
+    obj_mask = np.where(mask == CID, CID, 0).astype(np.uint8)
+    boxes = legacy_boxes_from_mask(obj_mask)
+    if len(boxes) == 0:
+        return
+    hand_entries = df[(df.frame == epic_frame) & (df.det_type == 'hand') & (df.side == SIDE)]
+    if len(hand_entries) == 0:
+        return
+    row = hand_entries.iloc[0]
+    det_hand_box = np.asarray([row.left, row.top, row.right - row.left, row.bottom - row.top])
+    det_hand_box = det_hand_box / (EPIC_HOA_SIZE * 2) * (VISOR_SIZE * 2)
+    hand_mask = np.where(mask == HID, HID, 0).astype(np.uint8)
+    hand_box = legacy_hand_box(det_hand_box, hand_mask, HID)
+    hand_box = hand_box if hand_box is not None else det_hand_box
+    det_obj_entries = df[(df.frame == epic_frame) & (df.det_type == 'object')]
+    if len(det_obj_entries) == 1:
+        return  # IoU not timed
+    dists = [np.linalg.norm(b[:2] - hand_box[:2]) for b in boxes]
+    return boxes[int(np.argmin(dists))]
+
+
+def bench_frames(df, masks, args):
+    num_epic_frames = int(df.frame.max()) + 1
+    epic_frames = np.arange(args.num_frames) % num_epic_frames
+
+    st = time.time()
+    for i, epic_frame in enumerate(epic_frames):
+        legacy_frame(df, masks[i % len(masks)], epic_frame)
+    old = args.num_frames / (time.time() - st)
+
+    st = time.time()
+    dets = FrameDetections.from_dataframe(df)
+    build = time.time() - st
+    st = time.time()
+    for i, epic_frame in enumerate(epic_frames):
+        select_frame_boxes(masks[i % len(masks)], CID, HID, dets, epic_frame, SIDE)
+    new = args.num_frames / (time.time() - st)
+    print(f"{len(df)} detections, {args.num_frames} frames: "
+          f"per-row {old:7.1f} frames/s, columnar {new:7.1f} frames/s "
+          f"(+{build*1000:.0f} ms to sort once)")
+
+
+def bench_output(args):
+    num_clips = args.num_clips
+    box = np.float32([1, 2, 3, 4])
+    clips = [{f: {SIDE: box, 'cup': box} for f in range(c * args.clip_len, (c+1) * args.clip_len)}
+             for c in range(num_clips)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'boxes.pkl')
+        all_boxes = {'P01_01': dict()}
+        st = time.time()
+        for clip in clips:
+            all_boxes['P01_01'].update(clip)
+            with open(path, 'wb') as fp:
+                pickle.dump(all_boxes, fp)
+        rewrite = time.time() - st
+        st = time.time()
+        for clip in clips:
+            append_boxes(path + '.records', 'P01_01', clip)
+        append = time.time() - st
+    print(f"save after each of {num_clips} clips: rewrite {rewrite*1000:7.1f} ms, "
+          f"append {append*1000:7.1f} ms")
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    df = synthetic_video(args.num_dets, rng)
+    masks = synthetic_masks(args.num_masks, rng)
+    bench_frames(df, masks, args)
+    bench_output(args)
+
+
+if __name__ == '__main__':
+    main(parse_args())
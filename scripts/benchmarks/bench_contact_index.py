@@ -0,0 +1,63 @@
+""" Per-call overhead of the contact-region bookkeeping in loss_closeness / loss_insideness, on CPU.
+
+    python scripts/benchmarks/bench_contact_index.py --bsize 120
+
+old: reduce() flat list + list-comprehension region index + torch_scatter.scatter_min
+new: buffers from build_contact_index() + segment_min
+"""
+import argparse
+import time
+from functools import reduce
+import torch
+
+from homan.contact_prior import get_contact_regions, build_contact_index, segment_min
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bsize', type=int, default=120, help='N*T')
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+    return args
+
+
+def timeit(func, repeat):
+    func()
+    st = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - st) / repeat
+
+
+def main(args):
+    try:
+        from torch_scatter import scatter_min
+    except ImportError:
+        scatter_min = None
+    contact_regions = get_contact_regions()
+    contact_index = build_contact_index(contact_regions)
+    v_hand = torch.rand(args.bsize, 778, 3)
+
+    def old():
+        ph_idx = reduce(lambda a, b: a + b, contact_regions.verts, [])
+        prod = v_hand[:, ph_idx, :].sum(-1)
+        index = torch.cat(
+            [prod.new_zeros(len(v), dtype=torch.long) + i
+             for i, v in enumerate(contact_regions.verts)])
+        if scatter_min is not None:
+            return scatter_min(src=prod, index=index, dim=1)
+        return index
+
+    def new():
+        prod = v_hand[:, contact_index.flat, :].sum(-1)
+        return segment_min(prod, contact_index.pad_index, contact_index.pad_mask)
+
+    t_old = timeit(old, args.repeat)
+    t_new = timeit(new, args.repeat)
+    old_name = 'old' if scatter_min is not None else 'old (index only, no torch_scatter)'
+    print(f"B={args.bsize}: {old_name} {t_old*1e6:.1f}us/call, "
+          f"new {t_new*1e6:.1f}us/call, speedup {t_old / t_new:.2f}x")
+
+
+if __name__ == '__main__':
+    main(parse_args())
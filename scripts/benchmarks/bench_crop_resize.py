@@ -0,0 +1,64 @@
+""" batch_crop_resize (per-image PIL/torchvision loop) vs batch_crop_resize_grid (one grid_sample).
+
+    python scripts/benchmarks/bench_crop_resize.py --T 30 --device cuda
+"""
+import argparse
+import time
+import numpy as np
+import torch
+
+from nnutils.image_utils import batch_crop_resize, batch_crop_resize_grid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--T', type=int, default=30)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--out_size', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--device', type=str, default='cpu')
+    args = parser.parse_args()
+    return args
+
+
+def timeit(func, repeat, device):
+    func()  # warm-up
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    st = time.time()
+    for _ in range(repeat):
+        func()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.time() - st) / repeat
+
+
+def main(args):
+    T, H, W = args.T, args.height, args.width
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 255, size=(T, H, W, 3), dtype=np.uint8)
+    masks = torch.as_tensor(rng.integers(-1, 2, size=(T, H, W)))
+    sz = rng.integers(200, 700, size=T)
+    boxes = torch.as_tensor(np.stack([
+        rng.integers(-100, W - 100, size=T),
+        rng.integers(-100, H - 100, size=T), sz, sz], 1)).int()
+
+    cases = {
+        'images': (images, 'bilinear'),
+        'masks': (masks, 'nearest'),
+    }
+    for name, (src, mode) in cases.items():
+        t_loop = timeit(
+            lambda: batch_crop_resize(src, boxes, args.out_size), args.repeat, 'cpu')
+        t_grid = timeit(
+            lambda: batch_crop_resize_grid(
+                src, boxes, args.out_size, mode=mode, device=args.device),
+            args.repeat, args.device)
+        print(f"{name:>6s} T={T} {W}x{H}->{args.out_size}: "
+              f"loop {t_loop*1000:.1f}ms, grid({mode}, {args.device}) {t_grid*1000:.1f}ms, "
+              f"speedup {t_loop / t_grid:.1f}x")
+
+
+if __name__ == '__main__':
+    main(parse_args())
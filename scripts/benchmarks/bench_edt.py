@@ -0,0 +1,75 @@
+""" Edge distance transform of B reference masks, as built by PoseRenderer:
+scipy on a cpu copy, one mask at a time (old), vs the batched torch
+distance_transform_edt on cpu and cuda.
+
+    python scripts/benchmarks/bench_edt.py --bsize 30 --size 256
+"""
+import argparse
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from scipy.ndimage import distance_transform_edt as scipy_edt
+
+from nnutils.image_utils import distance_transform_edt
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bsize', type=int, default=30)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    return args
+
+
+def make_edges(bsize, size, device):
+    """ Edges (maxpool - mask) of random ellipses """
+    torch.manual_seed(0)
+    ys, xs = torch.meshgrid(
+        torch.linspace(-1, 1, size), torch.linspace(-1, 1, size), indexing='ij')
+    c = 0.4 * (torch.rand(bsize, 2, 1, 1) - 0.5)
+    r = 0.2 + 0.4 * torch.rand(bsize, 2, 1, 1)
+    mask = (((xs - c[:, 0]) / r[:, 0])**2 + ((ys - c[:, 1]) / r[:, 1])**2 < 1).float()
+    mask = mask.to(device)
+    return F.max_pool2d(mask[:, None], 7, stride=1, padding=3)[:, 0] - mask
+
+
+def timeit(fn, repeat, sync=False):
+    fn()  # warm-up
+    if sync:
+        torch.cuda.synchronize()
+    st = time.time()
+    for _ in range(repeat):
+        out = fn()
+    if sync:
+        torch.cuda.synchronize()
+    return (time.time() - st) / repeat, out
+
+
+def main(args):
+    edges = make_edges(args.bsize, args.size, 'cpu')
+
+    def run_scipy():
+        e = edges.numpy()
+        return np.stack([scipy_edt(1 - (v > 0)) for v in e])
+
+    t_scipy, ref = timeit(run_scipy, args.repeat)
+    t_cpu, out = timeit(lambda: distance_transform_edt(edges <= 0), args.repeat)
+    print(f"B={args.bsize}, {args.size}x{args.size}")
+    print(f"  scipy, per mask: {t_scipy*1000:8.1f} ms")
+    print(f"  torch cpu:       {t_cpu*1000:8.1f} ms, "
+          f"max |diff| {np.abs(out.numpy() - ref).max():.2e}")
+    if torch.cuda.is_available():
+        edges_cuda = edges.cuda()
+        # the old path also copies the edges from the device
+        t_copy, _ = timeit(lambda: edges_cuda.cpu(), args.repeat, sync=True)
+        t_cuda, out = timeit(
+            lambda: distance_transform_edt(edges_cuda <= 0), args.repeat, sync=True)
+        print(f"  torch cuda:      {t_cuda*1000:8.1f} ms "
+              f"({(t_scipy + t_copy) / t_cuda:.1f}x vs scipy + copy), "
+              f"max |diff| {np.abs(out.cpu().numpy() - ref).max():.2e}")
+
+
+if __name__ == '__main__':
+    main(parse_args())
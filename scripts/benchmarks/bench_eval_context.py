@@ -0,0 +1,119 @@
+""" Candidate evaluation of a full clip (num_inits inits, in batches of num_inits_parallel):
+EvalHelper.register_batch() re-targeting the training forwarder to eval frames and
+evaluating one init at a time (old) vs the frozen eval context (new).
+
+    python scripts/benchmarks/bench_eval_context.py --num_inits 510 --num_inits_parallel 30
+
+Both include switching the forwarder back to training data for the next batch,
+as fit_scene() does. Optimization itself is not run, the inits are random poses.
+"""
+import argparse
+import time
+import torch
+from pytorch3d.transforms import matrix_to_rotation_6d, random_rotations
+
+from config.epic_constants import REND_SIZE
+from homan.mvho_forwarder import MVHOVis
+from temporal.optim_multiview import EvalHelper
+from scripts.benchmarks.mvho_synthetic import make_mvho, make_hand_data
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_inits', type=int, default=510)
+    parser.add_argument('--num_inits_parallel', type=int, default=30)
+    parser.add_argument('--train_size', type=int, default=4)
+    parser.add_argument('--num_eval', type=int, default=30)
+    parser.add_argument('--eval_chunk', type=int, default=4)
+    parser.add_argument('--cat', type=str, default='bottle')
+    args = parser.parse_args()
+    return args
+
+
+def register_batch_old(helper: EvalHelper, homan, num_inits_parallel):
+    """ EvalHelper.register_batch() before the eval context, returns (ious, max_min_dists) """
+    R_train = homan.rotations_object.detach().clone()
+    T_train = homan.translations_object.detach().clone()
+    s_train = homan.scale_object.detach().clone()
+    helper.set_eval_forwarder(homan)
+    ious, dists = [], []
+    for i in range(num_inits_parallel):
+        homan.set_obj_transform(
+            translations_object=T_train[[i]],
+            rotations_object=R_train[[i]],
+            scale_object=s_train[[i]])
+        with torch.no_grad():
+            metrics = homan.eval_metrics()
+        ious.append(metrics['oious'].mean(0).item())
+        dists.append(metrics['max_min_dist'])
+    return ious, dists
+
+
+def make_helper(args, homan) -> EvalHelper:
+    helper = EvalHelper()
+    helper.num_eval = args.num_eval
+    helper.eval_chunk = args.eval_chunk
+    helper.eval_hand_data = make_hand_data(1, args.num_eval, seed=1)
+    helper.eval_image_patch = None
+    # object silhouettes at a random pose as eval targets
+    homan.set_size(1, args.num_eval)
+    homan.set_hand_data(helper.eval_hand_data)
+    homan.set_obj_transform(
+        translations_object=torch.zeros(1, 1, 3, device='cuda'),
+        rotations_object=matrix_to_rotation_6d(random_rotations(1)).cuda(),
+        scale_object=torch.ones(1, device='cuda'))
+    with torch.no_grad():
+        helper.eval_target_masks_object = homan.render_obj(homan.get_verts_object())
+    return helper
+
+
+def run(args, use_context: bool):
+    N, T = args.num_inits_parallel, args.train_size
+    torch.manual_seed(0)
+    homan = make_mvho(MVHOVis, N, T, cat=args.cat)
+    train_hand_data = make_hand_data(N, T)
+    train_masks = torch.zeros(N * T, REND_SIZE, REND_SIZE, device='cuda')
+    helper = make_helper(args, homan)
+    rots = matrix_to_rotation_6d(random_rotations(args.num_inits)).cuda()
+    transl = 0.05 * torch.randn(args.num_inits, 1, 3, device='cuda')
+
+    torch.cuda.synchronize()
+    st = time.time()
+    ious, dists = [], []
+    for n_start in range(0, args.num_inits, N):
+        n_end = min(n_start + N, args.num_inits)
+        # back to training data, as fit_scene() per batch
+        homan.set_size(n_end - n_start, T)
+        homan.set_hand_data(train_hand_data[:(n_end - n_start) * T])
+        homan.set_obj_target(train_masks[:(n_end - n_start) * T], check_shape=False)
+        homan.set_obj_transform(
+            translations_object=transl[n_start:n_end],
+            rotations_object=rots[n_start:n_end],
+            scale_object=torch.ones(n_end - n_start, device='cuda'))
+        if use_context:
+            helper.register_batch(homan, 0, n_end - n_start)
+        else:
+            i, d = register_batch_old(helper, homan, n_end - n_start)
+            ious += i
+            dists += d
+    torch.cuda.synchronize()
+    elapsed = time.time() - st
+    if use_context:
+        ious = [v.iou for v in helper.eval_results]
+        dists = [v.max_min_dist for v in helper.eval_results]
+    return elapsed, torch.as_tensor(ious), torch.as_tensor(dists)
+
+
+def main(args):
+    run(args, True)  # warm-up
+    t_old, iou_old, dist_old = run(args, False)
+    t_new, iou_new, dist_new = run(args, True)
+    print(f"{args.num_inits} inits, eval on {args.num_eval} frames")
+    print(f"  per-init, re-targeted forwarder: {t_old:.2f} s/clip")
+    print(f"  eval context (chunk {args.eval_chunk}):   {t_new:.2f} s/clip ({t_old / t_new:.2f}x)")
+    print(f"  max |diff| iou {(iou_old - iou_new).abs().max():.2e}, "
+          f"max_min_dist {(dist_old - dist_new).abs().max():.2e}")
+
+
+if __name__ == '__main__':
+    main(parse_args())
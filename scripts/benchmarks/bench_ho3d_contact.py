@@ -0,0 +1,108 @@
+""" items/s of the HO3D hand-object distance on synthetic annotations and object meshes,
+the per-item loop of ho3d_pre.closest_dist vs the batched ho3d_contact.contact_table.
+
+    python scripts/benchmarks/bench_ho3d_contact.py --num_items 256 --num_points 5000
+"""
+import argparse
+import os
+import os.path as osp
+import pickle
+import tempfile
+import time
+import numpy as np
+import torch
+import trimesh
+from pytorch3d.ops.sample_points_from_meshes import sample_points_from_meshes
+
+from nnutils import geom_utils, mesh_utils
+from nnutils.hand_utils import ManopthWrapper, cvt_axisang_t_i2o
+from preprocess.ho3d_contact import contact_table, meta_path
+
+
+OBJ_NAMES = ['003_cracker_box', '006_mustard_bottle', '021_bleach_cleanser']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_items', type=int, default=256)
+    parser.add_argument('--num_points', type=int, default=5000,
+                        help='per mesh, the dense (K, M) of the loop grows as its square')
+    parser.add_argument('--batch_size', type=int, default=64)
+    parser.add_argument('--num_workers', type=int, default=16)
+    parser.add_argument('--device', type=str, default='cpu')
+    args = parser.parse_args()
+    return args
+
+
+def synthetic_split(data_dir, shape_dir, num_items, rng):
+    """ meta pkls of one evaluation video and one mesh per object name """
+    for i, name in enumerate(OBJ_NAMES):
+        mesh = trimesh.creation.box(extents=[0.05 + 0.03 * i, 0.08, 0.2])
+        os.makedirs(osp.join(shape_dir, 'models', name))
+        mesh.export(osp.join(shape_dir, 'models', name, 'textured_simple.obj'))
+    index_list = ['MC1/%04d' % i for i in range(num_items)]
+    os.makedirs(osp.dirname(meta_path(data_dir, 'evaluation', index_list[0])))
+    for i, index in enumerate(index_list):
+        anno = dict(
+            handPose=rng.normal(0, 0.3, 48).astype(np.float32),
+            handTrans=np.float32([0, 0, 0.5]) + rng.normal(0, 0.05, 3).astype(np.float32),
+            objRot=rng.normal(0, 1, (3, 1)).astype(np.float32),
+            objTrans=np.float32([[0.1], [0], [0.5]]) + rng.normal(0, 0.05, (3, 1)).astype(np.float32),
+            objName=OBJ_NAMES[i % len(OBJ_NAMES)])
+        with open(meta_path(data_dir, 'evaluation', index), 'wb') as fp:
+            pickle.dump(anno, fp)
+    return index_list
+
+
+@torch.no_grad()
+def legacy_closest_dist(index, data_dir, shape_dir, hand_wrapper, num_points, device):
+    """ ho3d_pre.closest_dist """
+    with open(meta_path(data_dir, 'evaluation', index), 'rb') as fp:
+        anno = pickle.load(fp)
+    fname = osp.join(shape_dir, 'models', anno['objName'], 'textured_simple.obj')
+    mesh = mesh_utils.load_mesh(fname, scale_verts=1).to(device)
+
+    pose = torch.FloatTensor(anno['handPose'][None]).to(device)
+    trans = torch.FloatTensor(anno['handTrans'][None]).to(device)
+    hA = pose[..., 3:]
+    rot, trans = cvt_axisang_t_i2o(pose[..., :3], trans)
+    wTh = geom_utils.axis_angle_t_to_matrix(rot, trans)
+    wTo = geom_utils.axis_angle_t_to_matrix(
+        torch.FloatTensor(anno['objRot'].reshape(1, 3)),
+        torch.FloatTensor(anno['objTrans'].reshape(1, 3))).to(device)
+    hTo = geom_utils.inverse_rt(mat=wTh, return_mat=True) @ wTo
+    cTw = geom_utils.rt_to_homo(torch.FloatTensor([[[1, 0, 0], [0, -1, 0], [0, 0, -1]]]).to(device))
+    cTh = cTw @ wTh
+    cHand, _ = hand_wrapper(geom_utils.matrix_to_se3(cTh), hA)
+    cMesh = mesh_utils.apply_transform(mesh, cTh @ hTo)
+    cObj = sample_points_from_meshes(cMesh, num_points)
+    cHand = sample_points_from_meshes(cHand, num_points)
+    dist = torch.min(((cObj - cHand.transpose(0, 1)) ** 2).sum(-1).sqrt())
+    return dist.item() * 1000
+
+
+def main(args):
+    hand_wrapper = ManopthWrapper(side='right').to(args.device)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir, shape_dir = osp.join(tmp, 'HO3D'), osp.join(tmp, 'ho3dobj')
+        index_list = synthetic_split(data_dir, shape_dir, args.num_items, np.random.default_rng(0))
+
+        st = time.time()
+        legacy = [legacy_closest_dist(index, data_dir, shape_dir, hand_wrapper, args.num_points, args.device)
+                  for index in index_list]
+        loop = args.num_items / (time.time() - st)
+
+        st = time.time()
+        df = contact_table(index_list, 'evaluation', data_dir, shape_dir, hand_wrapper, args.device,
+                           args.num_points, args.batch_size, args.num_workers)
+        batched = args.num_items / (time.time() - st)
+
+    diff = np.abs(df['dist'].values - np.asarray(legacy))
+    print(f"{args.num_items} items, {args.num_points} points per mesh")
+    print(f"per-item loop: {loop:.1f} items/s")
+    print(f"batched: {batched:.1f} items/s, speedup {batched / loop:.1f}x")
+    print(f"|dist - loop dist|: median {np.median(diff):.2f} mm, max {diff.max():.2f} mm (both sample points)")
+
+
+if __name__ == '__main__':
+    main(parse_args())
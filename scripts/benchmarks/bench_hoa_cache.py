@@ -0,0 +1,80 @@
+""" Load time of one video's EPIC hand-object detections and the time of a hand box lookup,
+protobuf pickle -> DataFrame (epichoa.load_video_hoa) vs the memory-mapped hoa_cache.
+
+    python scripts/benchmarks/bench_hoa_cache.py --num_frames 50000 --num_lookups 2000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+from datasets.epic_lib import epichoa, hoaio
+from datasets.epic_lib.hoa_cache import VideoHOA, convert_video
+from datasets.epic_lib.types import (
+    BBox, FloatVector, FrameDetections, HandDetection, HandSide, HandState,
+    ObjectDetection)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_frames', type=int, default=50000)
+    parser.add_argument('--num_lookups', type=int, default=2000)
+    args = parser.parse_args()
+    return args
+
+
+def synthetic_detections(video_id, num_frames, rng):
+    """ 2 objects and 2 hands per frame """
+    def bbox():
+        x, y = rng.uniform(0, 0.8, 2)
+        return BBox(left=x, top=y, right=x + 0.1, bottom=y + 0.1)
+
+    return [
+        FrameDetections(
+            video_id=video_id, frame_number=frame,
+            objects=[ObjectDetection(bbox=bbox(), score=0.9) for _ in range(2)],
+            hands=[HandDetection(bbox=bbox(), score=0.9, state=HandState.PORTABLE_OBJECT,
+                                 side=HandSide(s), object_offset=FloatVector(0.01, 0.01))
+                   for s in range(2)])
+        for frame in range(1, num_frames + 1)]
+
+
+def timed(fn, *args, **kwargs):
+    st = time.time()
+    out = fn(*args, **kwargs)
+    return out, time.time() - st
+
+
+def main(args):
+    vid = 'P01_01'
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        hoa_root, cache_root = Path(tmp) / 'hoa', Path(tmp) / 'hoa_cache'
+        hoaio.save_detections(
+            synthetic_detections(vid, args.num_frames, rng), hoa_root / 'P01' / f'{vid}.pkl')
+
+        df, t_pb = timed(epichoa.load_video_hoa.__wrapped__, vid, hoa_root)
+        _, t_convert = timed(convert_video, vid, hoa_root, cache_root)
+        hoa, t_open = timed(VideoHOA, vid, cache_root)
+        _, t_df = timed(hoa.to_dataframe)
+        print(f"{args.num_frames} frames, {len(df)} detections")
+        print(f"load: protobuf -> DataFrame {t_pb*1000:8.1f} ms | "
+              f"convert once {t_convert*1000:8.1f} ms | "
+              f"cache mmap {t_open*1000:6.2f} ms, cache -> DataFrame {t_df*1000:6.1f} ms")
+
+        frames = rng.integers(1, args.num_frames + 1, args.num_lookups)
+        st = time.time()
+        for frame in frames:
+            df[(df.frame == frame) & (df.det_type == 'hand') & (df.side == 'right')]
+        t_filter = (time.time() - st) / args.num_lookups
+        st = time.time()
+        for frame in frames:
+            hoa.hand_box(frame, 'right')
+        t_lookup = (time.time() - st) / args.num_lookups
+        print(f"hand box lookup: DataFrame filter {t_filter*1e6:8.1f} us, "
+              f"cache {t_lookup*1e6:6.1f} us")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,67 @@
+""" Per-iteration cost of the pose search (PoseRenderer forward_backward + Adam)
+with the default object mesh and each level of detail of OBJLoader,
+and the Hausdorff distance of each level to the default mesh.
+
+    python scripts/benchmarks/bench_lod.py --cat bottle --num_inits 500
+"""
+import argparse
+import time
+import numpy as np
+import torch
+
+from obj_pose.obj_loader import OBJLoader
+from obj_pose.quadric_decimation import hausdorff
+from scripts.benchmarks.bench_pose_renderer_chunks import make_model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cat', type=str, default='bottle')
+    parser.add_argument('--num_inits', type=int, default=500)
+    parser.add_argument('--bsize', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=10)
+    args = parser.parse_args()
+    return args
+
+
+def time_step(obj, args):
+    model = make_model(obj, args.bsize, args.num_inits, chunk_size=None)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+
+    def step():
+        optimizer.zero_grad()
+        model.forward_backward()
+        optimizer.step()
+
+    step()  # warm-up
+    torch.cuda.synchronize()
+    st = time.time()
+    for _ in range(args.steps):
+        step()
+    torch.cuda.synchronize()
+    return (time.time() - st) / args.steps
+
+
+def main(args):
+    loader = OBJLoader()
+    default = loader.load_obj_by_name(args.cat)
+    diag = np.linalg.norm(default.vertices.max(0) - default.vertices.min(0))
+    meshes = [('default', default)]
+    for lod in range(len(loader.lod_levels)):
+        st = time.time()
+        mesh = loader.load_obj_by_name(args.cat, lod=lod)
+        print(f"lod {lod}: loaded in {time.time() - st:.2f}s (decimated on first use)")
+        meshes.append((f'lod {lod}', mesh))
+
+    print(f"{args.cat}, N={args.num_inits}, B={args.bsize}")
+    for name, mesh in meshes:
+        per_step = time_step(mesh, args)
+        dist = hausdorff(
+            (default.vertices, default.faces), (mesh.vertices, mesh.faces)) / diag
+        print(f"  {name:>7s}: {len(mesh.vertices):5d} verts {len(mesh.faces):5d} faces, "
+              f"{per_step*1000:7.1f} ms/iter, hausdorff to default {dist:.4f} x diag")
+        torch.cuda.empty_cache()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,58 @@
+""" Per-step cost of MVHOImpl.train_loss() + backward with object normals
+recomputed from v_obj every step (old) vs canonical normals rotated (rigid_obj_normals).
+
+    python scripts/benchmarks/bench_mvho_normals.py --num_inits_parallel 30 --train_size 4
+"""
+import argparse
+import time
+import torch
+from omegaconf import OmegaConf
+from torch.profiler import profile, record_function, ProfilerActivity
+
+from homan.mvho_forwarder import MVHOImpl
+from scripts.benchmarks.mvho_synthetic import make_mvho
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_inits_parallel', type=int, default=30)
+    parser.add_argument('--train_size', type=int, default=4)
+    parser.add_argument('--cat', type=str, default='bottle')
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--row_limit', type=int, default=12)
+    args = parser.parse_args()
+    return args
+
+
+def run_steps(mvho, optim_cfg, steps):
+    optimizer = torch.optim.Adam(
+        [mvho.rotations_object, mvho.translations_object, mvho.scale_object], lr=optim_cfg.lr)
+    for _ in range(steps):
+        with record_function('train_step'):
+            optimizer.zero_grad()
+            loss = mvho.train_loss(optim_cfg)
+            loss.backward()
+            optimizer.step()
+    torch.cuda.synchronize()
+
+
+def main(args):
+    optim_cfg = OmegaConf.load('config/conf_multiview.yaml').optim_mv
+    N, T = args.num_inits_parallel, args.train_size
+    mvho = make_mvho(MVHOImpl, N, T, cat=args.cat)
+    for rigid in (False, True):
+        mvho.rigid_obj_normals = rigid
+        run_steps(mvho, optim_cfg, 3)  # warm-up
+        st = time.time()
+        run_steps(mvho, optim_cfg, args.steps)
+        per_step = (time.time() - st) / args.steps
+        with profile(activities=[ProfilerActivity.CPU, ProfilerActivity.CUDA]) as prof:
+            run_steps(mvho, optim_cfg, args.steps)
+        name = 'rigid (rotate canonical)' if rigid else 'recompute'
+        print(f"=== {name}: N*T={N*T}, {per_step*1000:.2f} ms/step ===")
+        print(prof.key_averages().table(
+            sort_by='cuda_time_total', row_limit=args.row_limit))
+
+
+if __name__ == '__main__':
+    main(parse_args())
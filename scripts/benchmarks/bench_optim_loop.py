@@ -0,0 +1,107 @@
+""" Steps saved and final-loss change of convergence-aware stopping (temporal/optim_loop.py)
+in smooth_hand_pose / optimize_hand, on synthetic hand targets.
+
+    python scripts/benchmarks/bench_optim_loop.py --num_trials 10 --device cuda
+
+Each trial: T frames of a MANO hand with a random pca pose, target vertices from a jittered
+rotation / translation, optimized from a perturbed start.
+"""
+import argparse
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+
+from homan.homan_ManoModel import HomanManoModel
+from temporal.optim_loop import StopCriteria
+from temporal.optim_plan import smooth_hand_pose, optimize_hand
+
+
+class SyntheticHand(nn.Module):
+    """ Same interface as LiteHandModule for smooth_hand_pose() and optimize_hand(),
+    with vertex L2 to a target in place of the silhouette loss. """
+    def __init__(self, mano, num_frames, seed, device):
+        super().__init__()
+        g = torch.Generator().manual_seed(seed)
+        self.mano = mano
+        pca = torch.randn(1, 45, generator=g).expand(num_frames, -1)
+        rot = 0.3 * torch.randn(num_frames, 3, generator=g)
+        transl = 0.05 * torch.randn(num_frames, 1, 3, generator=g)
+        with torch.no_grad():
+            v, _ = mano.forward_pca(pca.to(device), rot=rot.to(device))
+        self.register_buffer('target', v + transl.to(device))
+        self.mano_pca_pose = nn.Parameter(
+            (pca + 0.3 * torch.randn(num_frames, 45, generator=g)).to(device))
+        self.rotations_hand = nn.Parameter(
+            (rot + 0.2 * torch.randn(num_frames, 3, generator=g)).to(device))
+        self.translations_hand = nn.Parameter(
+            (transl + 0.02 * torch.randn(num_frames, 1, 3, generator=g)).to(device))
+
+    def loss_pca_interpolation(self) -> torch.Tensor:
+        target = (self.mano_pca_pose[2:] + self.mano_pca_pose[:-2]) / 2
+        pred = self.mano_pca_pose[1:-1]
+        return torch.sum((target - pred)**2, dim=(1))
+
+    def forward_hand(self):
+        v, _ = self.mano.forward_pca(
+            self.mano_pca_pose.detach(), rot=self.rotations_hand)
+        v = v + self.translations_hand
+        losses = {
+            'sil': 1e3 * ((v - self.target)**2).sum(-1).mean(-1).sum(),
+            'pca': self.loss_pca_interpolation().sum(),
+        }
+        return sum(losses.values()), losses
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_trials', type=int, default=10)
+    parser.add_argument('--num_frames', type=int, default=30)
+    parser.add_argument('--device', type=str, default='cpu')
+    args = parser.parse_args()
+    return args
+
+
+def run(mano, args, seed, smooth_stop, hand_stop):
+    hand = SyntheticHand(mano, args.num_frames, seed, args.device)
+    st = time.time()
+    hand = smooth_hand_pose(hand, lr=0.1, stop=smooth_stop)
+    smooth_records = hand.loss_records
+    hand = optimize_hand(hand, verbose=False, stop=hand_stop)
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return dict(
+        time=time.time() - st,
+        smooth_steps=smooth_records['steps'],
+        smooth_loss=smooth_records['total'][-1],
+        hand_steps=hand.loss_records['steps'],
+        hand_loss=hand.loss_records['total'][-1])
+
+
+def main(args):
+    mano = HomanManoModel('externals/mano', side='right', pca_comps=45).to(args.device)
+    # old behaviour: threshold only for smoothing, all 100 steps for optimize_hand
+    old_cfg = (StopCriteria(check_every=1, rel_tol=0, abs_tol=1e-3), StopCriteria(rel_tol=0))
+    # defaults: plateau stopping in both, checked every 10 steps
+    new_cfg = (StopCriteria(abs_tol=1e-3), StopCriteria())
+    rows = []
+    for seed in range(args.num_trials):
+        old = run(mano, args, seed, *old_cfg)
+        new = run(mano, args, seed, *new_cfg)
+        rows.append((old, new))
+
+    def col(which, key):
+        return np.asarray([r[which][key] for r in rows])
+
+    for phase in ['smooth', 'hand']:
+        old_steps, new_steps = col(0, f'{phase}_steps'), col(1, f'{phase}_steps')
+        old_loss, new_loss = col(0, f'{phase}_loss'), col(1, f'{phase}_loss')
+        rel = (new_loss - old_loss) / np.maximum(np.abs(old_loss), 1e-12)
+        print(f"{phase:>6s}: steps {old_steps.mean():.1f} -> {new_steps.mean():.1f} "
+              f"({1 - new_steps.sum() / old_steps.sum():.0%} saved), "
+              f"final loss rel. delta mean {rel.mean():+.2e} max {rel.max():+.2e}")
+    print(f"  time: {col(0, 'time').mean()*1000:.0f}ms -> {col(1, 'time').mean()*1000:.0f}ms per trial")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,63 @@
+""" items/s of the point-cloud part of SdfImg.__getitem__:
+sample_points_from_meshes + get_nTh per item vs point bank window + cached nTh.
+
+    python scripts/benchmarks/bench_point_bank.py --mesh weights/obj_models/bowl.obj
+"""
+import argparse
+import os.path as osp
+import tempfile
+import time
+import numpy as np
+import torch
+import pytorch3d.ops as op_3d
+
+from datasets.point_bank import SurfacePointBank, build_point_bank
+from nnutils import mesh_utils
+from nnutils.hand_utils import ManopthWrapper, get_nTh
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mesh', type=str, default='weights/obj_models/bowl.obj')
+    parser.add_argument('--subsample', type=int, default=8192)
+    parser.add_argument('--K', type=int, default=8)
+    parser.add_argument('--num_items', type=int, default=200)
+    parser.add_argument('--radius', type=float, default=0.2)
+    args = parser.parse_args()
+    return args
+
+
+def main(args):
+    mesh = mesh_utils.load_mesh(args.mesh, scale_verts=1)
+    hand_wrapper = ManopthWrapper(side='right').to('cpu')
+    hA = torch.zeros([args.num_items, 45])
+    num = args.subsample * 2
+
+    st = time.time()
+    for i in range(args.num_items):
+        op_3d.sample_points_from_meshes(mesh, num, return_textures=True)
+        get_nTh(hand_wrapper, hA[[i]], args.radius)
+    on_the_fly = args.num_items / (time.time() - st)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prefix = osp.join(tmp_dir, 'bank')
+        st = time.time()
+        build_point_bank({'cad': mesh}, args.K * args.subsample, prefix)
+        with torch.no_grad():
+            nTh_all = get_nTh(hand_wrapper, hA, args.radius)
+        build_time = time.time() - st
+        bank = SurfacePointBank(prefix)
+
+        st = time.time()
+        for i in range(args.num_items):
+            bank.read('cad', num)
+            nTh_all[i]
+        banked = args.num_items / (time.time() - st)
+
+    print(f"on-the-fly: {on_the_fly:.1f} items/s")
+    print(f"point bank: {banked:.1f} items/s (one-off build {build_time:.2f}s), "
+          f"speedup {banked / on_the_fly:.1f}x")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,95 @@
+""" Peak memory and throughput of one PoseRenderer optimization step
+(forward_backward + Adam) with all inits at once vs in chunks.
+
+    python scripts/benchmarks/bench_pose_renderer_chunks.py --num_inits 500 2000 8000 --chunk_sizes 0 250 1000
+
+chunk size 0 means all inits at once (the old behaviour).
+"""
+import argparse
+import time
+import torch
+from pytorch3d.transforms import matrix_to_rotation_6d
+
+from homan.utils.geometry import compute_random_rotations
+from obj_pose.obj_loader import OBJLoader
+from obj_pose.pose_renderer import PoseRenderer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_inits', type=int, nargs='+', default=[500, 2000, 8000])
+    parser.add_argument('--chunk_sizes', type=int, nargs='+', default=[0, 250, 1000])
+    parser.add_argument('--bsize', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--cat', type=str, default='bottle')
+    args = parser.parse_args()
+    return args
+
+
+def make_model(obj, bsize, num_init, chunk_size):
+    torch.manual_seed(0)
+    w = 256
+    ref = torch.zeros(bsize, w, w, device='cuda')
+    ref[:, 80:176, 96:160] = 1
+    rots = compute_random_rotations(num_init, upright=False, device='cuda')
+    transl = torch.tensor([[[0.0, 0.0, 0.6]]], device='cuda') \
+        + 0.05 * torch.randn(num_init, 1, 3, device='cuda')
+    K = torch.tensor([[1., 0, 0.5], [0, 1., 0.5], [0, 0, 1.]], device='cuda')
+    return PoseRenderer(
+        ref_image=ref,
+        vertices=torch.as_tensor(obj.vertices, dtype=torch.float32, device='cuda'),
+        faces=torch.as_tensor(obj.faces, device='cuda'),
+        rotation_init=matrix_to_rotation_6d(rots),
+        translation_init=transl,
+        num_initializations=num_init,
+        camera_K=K.expand(bsize, 3, 3).contiguous(),
+        base_rotation=torch.eye(3, device='cuda').repeat(bsize, 1, 1),
+        base_translation=torch.zeros(bsize, 1, 3, device='cuda'),
+        chunk_size=chunk_size or None)
+
+
+def run(obj, args, num_init, chunk_size):
+    model = make_model(obj, args.bsize, num_init, chunk_size)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+
+    def step():
+        optimizer.zero_grad()
+        model.forward_backward()
+        optimizer.step()
+
+    step()  # warm-up
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    base = torch.cuda.memory_allocated()
+    st = time.time()
+    for _ in range(args.steps):
+        step()
+    torch.cuda.synchronize()
+    per_step = (time.time() - st) / args.steps
+    peak = torch.cuda.max_memory_allocated() - base
+    return per_step, peak
+
+
+def main(args):
+    obj = OBJLoader().load_obj_by_name(args.cat)
+    print(f"B={args.bsize}, {args.cat}: {len(obj.vertices)} verts, {len(obj.faces)} faces")
+    for num_init in args.num_inits:
+        for chunk_size in args.chunk_sizes:
+            if chunk_size >= num_init:
+                continue
+            name = 'all' if chunk_size == 0 else str(chunk_size)
+            try:
+                per_step, peak = run(obj, args, num_init, chunk_size)
+            except RuntimeError as e:
+                if 'out of memory' not in str(e):
+                    raise
+                torch.cuda.empty_cache()
+                print(f"N={num_init:5d} chunk={name:>5s}: out of memory")
+                continue
+            print(f"N={num_init:5d} chunk={name:>5s}: peak {peak / 2**30:6.2f} GB, "
+                  f"{num_init / per_step:8.0f} inits/s ({per_step*1000:.0f} ms/step)")
+            torch.cuda.empty_cache()
+
+
+if __name__ == '__main__':
+    main(parse_args())
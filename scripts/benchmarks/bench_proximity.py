@@ -0,0 +1,77 @@
+""" Forward + backward of the hand-object nearest-neighbour queries in MVHOImpl.train_loss.
+
+    python scripts/benchmarks/bench_proximity.py --device cuda
+
+old: knn_points(contact, obj) + knn_points(obj, contact) + compute_nearest_dist(obj, hand)
+new: one HandObjectProximity over contact points
+"""
+import argparse
+import time
+import torch
+from pytorch3d.ops import knn_points
+
+from homan.contact_prior import get_contact_regions, build_contact_index
+from homan.lossutils import compute_nearest_dist
+from homan.proximity import HandObjectProximity
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bsize', type=int, default=120, help='N*T')
+    parser.add_argument('--num_obj_verts', type=int, default=500)
+    parser.add_argument('--k1', type=int, default=1, help='closeness')
+    parser.add_argument('--k2', type=int, default=3, help='insideness')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--device', type=str, default='cpu')
+    args = parser.parse_args()
+    return args
+
+
+def timeit(func, repeat, device):
+    func()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    st = time.time()
+    for _ in range(repeat):
+        func()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.time() - st) / repeat
+
+
+def main(args):
+    device = args.device
+    contact_verts = build_contact_index(get_contact_regions()).flat.to(device)
+    offset = torch.tensor([0, 0, 0.5], device=device)
+    v_hand = 0.05 * torch.randn(args.bsize, 778, 3, device=device) + offset
+    v_obj = 0.05 * torch.randn(args.bsize, args.num_obj_verts, 3, device=device) + offset
+    v_obj.requires_grad_(True)
+
+    def old(metric):
+        ph = v_hand[:, contact_verts, :]
+        _, _, nn1 = knn_points(ph, v_obj, K=args.k1, return_nn=True)
+        _, _, nn2 = knn_points(v_obj, ph, K=args.k2, return_nn=True)
+        loss = nn1.sum() + (v_obj.unsqueeze(2) - nn2).sum()
+        if metric:
+            compute_nearest_dist(v_obj, v_hand).max().item()
+        loss.backward()
+
+    def new(metric):
+        prox = HandObjectProximity(v_hand[:, contact_verts, :], v_obj)
+        _, nn1 = prox.hand_to_obj(k=args.k1)
+        _, nn2 = prox.obj_to_hand(k=args.k2)
+        loss = nn1.sum() + (v_obj.unsqueeze(2) - nn2).sum()
+        if metric:
+            prox.nearest_dist().max().item()
+        loss.backward()
+
+    for metric in (False, True):
+        t_old = timeit(lambda: old(metric), args.repeat, device)
+        t_new = timeit(lambda: new(metric), args.repeat, device)
+        name = 'with print_metric' if metric else 'losses only'
+        print(f"{device} B={args.bsize} Vo={args.num_obj_verts} C={len(contact_verts)} {name}: "
+              f"old {t_old*1000:.2f}ms, new {t_new*1000:.2f}ms, speedup {t_old / t_new:.2f}x")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,74 @@
+""" Number of rotation inits per category in config/conf_multiview.yaml,
+as configured (num_inits upright/spiral rotations), after dropping
+the ones within --dedup_angles of an earlier one under the category symmetry,
+and with the 'symmetric' method at --resolutions.
+
+    python scripts/benchmarks/bench_rot_hypotheses.py --dedup_angles 5 10 15 --resolutions 15 20 30
+"""
+import argparse
+import math
+import time
+import torch
+from omegaconf import OmegaConf
+
+from homan.utils.geometry import (
+    generate_rotations, random_avro_rotations, symmetric_geodesic)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default='config/conf_multiview.yaml')
+    parser.add_argument('--dedup_angles', type=float, nargs='+', default=[5, 10, 15])
+    parser.add_argument('--resolutions', type=float, nargs='+', default=[15, 20, 30])
+    parser.add_argument('--num_queries', type=int, default=20000)
+    parser.add_argument('--device', type=str, default='cpu')
+    args = parser.parse_args()
+    return args
+
+
+def max_gap(rots, queries, symmetry) -> float:
+    """ in degrees, estimated from random queries """
+    dists = [symmetric_geodesic(q, rots, symmetry).min(dim=1).values
+             for q in queries.split(4096)]
+    return math.degrees(torch.cat(dists).max())
+
+
+def count(rot_init: dict, device):
+    st = time.time()
+    num = len(generate_rotations(rot_init, device=device))
+    return num, time.time() - st
+
+
+def main(args):
+    cfg = OmegaConf.load(args.config)
+    num_inits = cfg.optim_mv.num_inits
+    queries = random_avro_rotations(args.num_queries, args.device)
+    print(f"num_inits={num_inits}")
+    for cat, rot_init in cfg.homan.rot_init.items():
+        rot_init = OmegaConf.to_container(rot_init)
+        symmetry = rot_init.get('symmetry', None)
+        if rot_init['method'] in ('spiral', 'upright'):
+            rot_init['num_sphere_pts'] = num_inits // rot_init['num_sym_rots']
+        rot_init['dedup_angle'] = None
+        num, _ = count(rot_init, args.device)
+        line = f"{cat:15s} {str(symmetry):10s} {rot_init['method']:8s} {num:5d}"
+        for angle in args.dedup_angles:
+            rot_init['dedup_angle'] = angle
+            num, dt = count(rot_init, args.device)
+            line += f" | dedup {angle:g}: {num:4d} ({dt*1000:.0f} ms)"
+        print(line)
+
+        sym_init = dict(method='symmetric', symmetry=symmetry)
+        line = f"{'':15s} {'':10s} {'symmetric':8s}"
+        for resolution in args.resolutions:
+            sym_init['resolution'] = resolution
+            st = time.time()
+            rots = generate_rotations(sym_init, device=args.device)
+            dt = time.time() - st
+            gap = max_gap(rots, queries, symmetry)
+            line += f" | {resolution:g} deg: {len(rots):5d} (gap {gap:.1f}, {dt*1000:.0f} ms)"
+        print(line)
+
+
+if __name__ == '__main__':
+    main(parse_args())
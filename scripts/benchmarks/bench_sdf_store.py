@@ -0,0 +1,101 @@
+""" Dataloader throughput of SDF loading: per-item npz decompression vs packed memmap store.
+
+    python scripts/benchmarks/bench_sdf_store.py --num_cad 50 --workers 0 2 4 8
+
+Each item mimics the SDF part of SdfImg.__getitem__: load pos/neg samples,
+then sample_points() and sample_unit_cube() for both.
+"""
+import argparse
+import os.path as osp
+import tempfile
+import time
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+
+from datasets.sdf_img import SdfImg, unpack_sdf_samples
+from datasets.sdf_store import SdfSampleStore, pack_sdf_samples
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_cad', type=int, default=50)
+    parser.add_argument('--num_samples', type=int, default=250000,
+                        help='pos (and neg) samples per cad, as in DeepSDF preprocessing')
+    parser.add_argument('--subsample', type=int, default=8192)
+    parser.add_argument('--window', type=int, default=16)
+    parser.add_argument('--num_items', type=int, default=400)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4, 8])
+    args = parser.parse_args()
+    return args
+
+
+class SdfOnly(Dataset):
+    def __init__(self, cad_list, sdf_dir, num_items, subsample, store=None, window=None):
+        self.cad_list = cad_list
+        self.sdf_dir = sdf_dir
+        self.num_items = num_items
+        self.subsample = subsample
+        self.store = store
+        self.window = window
+
+    def __len__(self):
+        return self.num_items
+
+    def __getitem__(self, idx):
+        cad_idx = self.cad_list[idx % len(self.cad_list)]
+        if self.store is not None:
+            pos, neg = self.store.read(cad_idx, self.window)
+        else:
+            pos, neg = unpack_sdf_samples(osp.join(self.sdf_dir, cad_idx + '.npz'), None)
+        oSdf = torch.cat([
+            SdfImg.sample_points(None, pos, self.subsample),
+            SdfImg.sample_points(None, neg, self.subsample)], 0)
+        nSdf = torch.cat([
+            SdfImg.sample_unit_cube(None, pos, self.subsample),
+            SdfImg.sample_unit_cube(None, neg, self.subsample)], 0)
+        return oSdf, nSdf
+
+
+def make_fake_sdf(sdf_dir, num_cad, num_samples):
+    rng = np.random.default_rng(0)
+    cad_list = []
+    for i in range(num_cad):
+        cad_idx = 'cad%03d' % i
+        pos = rng.normal(size=(num_samples, 4)).astype(np.float32)
+        neg = rng.normal(size=(num_samples, 4)).astype(np.float32)
+        pos[rng.random(num_samples) < 0.01, 3] = np.nan
+        np.savez(osp.join(sdf_dir, cad_idx + '.npz'), pos=pos, neg=neg)
+        cad_list.append(cad_idx)
+    return cad_list
+
+
+def items_per_sec(dataset, num_workers):
+    loader = DataLoader(dataset, batch_size=8, num_workers=num_workers)
+    st = time.time()
+    for _ in loader:
+        pass
+    return len(dataset) / (time.time() - st)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cad_list = make_fake_sdf(tmp_dir, args.num_cad, args.num_samples)
+        prefix = osp.join(tmp_dir, 'packed')
+        st = time.time()
+        pack_sdf_samples(cad_list, lambda c: osp.join(tmp_dir, c + '.npz'), prefix)
+        print(f"pack: {time.time() - st:.1f}s")
+        store = SdfSampleStore(prefix)
+
+        npz_set = SdfOnly(cad_list, tmp_dir, args.num_items, args.subsample)
+        mmap_set = SdfOnly(cad_list, tmp_dir, args.num_items, args.subsample,
+                           store=store, window=args.window * args.subsample)
+        for num_workers in args.workers:
+            npz = items_per_sec(npz_set, num_workers)
+            mmap = items_per_sec(mmap_set, num_workers)
+            print(f"workers={num_workers}: npz {npz:.1f} items/s, "
+                  f"packed {mmap:.1f} items/s, speedup {mmap / npz:.1f}x")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,113 @@
+""" Coarse-to-fine silhouette schedule (optim_mv.sil_schedule) vs fixed full resolution
+in multiview_optimize(), on synthetic object targets.
+
+    python scripts/benchmarks/bench_sil_schedule.py --schedule 64 128 256 --num_inits_parallel 30
+
+Targets are the object rendered at one ground-truth pose for all N*T views;
+inits are the ground truth with random rotation / translation noise.
+Each iteration budget in --budgets is run from scratch (the schedule spans the budget);
+time-to-solution is the wall time of the smallest budget whose mean IoU reaches --iou_thresh.
+Final IoU quantiles over inits are reported for the largest budget.
+"""
+import argparse
+import time
+import numpy as np
+import torch
+from omegaconf import OmegaConf
+from pytorch3d.transforms import (
+    matrix_to_rotation_6d, axis_angle_to_matrix, random_rotations)
+
+from homan.mvho_forwarder import MVHOImpl
+from temporal.optim_multiview import multiview_optimize
+from scripts.benchmarks.mvho_synthetic import make_mvho
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedule', type=int, nargs='+', default=[64, 128, 256])
+    parser.add_argument('--num_inits_parallel', type=int, default=30)
+    parser.add_argument('--train_size', type=int, default=4)
+    parser.add_argument('--budgets', type=int, nargs='+', default=[10, 20, 30, 50])
+    parser.add_argument('--iou_thresh', type=float, default=0.7)
+    parser.add_argument('--rot_noise', type=float, default=0.5, help='radians')
+    parser.add_argument('--cat', type=str, default='bottle')
+    parser.add_argument('--trials', type=int, default=3)
+    args = parser.parse_args()
+    return args
+
+
+def make_problem(args, seed):
+    N, T = args.num_inits_parallel, args.train_size
+    mvho = make_mvho(MVHOImpl, N, T, cat=args.cat, seed=seed)
+    g = torch.Generator().manual_seed(seed)
+    torch.manual_seed(seed)
+    R_gt = random_rotations(1).cuda()
+    t_gt = torch.zeros(1, 1, 3, device='cuda')
+    mvho.set_obj_transform(
+        translations_object=t_gt.expand(N, 1, 3),
+        rotations_object=matrix_to_rotation_6d(R_gt).expand(N, 6),
+        scale_object=torch.ones(N, device='cuda'))
+    with torch.no_grad():
+        target = mvho.render_obj(mvho.get_verts_object())
+    mvho.set_obj_target(target, check_shape=False, pyramid_sizes=args.schedule)
+
+    axis_angle = args.rot_noise * torch.randn(N, 3, generator=g).cuda()
+    R_init = axis_angle_to_matrix(axis_angle) @ R_gt
+    t_init = t_gt + 0.02 * torch.randn(N, 1, 3, generator=g).cuda()
+    mvho.set_obj_transform(
+        translations_object=t_init,
+        rotations_object=matrix_to_rotation_6d(R_init),
+        scale_object=torch.ones(N, device='cuda'))
+    return mvho
+
+
+def full_res_iou(mvho) -> np.ndarray:
+    """ (N,) mean over T """
+    sil_size = mvho.sil_size
+    mvho.set_sil_size(None)
+    with torch.no_grad():
+        _, iou, _ = mvho.forward_obj_pose_render(mvho.get_verts_object(), loss_only=False)
+    mvho.set_sil_size(sil_size)
+    return iou.view(mvho.num_inits, mvho.train_size).mean(1).cpu().numpy()
+
+
+def run(args, seed, schedule, num_iters):
+    mvho = make_problem(args, seed)
+    cfg = OmegaConf.create(dict(
+        lr=1e-2, num_iters=num_iters, vis_interval=-1, iter_tqdm=False,
+        obj_sil_func='l2', sil_schedule=schedule,
+        loss=dict(mask=dict(weight=1.0), inside=dict(weight=0.0, num_nearest_points=3),
+                  close=dict(weight=0.0, num_priors=5, reduce='avg', num_nearest_points=1))))
+    torch.cuda.synchronize()
+    st = time.time()
+    mvho = multiview_optimize(mvho, cfg)
+    torch.cuda.synchronize()
+    return time.time() - st, full_res_iou(mvho)
+
+
+def main(args):
+    for name, schedule in [('fixed', None), ('schedule', args.schedule)]:
+        solved_at = None
+        for num_iters in sorted(args.budgets):
+            times, ious = [], []
+            for seed in range(args.trials):
+                t, iou = run(args, seed, schedule, num_iters)
+                times.append(t)
+                ious.append(iou)
+            ious = np.concatenate(ious)
+            if solved_at is None and ious.mean() >= args.iou_thresh:
+                solved_at = (num_iters, np.mean(times))
+            print(f"{name:>8s} {num_iters:3d} iters: {np.mean(times)*1000:.0f} ms/batch, "
+                  f"mean IoU {ious.mean():.3f}")
+        q = np.quantile(ious, [0.1, 0.25, 0.5, 0.75, 0.9])
+        print(f"{name:>8s} {schedule or ''}: final IoU q10/25/50/75/90: "
+              + ' '.join(f'{v:.3f}' for v in q)
+              + f", >= {args.iou_thresh}: {(ious >= args.iou_thresh).mean():.0%}")
+        if solved_at is None:
+            print(f"{name:>8s}: mean IoU never reached {args.iou_thresh}")
+        else:
+            print(f"{name:>8s}: time-to-solution {solved_at[1]*1000:.0f} ms ({solved_at[0]} iters)")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,71 @@
+""" Selecting K pose clusters after the pose search:
+fitted_results (re-render all N inits, argsort) + clustering all N on all vertices (old),
+vs top_results(M) (topk on the last IoU) + clustering M on the vertex subset.
+
+    python scripts/benchmarks/bench_top_clusters.py --num_inits 2000 --top_m 200 --K 10
+
+The full method builds an N x N distance matrix and clusters its N^2/2 edges
+in python, expect minutes for N=2000; --skip_full to time the new path only.
+"""
+import argparse
+import time
+import torch
+
+from obj_pose.obj_loader import OBJLoader
+from scripts.benchmarks.bench_pose_renderer_chunks import make_model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_inits', type=int, default=2000)
+    parser.add_argument('--top_m', type=int, default=200)
+    parser.add_argument('--K', type=int, default=10)
+    parser.add_argument('--bsize', type=int, default=4)
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument('--chunk_size', type=int, default=500)
+    parser.add_argument('--cat', type=str, default='bottle')
+    parser.add_argument('--skip_full', action='store_true')
+    args = parser.parse_args()
+    return args
+
+
+def timed(fn):
+    torch.cuda.synchronize()
+    st = time.time()
+    out = fn()
+    torch.cuda.synchronize()
+    return time.time() - st, out
+
+
+def main(args):
+    obj = OBJLoader().load_obj_by_name(args.cat)
+    model = make_model(obj, args.bsize, args.num_inits, args.chunk_size)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-2)
+    for _ in range(args.iters):
+        optimizer.zero_grad()
+        model.forward_backward()
+        optimizer.step()
+    # evaluate the final poses once, as find_optimal_pose() leaves them
+    optimizer.zero_grad()
+    model.forward_backward()
+
+    print(f"N={args.num_inits}, M={args.top_m}, K={args.K}, B={args.bsize}, "
+          f"{len(model.vertices)} verts, {len(model.dist_vertices)} for distances")
+    t_top, top = timed(lambda: model.clustered_results(args.K, top_m=args.top_m))
+    print(f"  top-M:  {t_top:8.2f} s, center IoUs {[round(v, 3) for v in top.iou.tolist()]}")
+    if args.skip_full:
+        return
+    t_fit, _ = timed(lambda: model.fitted_results)
+    t_full, full = timed(lambda: model.clustered_results(args.K))
+    print(f"  full:   {t_fit + t_full:8.2f} s (fitted_results {t_fit:.2f} s), "
+          f"center IoUs {[round(v, 3) for v in full.iou.tolist()]}")
+    # centers of the full method that have a top-M center within 1 degree
+    rel = full.rotations.transpose(1, 2)[:, None] @ top.rotations[None]  # (K, K, 3, 3)
+    cos = ((rel.diagonal(dim1=-2, dim2=-1).sum(-1) - 1) / 2).clamp(-1, 1)
+    matched = (torch.rad2deg(torch.acos(cos)).min(1).values < 1).sum().item()
+    print(f"  {matched}/{args.K} full centers also selected by top-M, "
+          f"{(t_fit + t_full) / t_top:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,71 @@
+""" Memory high-water mark and wall time of writing a compare video.
+
+    python scripts/benchmarks/bench_video_writer.py --num_frames 100
+
+list:   collect all frames, then moviepy.editor.ImageSequenceClip (old make_compare_video path)
+stream: image_utils.VideoWriter, frames piped to ffmpeg as they are produced
+"""
+import argparse
+import os
+import os.path as osp
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from nnutils.image_utils import VideoWriter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_frames', type=int, default=100)
+    parser.add_argument('--height', type=int, default=456)
+    parser.add_argument('--width', type=int, default=456)
+    parser.add_argument('--fps', type=int, default=5)
+    args = parser.parse_args()
+    return args
+
+
+def fake_frames(num_frames, height, width):
+    """ Mimic make_compare_video: vstack(image, float render * 255) """
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    for t in range(num_frames):
+        rend = rng.random((height, width, 3))
+        yield np.vstack([image, rend * 255])
+
+
+def run_list(save_file, args):
+    from moviepy import editor
+    frames = list(fake_frames(args.num_frames, args.height, args.width))
+    clip = editor.ImageSequenceClip(frames, fps=args.fps)
+    clip.write_videofile(save_file, logger=None)
+
+
+def run_stream(save_file, args):
+    with VideoWriter(save_file, fps=args.fps) as writer:
+        writer.write_frames(fake_frames(args.num_frames, args.height, args.width))
+
+
+def measure(func, save_file, args):
+    tracemalloc.start()
+    st = time.time()
+    func(save_file, args)
+    elapsed = time.time() - st
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, osp.getsize(save_file) / 2**10
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, func in [('list', run_list), ('stream', run_stream)]:
+            save_file = os.path.join(tmp_dir, f'{name}.mp4')
+            elapsed, peak_mb, size_kb = measure(func, save_file, args)
+            print(f"{name:>7s}: {args.num_frames} frames, "
+                  f"time {elapsed:.2f}s, peak mem {peak_mb:.1f}MB, "
+                  f"file {size_kb:.0f}KB")
+
+
+if __name__ == '__main__':
+    main(parse_args())
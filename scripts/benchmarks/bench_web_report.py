@@ -0,0 +1,93 @@
+""" Generation time and page weight of a 1000-row report of images and GIF clips,
+web_utils.run (one page of full-size assets) vs the streaming, paginated WebReport.
+Page weight is the html plus the assets its <img>/<video> tags load.
+
+    python scripts/benchmarks/bench_web_report.py --num_rows 1000 --size 640 --num_frames 30
+"""
+import argparse
+import glob
+import os.path as osp
+import re
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+
+from nnutils.web_utils import WebReport, run
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_rows', type=int, default=1000)
+    parser.add_argument('--num_sources', type=int, default=10, help='distinct source files, reused by rows')
+    parser.add_argument('--size', type=int, default=640)
+    parser.add_argument('--num_frames', type=int, default=30)
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--rows_per_page', type=int, default=100)
+    parser.add_argument('--num_workers', type=int, default=8)
+    args = parser.parse_args()
+    return args
+
+
+def synthetic_sources(tmp, num, size, num_frames, rng):
+    """ smooth renders: a moving disk over a gradient """
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    sources = []
+    for i in range(num):
+        base = np.stack([xx, yy, np.full_like(xx, rng.uniform())], -1) * 255
+        frames = []
+        for t in range(num_frames):
+            cx, cy = 0.5 + 0.3 * np.cos(t / 5 + i), 0.5 + 0.3 * np.sin(t / 5 + i)
+            disk = ((xx - cx) ** 2 + (yy - cy) ** 2 < 0.01)[..., None]
+            frames.append(Image.fromarray(np.where(disk, 255, base).astype(np.uint8)))
+        image_file, gif_file = osp.join(tmp, 'render_%d.png' % i), osp.join(tmp, 'clip_%d.gif' % i)
+        frames[0].save(image_file)
+        frames[0].save(gif_file, save_all=True, append_images=frames[1:], duration=100, loop=0)
+        sources.append((image_file, gif_file))
+    return sources
+
+
+def page_weight(html_file):
+    html_root = osp.dirname(html_file)
+    with open(html_file) as fp:
+        html = fp.read()
+    srcs = re.findall(r'<(?:img|source)[^>]* src="([^"]+)"', html)
+    return osp.getsize(html_file) + sum(osp.getsize(osp.join(html_root, src)) for src in srcs)
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = synthetic_sources(tmp, args.num_sources, args.size, args.num_frames, rng)
+        rows = [['step %d' % i, *sources[i % len(sources)]] for i in range(args.num_rows)]
+
+        html_root = osp.join(tmp, 'run')
+        st = time.time()
+        run(html_root, rows, args.width)
+        t_run = time.time() - st
+        w_run = page_weight(osp.join(html_root, 'index.html'))
+
+        html_root = osp.join(tmp, 'stream')
+        st = time.time()
+        with WebReport(html_root, args.width, args.rows_per_page, args.num_workers) as report:
+            for row in rows:
+                report.add_row(row)
+        t_stream = time.time() - st
+        pages = sorted(glob.glob(osp.join(html_root, '*.html')))
+        w_first = page_weight(osp.join(html_root, 'index.html'))
+        w_total = sum(page_weight(page) for page in pages)
+
+        st = time.time()
+        with WebReport(html_root, args.width, args.rows_per_page, args.num_workers) as report:
+            for row in rows:
+                report.add_row(row)
+        t_rerun = time.time() - st
+
+    print(f"{args.num_rows} rows of a {args.size}px image and a {args.num_frames}-frame gif")
+    print(f"run: {t_run:.1f}s, one page of {w_run / 2**20:.1f} MB")
+    print(f"WebReport: {t_stream:.1f}s, {len(pages)} pages, first page {w_first / 2**20:.2f} MB, "
+          f"all pages {w_total / 2**20:.1f} MB; re-run with no new rows {t_rerun:.2f}s")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,59 @@
+""" Synthetic MVHO inputs for benchmarks: a flat MANO hand grasping a CAD from weights/obj_models,
+jittered per (init, frame). Run scripts from the repo root. """
+import torch
+from pytorch3d.transforms import matrix_to_rotation_6d, random_rotations
+
+from config.epic_constants import REND_SIZE
+from nnutils.handmocap import get_hand_faces
+from obj_pose.obj_loader import OBJLoader
+from homan.mvho_forwarder import LiteHandModule, _mano_model_dict
+
+
+def make_hand_data(num_inits, train_size, side='right', device='cuda', seed=0) -> LiteHandModule.HandData:
+    g = torch.Generator().manual_seed(seed)
+    nt = num_inits * train_size
+    mano = _mano_model_dict[side]
+    with torch.no_grad():
+        v, _ = mano.forward_pca(torch.zeros([1, 45]))  # (1, 778, 3)
+    v = v - v.mean(1, keepdim=True)
+    v_local = v.expand(nt, -1, -1) + 0.002 * torch.randn(nt, v.size(1), 3, generator=g)
+    rot_mat = torch.eye(3).expand(nt, 3, 3)
+    transl = torch.tensor([0, 0, 0.5]).view(1, 1, 3).expand(nt, 1, 3)
+    v_global = v_local + transl
+    fx = REND_SIZE
+    camintr = torch.tensor([[fx, 0, fx/2], [0, fx, fx/2], [0, 0, 1.]]).expand(nt, 3, 3)
+    faces = get_hand_faces(side).cpu().expand(nt, -1, -1)
+    return LiteHandModule.HandData(
+        camintr=camintr.to(device), rotations_hand=matrix_to_rotation_6d(rot_mat).to(device),
+        translations_hand=transl.to(device),
+        v_hand_global=v_global.to(device), v_hand_local=v_local.to(device),
+        rot_mat_hand=rot_mat.to(device), faces_hand=faces.to(device),
+        ref_mask_hand=torch.zeros(nt, REND_SIZE, REND_SIZE, device=device))
+
+
+def make_mvho(cls, num_inits, train_size, cat='bottle', scale_mode='scalar',
+              device='cuda', seed=0):
+    """
+    Args:
+        cls: MVHO subclass, e.g. MVHOImpl
+
+    Returns:
+        mvho with hand data, object buffers, N random object poses and empty target masks
+    """
+    torch.manual_seed(seed)
+    obj = OBJLoader().load_obj_by_name(cat)
+    mvho = cls()
+    mvho.register_obj_buffer(
+        verts_object_og=torch.as_tensor(obj.vertices, device=device),
+        faces_object=torch.as_tensor(obj.faces, device=device),
+        scale_mode=scale_mode)
+    mvho.set_size(num_inits, train_size)
+    mvho.set_hand_data(make_hand_data(num_inits, train_size, device=device, seed=seed))
+    mvho.set_obj_transform(
+        translations_object=0.05 * torch.randn(num_inits, 1, 3, device=device),
+        rotations_object=matrix_to_rotation_6d(random_rotations(num_inits)).to(device),
+        scale_object=torch.ones(num_inits, device=device))
+    mvho.set_obj_target(
+        torch.zeros(num_inits * train_size, REND_SIZE, REND_SIZE, device=device),
+        check_shape=False)
+    return mvho.to(device)
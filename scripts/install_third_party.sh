@@ -40,6 +40,6 @@ cd externals/roma && git checkout 22806dfb43329b9bf1dd2cead7e96720330e3151
 pip install externals/roma
 
 
-# Install torch_scatter (we use scatter_min)
+# Optional: torch_scatter, only homan/contact_prior_test.py compares segment_min against scatter_min
 # E.g. for python3.8 torch1.8 cuda 10.2:
 # pip install https://data.pyg.org/whl/torch-1.8.0%2Bcu102/torch_scatter-2.0.8-cp38-cp38-linux_x86_64.whl
\ No newline at end of file
@@ -0,0 +1,186 @@
+from typing import NamedTuple, Callable, List, Tuple
+import resource
+import threading
+import time
+import torch
+
+
+class BatchMeasure(NamedTuple):
+    """ One forward/backward of train_loss() with `batch_size` inits in parallel """
+    batch_size: int
+    peak_bytes: int
+    seconds: float
+
+    @property
+    def inits_per_sec(self) -> float:
+        return self.batch_size / max(self.seconds, 1e-9)
+
+
+class MemoryMeter:
+    """ Peak memory of a block of code above its start.
+    On cuda: allocated device memory, peak stats are reset by start().
+    On cpu: process RSS. start() resets the kernel's peak (VmHWM) through /proc/self/clear_refs;
+        where that is not permitted, RSS is sampled in a thread every `interval` seconds,
+        which may miss a peak shorter than that.
+    """
+    def __init__(self, device, interval: float = 1e-3):
+        self.cuda = torch.device(device).type == 'cuda'
+        self.interval = interval
+        self._start = 0
+        self._sampler = None
+
+    @staticmethod
+    def _rss() -> int:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * resource.getpagesize()
+
+    @staticmethod
+    def _reset_hwm() -> bool:
+        try:
+            with open('/proc/self/clear_refs', 'w') as fp:
+                fp.write('5')
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _hwm() -> int:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+        raise RuntimeError('Cannot read VmHWM')
+
+    def start(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            self._start = torch.cuda.memory_allocated()
+            return
+        self._stop_sampler()
+        self._start = self._rss()
+        if not self._reset_hwm():
+            self._sampler = _RssSampler(self._rss, self.interval)
+
+    def peak(self) -> int:
+        if self.cuda:
+            torch.cuda.synchronize()
+            return torch.cuda.max_memory_allocated() - self._start
+        if self._sampler is not None:
+            return self._stop_sampler() - self._start
+        return self._hwm() - self._start
+
+    def _stop_sampler(self) -> int:
+        sampler, self._sampler = self._sampler, None
+        return sampler.stop() if sampler is not None else 0
+
+    def total(self) -> int:
+        """ Memory a batch may use by default """
+        if self.cuda:
+            free, _ = torch.cuda.mem_get_info()
+            return free
+        with open('/proc/meminfo') as fp:
+            for line in fp:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+        raise RuntimeError('Cannot read available memory')
+
+
+class _RssSampler:
+    """ Max of `rss()` sampled in a daemon thread until stop() """
+    def __init__(self, rss: Callable[[], int], interval: float):
+        self.rss = rss
+        self.interval = interval
+        self.max = rss()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self.max = max(self.max, self.rss())
+
+    def stop(self) -> int:
+        self._done.set()
+        self._thread.join()
+        return max(self.max, self.rss())
+
+
+def measure_train_step(homan, optim_cfg, meter: MemoryMeter) -> BatchMeasure:
+    """ Time and peak memory of one train_loss() + backward() of `homan` as currently set,
+    parameters are left untouched. """
+    meter.start()
+    st = time.time()
+    loss = homan.train_loss(optim_cfg=optim_cfg)
+    loss.backward()
+    peak = meter.peak()  # syncs
+    seconds = time.time() - st
+    for p in [homan.rotations_object, homan.translations_object, homan.scale_object]:
+        p.grad = None
+    return BatchMeasure(homan.num_inits, peak, seconds)
+
+
+def _is_oom(e: RuntimeError) -> bool:
+    return 'out of memory' in str(e)
+
+
+def tune_num_inits_parallel(measure: Callable[[int], BatchMeasure],
+                            candidates: List[int],
+                            budget_bytes: int,
+                            efficiency: float = 0.9,
+                            verbose: bool = True) -> int:
+    """ Largest batch size whose peak memory fits the budget
+    and whose throughput is within `efficiency` of the best one measured.
+
+    Candidates are probed in increasing order, stopping at the first one over budget
+    (or out of memory), as larger batches won't fit either.
+    The first probe also warms up the renderer and kernels, it is therefore measured twice.
+
+    Args:
+        measure: batch_size -> BatchMeasure, e.g. set the first batch_size inits
+            to the forwarder and call measure_train_step()
+        candidates: batch sizes to probe
+        budget_bytes: memory a batch may use
+
+    Returns:
+        batch size, min(candidates) if nothing fits
+    """
+    candidates = sorted(set(candidates))
+    fitted = []
+    for i, bsize in enumerate(candidates):
+        try:
+            if i == 0:
+                measure(bsize)
+            m = measure(bsize)
+        except RuntimeError as e:
+            if not _is_oom(e):
+                raise
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            if verbose:
+                print(f'Auto batch: {bsize} out of memory')
+            break
+        if verbose:
+            print(f'Auto batch: {bsize} inits, peak {m.peak_bytes / 2**20:.0f}MB, '
+                  f'{m.inits_per_sec:.1f} inits/s')
+        if m.peak_bytes > budget_bytes:
+            break
+        fitted.append(m)
+
+    if len(fitted) == 0:
+        if verbose:
+            print(f'Auto batch: no candidate fits {budget_bytes / 2**20:.0f}MB, '
+                  f'using {candidates[0]}')
+        return candidates[0]
+    best = max(m.inits_per_sec for m in fitted)
+    chosen = max(m.batch_size for m in fitted if m.inits_per_sec >= efficiency * best)
+    if verbose:
+        print(f'Auto batch: num_inits_parallel = {chosen}')
+    return chosen
+
+
+def batch_ranges(num_inits: int, num_inits_parallel: int) -> List[Tuple[int, int]]:
+    """ [start, end) of each batch of inits, the last one may be smaller """
+    return [
+        (start, min(start + num_inits_parallel, num_inits))
+        for start in range(0, num_inits, num_inits_parallel)]
@@ -0,0 +1,124 @@
+import unittest
+from unittest import mock
+import torch
+import torch.nn as nn
+from temporal.batch_tuner import (
+    BatchMeasure, MemoryMeter, measure_train_step, tune_num_inits_parallel, batch_ranges)
+
+
+class FakeMeter:
+    """ Memory as reported by FakeMVHO instead of the device """
+    def __init__(self):
+        self.allocated = 0
+        self.peak_seen = 0
+
+    def start(self):
+        self.allocated = 0
+        self.peak_seen = 0
+
+    def peak(self) -> int:
+        return self.peak_seen
+
+
+class FakeMVHO(nn.Module):
+    """ train_loss 'allocates' a fixed cost plus bytes_per_init per init,
+    and beyond oom_at inits raises as CUDA would. """
+    def __init__(self, meter, bytes_per_init, fixed_bytes=0, oom_at=None):
+        super().__init__()
+        self.meter = meter
+        self.bytes_per_init = bytes_per_init
+        self.fixed_bytes = fixed_bytes
+        self.oom_at = oom_at
+        self.set_size(1)
+
+    def set_size(self, num_inits):
+        self.num_inits = num_inits
+        self.rotations_object = nn.Parameter(torch.zeros(num_inits, 6))
+        self.translations_object = nn.Parameter(torch.zeros(num_inits, 1, 3))
+        self.scale_object = nn.Parameter(torch.ones(num_inits))
+
+    def train_loss(self, optim_cfg, print_metric=False, per_init=False):
+        if self.oom_at is not None and self.num_inits >= self.oom_at:
+            raise RuntimeError('CUDA out of memory. Tried to allocate 2.00 GiB')
+        self.meter.peak_seen = self.fixed_bytes + self.bytes_per_init * self.num_inits
+        return self.rotations_object.sum() + self.translations_object.sum() \
+            + self.scale_object.sum()
+
+
+class TuneNumInitsParallelTest(unittest.TestCase):
+
+    candidates = [8, 16, 32, 64, 128]
+
+    def tune(self, homan, meter, budget):
+        def measure(bsize):
+            homan.set_size(bsize)
+            return measure_train_step(homan, None, meter)
+        return tune_num_inits_parallel(measure, self.candidates, budget, verbose=False)
+
+    def test_respects_budget(self):
+        meter = FakeMeter()
+        homan = FakeMVHO(meter, bytes_per_init=100 * 2**20, fixed_bytes=500 * 2**20)
+        for budget_mb in [1500, 2500, 4000, 7000, 20000]:
+            budget = budget_mb * 2**20
+            chosen = self.tune(homan, meter, budget)
+            self.assertLessEqual(
+                homan.fixed_bytes + homan.bytes_per_init * chosen, budget,
+                f'budget {budget_mb}MB')
+            # measure_train_step leaves no gradients behind
+            self.assertIsNone(homan.rotations_object.grad)
+
+    def test_out_of_memory(self):
+        meter = FakeMeter()
+        homan = FakeMVHO(meter, bytes_per_init=1, oom_at=64)
+        self.assertEqual(self.tune(homan, meter, 2**40), 32)
+
+    def test_nothing_fits(self):
+        meter = FakeMeter()
+        homan = FakeMVHO(meter, bytes_per_init=2**30)
+        self.assertEqual(self.tune(homan, meter, 2**20), 8)
+
+    def test_prefers_efficient(self):
+        """ 128 fits but is much slower per init than 64 """
+        seconds = {8: 1.0, 16: 1.0, 32: 1.0, 64: 1.0, 128: 4.0}
+        chosen = tune_num_inits_parallel(
+            lambda b: BatchMeasure(b, 0, seconds[b]), self.candidates, 1, verbose=False)
+        self.assertEqual(chosen, 64)
+
+
+class MemoryMeterTest(unittest.TestCase):
+
+    MB = 2**20
+
+    def probe(self, meter, num_mb, hold=False):
+        meter.start()
+        x = torch.ones(num_mb * self.MB // 4)
+        if not hold:
+            del x
+            return meter.peak() / self.MB
+        peak = meter.peak()
+        del x
+        return peak / self.MB
+
+    def test_cpu_peak_per_probe(self):
+        """ a small probe after a large one reads small """
+        meter = MemoryMeter('cpu')
+        self.assertGreater(self.probe(meter, 200), 150)
+        self.assertLess(self.probe(meter, 20), 100)
+
+    def test_cpu_sampler_fallback(self):
+        with mock.patch.object(MemoryMeter, '_reset_hwm', staticmethod(lambda: False)):
+            meter = MemoryMeter('cpu')
+            self.assertGreater(self.probe(meter, 200, hold=True), 150)
+            self.assertLess(self.probe(meter, 20, hold=True), 100)
+
+
+class BatchRangesTest(unittest.TestCase):
+
+    def test_remainder(self):
+        self.assertEqual(batch_ranges(70, 30), [(0, 30), (30, 60), (60, 70)])
+        self.assertEqual(batch_ranges(60, 30), [(0, 30), (30, 60)])
+        self.assertEqual(batch_ranges(10, 30), [(0, 10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -122,10 +122,11 @@ def fit_scene(dataset: EpicClipDataset,
 
 def visualize_loss(loss_records: dict):
     fig = plt.figure()
-    for k, v in loss_records.items():
+    curves = {k: v for k, v in loss_records.items() if k != 'steps'}
+    for k, v in curves.items():
         plt.plot(v)
 
-    plt.legend(loss_records.keys())
+    plt.legend(curves.keys())
     plt.show()
     return fig
 
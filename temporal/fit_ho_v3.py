@@ -4,7 +4,6 @@ import tqdm
 import numpy as np
 import torch
 import logging
-from moviepy import editor
 import matplotlib.pyplot as plt
 
 from datasets.epic_clip import EpicClipDataset
@@ -16,7 +15,7 @@ from temporal.optim_plan import (
     optimize_hand, smooth_hand_pose, reinit_sample_optimize
 )
 from temporal.utils import init_6d_obj_pose_v2
-from temporal.visualize import make_compare_video
+from temporal.visualize import write_compare_video
 
 from libzhifan import io
 
@@ -150,11 +149,10 @@ def fit_scene(dataset,
         torch.save([list(v) for v in results], (fmt % 'results.pth'))
 
     if cfg.action_video.save:
-        frames = make_compare_video(
+        write_compare_video(
+            fmt % 'action.mp4',
             homan, global_cam, global_images=images,
             render_frames=cfg.action_video.render_frames)
-        action_cilp = editor.ImageSequenceClip(frames, fps=5)
-        action_cilp.write_videofile(fmt % 'action.mp4')
 
     for criterion in ['iou', 'max_min_dist']:
         sign = 1 if criterion == 'iou' else -1
@@ -5,19 +5,22 @@ import tqdm
 import numpy as np
 import torch
 import logging
-from moviepy import editor
 import matplotlib.pyplot as plt
 
 from nnutils.handmocap import extract_forwarder_input
 from datasets.epic_clip_v3 import EpicClipDatasetV3
 from homan.mvho_forwarder import MVHOVis, LiteHandModule
+from homan.step_profiler import StepProfiler, NULL_PROFILER
 from temporal.optim_plan import (
     optimize_hand, smooth_hand_pose
 )
+from temporal.optim_loop import StopCriteria
 from temporal.obj_initializer import ObjectPoseInitializer, InitializerInput
 from temporal.optim_multiview import EvalHelper, multiview_optimize
+from temporal.batch_tuner import (
+    MemoryMeter, measure_train_step, tune_num_inits_parallel, batch_ranges)
 from temporal.post_refinement import load_homan_from_mvho, optimize_post
-from temporal.visualize import make_compare_video
+from temporal.visualize import write_compare_video
 
 from libzhifan import io
 
@@ -124,8 +127,9 @@ def fit_scene(dataset,
     # Step 1: Interpolate pca_pose Step 2: Optimize hand_mask
     if cfg.homan.optimize_hand:
         print('Smooth hand pose and optimize hand')
-        lite_hand = smooth_hand_pose(lite_hand, lr=0.1)
-        lite_hand = optimize_hand(lite_hand, verbose=False)
+        hand_stop = StopCriteria(**cfg.homan.get('hand_stop', {}))
+        lite_hand = smooth_hand_pose(lite_hand, lr=0.1, stop=hand_stop)
+        lite_hand = optimize_hand(lite_hand, verbose=False, stop=hand_stop)
 
     optim_cfg = cfg.optim_mv
     """ Get training indices"""
@@ -133,7 +137,7 @@ def fit_scene(dataset,
 
     num_inits_parallel = optim_cfg.num_inits_parallel
 
-    if cat == 'cup' or cat == 'mug':
+    if (cat == 'cup' or cat == 'mug') and not optim_cfg.auto_batch.enabled:
         num_inits_parallel = num_inits_parallel // 2
     rot_init = cfg.homan.rot_init[cat]
     if rot_init['method'] == 'spiral' or rot_init['method'] == 'upright':
@@ -166,22 +170,45 @@ def fit_scene(dataset,
         verts_object_og=init_input.obj_vertices,
         faces_object=init_input.obj_faces,
         scale_mode=cfg.homan.scale_mode)
-    for e in tqdm.trange(num_inits // num_inits_parallel):
-        nt_start = e * num_inits_parallel * train_size
-        nt_end = (e+1) * num_inits_parallel * train_size
-        mvho.set_size(num_inits_parallel, train_size)  # eval will set this to sth. else
+
+    def set_batch(n_start, n_end):
+        nt_start = n_start * train_size
+        nt_end = n_end * train_size
+        mvho.set_size(n_end - n_start, train_size)  # eval will set this to sth. else
         mvho.set_hand_data(hand_data[nt_start:nt_end, ...])
-        n_start = e * num_inits_parallel
-        n_end = (e+1) * num_inits_parallel
         mvho.set_obj_transform(
             translations_object=translation_inits[n_start:n_end, ...],
             rotations_object=R_o2h_6d[n_start:n_end, ...],
             scale_object=scale_inits[n_start:n_end, ...])
         mvho.set_obj_target(
-            target_masks_object[nt_start:nt_end, ...], check_shape=False)
+            target_masks_object[nt_start:nt_end, ...], check_shape=False,
+            pyramid_sizes=optim_cfg.sil_schedule or (),
+            edge_chamfer=optim_cfg.loss.chamfer.weight > 0)
+
+    if optim_cfg.auto_batch.enabled:
+        meter = MemoryMeter(device)
+        budget = optim_cfg.auto_batch.mem_budget_gb
+        budget = meter.total() * 0.8 if budget is None else budget * 2**30
+        candidates = [v for v in optim_cfg.auto_batch.candidates if v <= num_inits]
+
+        def measure(bsize):
+            set_batch(0, bsize)
+            return measure_train_step(mvho, optim_cfg, meter)
+        num_inits_parallel = tune_num_inits_parallel(
+            measure, candidates or [num_inits], budget)
+
+    profiler = StepProfiler() if optim_cfg.profile else NULL_PROFILER
+    mvho.profiler = profiler
+    for e, (n_start, n_end) in enumerate(tqdm.tqdm(batch_ranges(num_inits, num_inits_parallel))):
+        profiler.start_epoch(e)
+        set_batch(n_start, n_end)
 
         mvho = multiview_optimize(mvho, optim_cfg)
-        eval_helper.register_batch(mvho, e, num_inits_parallel)
+        profiler.end_epoch()
+        eval_helper.register_batch(mvho, e, n_end - n_start)
+    mvho.profiler = NULL_PROFILER  # not saved with mvho
+    if profiler.enabled:
+        io.write_json(profiler.summary(), (fmt % 'profile.json'))
 
     mvho, best_metric = eval_helper.decide_best_homan(
         mvho, optim_cfg.criterion)
@@ -202,12 +229,11 @@ def fit_scene(dataset,
         io.write_json(post_metrics, (fmt % 'post.json'))
         print("Post refinement done")
         if cfg.action_video.save:
-            frames = make_compare_video(
-                homan, eval_helper.eval_input.global_camera, 
+            write_compare_video(
+                fmt % 'post.mp4',
+                homan, eval_helper.eval_input.global_camera,
                 global_images=eval_helper.eval_input.images,
                 render_frames='all')
-            action_cilp = editor.ImageSequenceClip(frames, fps=5)
-            action_cilp.write_videofile(fmt % 'post.mp4')
 
     """ saving """
     mvho.render_grid(pose_idx=0, with_hand=False,
@@ -220,9 +246,7 @@ def fit_scene(dataset,
         # torch.save([list(v) for v in eval_helper.eval_results], (fmt % 'results.pth'))
 
     if cfg.action_video.save:
-        frames = eval_helper.make_compare_video(mvho)
-        action_cilp = editor.ImageSequenceClip(frames, fps=5)
-        action_cilp.write_videofile(fmt % 'pre.mp4')
+        eval_helper.write_compare_video(mvho, fmt % 'pre.mp4')
 
     for criterion in ['iou', 'max_min_dist']:
         mvho, best_metric = eval_helper.decide_best_homan(
@@ -7,7 +7,7 @@ from obj_pose.obj_loader import OBJLoader
 from homan.math import avg_matrix_approx
 from homan.contact_prior import get_contact_regions
 from homan.utils.geometry import (
-    compute_random_rotations, generate_rotations_o2h
+    compute_random_rotations, generate_rotations, generate_rotations_o2h
 )
 from datasets.epic_clip_v3 import DataElement
 from homan.mvho_forwarder import LiteHandModule
@@ -114,6 +114,8 @@ class ObjectPoseInitializer:
     
     @staticmethod
     def read_num_inits(rot_init: dict):
+        if rot_init['method'] == 'symmetric' or rot_init.get('dedup_angle', None):
+            return len(generate_rotations(rot_init, device='cpu'))
         if rot_init['method'] == 'upright' or rot_init['method'] == 'spiral':
             return rot_init['num_sphere_pts'] * rot_init['num_sym_rots']
         if rot_init['method'] == 'random':
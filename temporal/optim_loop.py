@@ -0,0 +1,202 @@
+from typing import NamedTuple, Callable
+import time
+import torch
+from tqdm import tqdm
+
+
+class StopCriteria(NamedTuple):
+    """ When to stop an optimization loop before max_steps.
+    Divergence (non-finite loss, loss_lim) is checked at every step, before backward.
+    The other criteria are evaluated on device every `check_every` steps.
+
+    check_every: steps between checks of rel_tol, abs_tol and max_seconds
+    rel_tol: stop if the best loss of the last `window` steps improves
+        the best loss before it by less than rel_tol (relative). 0 to disable.
+    window: plateau window, in steps
+    abs_tol: stop once loss < abs_tol
+    loss_lim: stop once loss > loss_lim, i.e. diverged
+    max_seconds: wall-time budget of the loop
+    """
+    check_every: int = 10
+    rel_tol: float = 1e-4
+    window: int = 20
+    abs_tol: float = None
+    loss_lim: float = None
+    max_seconds: float = None
+
+
+class InitGuard:
+    """ Per-init NaN/Inf isolation for N object inits optimized in one batch.
+    An init whose loss or gradient becomes non-finite is dropped: 
+    its loss is excluded, its gradients zeroed and its parameters frozen
+    (Adam momentum would otherwise keep moving it), 
+    while the other inits keep optimizing.
+
+    Usage:
+        optimizer.zero_grad()
+        tot_loss = guard.masked_loss(homan.train_loss(cfg, per_init=True))
+        tot_loss.backward()
+        guard.step(optimizer)
+
+    Nothing here synchronizes with the GPU.
+    """
+    def __init__(self, params: list, num_inits: int):
+        """
+        Args:
+            params: list of nn.Parameter, each of shape (N, ...)
+        """
+        self.params = params
+        self.alive = torch.ones(
+            [num_inits], dtype=torch.bool, device=params[0].device)
+
+    def _mask(self, p) -> torch.Tensor:
+        return self.alive.view(-1, *([1] * (p.dim() - 1)))
+
+    def masked_loss(self, per_init_loss: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            per_init_loss: (N,)
+
+        Returns:
+            scalar, sum over alive inits
+        """
+        self.alive &= torch.isfinite(per_init_loss.detach())
+        return torch.where(
+            self.alive, per_init_loss, torch.zeros_like(per_init_loss)).sum()
+
+    def step(self, optimizer: torch.optim.Optimizer):
+        with torch.no_grad():
+            for p in self.params:
+                if p.grad is not None:
+                    self.alive &= torch.isfinite(
+                        p.grad.view(len(self.alive), -1)).all(dim=1)
+            prev = []
+            for p in self.params:
+                if p.grad is not None:
+                    p.grad.masked_fill_(~self._mask(p), 0)
+                prev.append(p.detach().clone())
+            optimizer.step()
+            for p, p_prev in zip(self.params, prev):
+                p.copy_(torch.where(self._mask(p), p, p_prev))
+
+    def fill_dropped_(self):
+        """ Overwrite dropped inits with the first alive one,
+        so that batched evaluation of all N stays finite. Read out dropped values before this. """
+        alive = self.alive.tolist()
+        if all(alive) or not any(alive):
+            return
+        src = alive.index(True)
+        with torch.no_grad():
+            for p in self.params:
+                p.copy_(torch.where(self._mask(p), p, p[[src]].expand_as(p)))
+
+    @property
+    def num_dropped(self) -> int:
+        return int((~self.alive).sum().item())
+
+
+def _diverged(loss: torch.Tensor, stop: StopCriteria) -> torch.Tensor:
+    """ loss: () or (J,). Returns a bool tensor on loss.device of the same shape """
+    cond = ~torch.isfinite(loss)
+    if stop.loss_lim is not None:
+        cond = cond | (loss > stop.loss_lim)
+    return cond
+
+
+def _should_stop(hist: torch.Tensor, n: int, stop: StopCriteria) -> torch.Tensor:
+    """ hist[:n] are the losses so far, (max_steps,) or (max_steps, J) for J jobs.
+    Returns a bool tensor on hist.device, () or (J,) """
+    last = hist[n-1]
+    cond = _diverged(last, stop)
+    if stop.abs_tol is not None:
+        cond = cond | (last < stop.abs_tol)
+    if stop.rel_tol > 0 and n > stop.window:
+        best_prev = hist[:n-stop.window].min(dim=0).values
+        best_recent = hist[n-stop.window:n].min(dim=0).values
+        improve = (best_prev - best_recent) / best_prev.abs().clamp_min(1e-12)
+        cond = cond | (improve < stop.rel_tol)
+    return cond
+
+
+def run_optim_loop(optimizer: torch.optim.Optimizer,
+                   closure: Callable,
+                   max_steps: int,
+                   stop: StopCriteria = StopCriteria(),
+                   show_tqdm=False,
+                   print_every: int = None) -> dict:
+    """ zero_grad -> closure -> (check) -> backward -> step, for at most max_steps.
+
+    The loop stops before backward on the loss just computed, as the old
+    `if loss > loss_lim: break`: at every step if it diverged,
+    at check steps if another criterion is met.
+    Divergence is flagged on device and the parameters are frozen from then on,
+    as InitGuard does per init; the host only syncs on check steps,
+    so up to check_every - 1 closures are evaluated in vain after a divergence.
+
+    Args:
+        closure: () -> (loss, loss_dict), loss a scalar tensor,
+            loss_dict a dict of scalar tensors or None
+        print_every: print losses every so many steps (syncs)
+
+    Returns:
+        loss_records: dict
+            - total: list of float, loss of every evaluated step
+            - <k>: list of float, for k in loss_dict
+            - steps: int, number of optimizer steps taken
+    """
+    params = [p for group in optimizer.param_groups for p in group['params']]
+    device = params[0].device
+    hist = torch.empty([max_steps], device=device)
+    parts = {}
+    alive = torch.ones([], dtype=torch.bool, device=device)
+    # number of evaluated / optimizer steps, on device to avoid a sync per step
+    stopped_at = torch.full([], max_steps, dtype=torch.long, device=device)
+    num_steps = stopped_at.clone()
+    st = time.time()
+    with tqdm(total=max_steps, disable=not show_tqdm) as loop:
+        for step in range(max_steps):
+            n = step + 1
+            optimizer.zero_grad()
+            loss, loss_dict = closure()
+            hist[step] = loss.detach()
+            for k, v in (loss_dict or {}).items():
+                parts.setdefault(k, []).append(v.detach())
+            if print_every and step % print_every == 0:
+                print(f"Step {step}, tot = {loss.item():.04f}, ", end=' ')
+                for k, v in (loss_dict or {}).items():
+                    print(f"{k} = {v.item():.04f}", end=' ')
+                print()
+
+            was_alive = alive.clone()
+            alive &= ~_diverged(hist[step], stop)
+            if n % stop.check_every == 0:
+                alive &= ~_should_stop(hist, n, stop)
+                if stop.max_seconds is not None and time.time() - st > stop.max_seconds:
+                    alive.zero_()
+            # stopped here, before backward
+            stopped_at.masked_fill_(was_alive & ~alive, n)
+            num_steps.masked_fill_(was_alive & ~alive, step)
+            if n % stop.check_every == 0:
+                if not alive.item():
+                    break
+                loop.set_description(f"loss: {loss.item():.3g}")
+
+            torch.where(alive, loss, torch.zeros_like(loss)).backward()
+            with torch.no_grad():
+                prev = []
+                for p in params:
+                    if p.grad is not None:
+                        p.grad.masked_fill_(~alive, 0)
+                    prev.append(p.detach().clone())
+                optimizer.step()
+                # Adam momentum would otherwise keep moving a stopped loop
+                for p, p_prev in zip(params, prev):
+                    p.copy_(torch.where(alive, p, p_prev))
+            loop.update()
+
+    stopped_at, num_steps = stopped_at.item(), num_steps.item()
+    loss_records = {'total': hist[:stopped_at].tolist()}
+    for k, v in parts.items():
+        loss_records[k] = torch.stack(v[:stopped_at]).tolist()
+    loss_records['steps'] = num_steps
+    return loss_records
@@ -0,0 +1,155 @@
+import unittest
+from unittest import mock
+import torch
+import torch.nn as nn
+from temporal import optim_loop
+from temporal.optim_loop import StopCriteria, _should_stop, run_optim_loop
+
+
+class FakeClip(nn.Module):
+    """ Quadratic loss of a clip with `length` frames, converging at a rate set by `scale`.
+    If diverge, the loss is log(25 + sum of params - their initial sum), 
+    which Adam drives to NaN after ~7 steps. """
+    def __init__(self, length, scale, seed, diverge=False):
+        super().__init__()
+        g = torch.Generator().manual_seed(seed)
+        self.rotations_hand = nn.Parameter(torch.randn(length, 6, generator=g))
+        self.translations_hand = nn.Parameter(torch.randn(length, 1, 3, generator=g))
+        self.target = torch.randn(length, 6, generator=g)
+        self.scale = scale
+        self.diverge = diverge
+        self.offset = 25 - self.param_sum().item()
+
+    def param_sum(self) -> torch.Tensor:
+        return self.rotations_hand.sum() + self.translations_hand.sum()
+
+    def loss(self) -> torch.Tensor:
+        if self.diverge:
+            return torch.log(self.param_sum() + self.offset)
+        return self.scale * (
+            (self.rotations_hand - self.target).pow(2).sum()
+            + self.translations_hand.pow(2).sum())
+
+
+def make_clips():
+    return [FakeClip(length, scale, seed, diverge)
+            for seed, (length, scale, diverge) in enumerate(
+                [(5, 1.0, False), (3, 1e-2, False), (7, 10.0, False), (4, 1.0, True)])]
+
+
+class RunOptimLoopTest(unittest.TestCase):
+
+    names = ['rotations_hand', 'translations_hand']
+    stop = StopCriteria(check_every=5, rel_tol=1e-3, window=10, abs_tol=1e-4)
+
+    def run_clip(self, clip):
+        optim = torch.optim.Adam(
+            [getattr(clip, name) for name in self.names], lr=1e-1)
+        return run_optim_loop(optim, lambda: (clip.loss(), None), 300, stop=self.stop)
+
+    def test_diverged_clip_frozen(self):
+        """ the divergent clip stops between two checks, at its first NaN,
+        and later closures do not move it """
+        ref, clip = make_clips()[-1], make_clips()[-1]
+        records = self.run_clip(clip)
+        steps = records['steps']
+        self.assertTrue(torch.isnan(torch.tensor(records['total'][-1])))
+        self.assertNotEqual(len(records['total']) % self.stop.check_every, 0)
+        self.assertEqual(len(records['total']), steps + 1)
+        optim = torch.optim.Adam([getattr(ref, name) for name in self.names], lr=1e-1)
+        for _ in range(steps):
+            optim.zero_grad()
+            ref.loss().backward()
+            optim.step()
+        for name in self.names:
+            self.assertTrue(torch.equal(getattr(ref, name), getattr(clip, name)))
+
+    def test_converging_clips_stop_on_checks(self):
+        for clip in make_clips()[:-1]:
+            records = self.run_clip(clip)
+            self.assertLess(records['steps'], 300)
+            self.assertEqual(len(records['total']) % self.stop.check_every, 0)
+            self.assertEqual(len(records['total']), records['steps'] + 1)
+
+
+class StopCriteriaTest(unittest.TestCase):
+
+    def test_should_stop(self):
+        hist = torch.tensor([10., 5., 4., 3.9, 3.9, 3.9])
+        no_tol = StopCriteria(rel_tol=0)
+        self.assertFalse(_should_stop(hist, 6, no_tol))
+        # abs_tol
+        self.assertTrue(_should_stop(hist, 6, no_tol._replace(abs_tol=4.0)))
+        self.assertFalse(_should_stop(hist, 3, no_tol._replace(abs_tol=4.0)))
+        # rel_tol: best of the last `window` vs the best before it
+        plateau = StopCriteria(rel_tol=1e-2, window=2)
+        self.assertFalse(_should_stop(hist, 2, plateau))  # not enough steps
+        self.assertFalse(_should_stop(hist, 4, plateau))  # 5 -> 3.9
+        self.assertTrue(_should_stop(hist, 6, plateau))  # 3.9 -> 3.9
+        self.assertFalse(_should_stop(hist, 6, plateau._replace(window=4)))  # 10 -> 3.9
+        # loss_lim and non-finite
+        self.assertTrue(_should_stop(hist, 1, no_tol._replace(loss_lim=9.0)))
+        self.assertFalse(_should_stop(hist, 2, no_tol._replace(loss_lim=9.0)))
+        for bad in [float('nan'), float('inf')]:
+            self.assertTrue(_should_stop(torch.tensor([1., bad]), 2, no_tol))
+        # per job
+        hist = torch.tensor([[10., 1.], [float('nan'), 0.5]])
+        self.assertEqual(_should_stop(hist, 2, no_tol).tolist(), [True, False])
+
+    def run_losses(self, losses, stop, max_steps=None):
+        """ run_optim_loop on a closure returning losses[step] (x + const) """
+        x = nn.Parameter(torch.zeros([]))
+        optim = torch.optim.SGD([x], lr=1e-3)
+        it = iter(losses)
+        records = run_optim_loop(
+            optim, lambda: (x + next(it), None), max_steps or len(losses), stop=stop)
+        return records, x
+
+    def test_divergence_every_step(self):
+        """ loss_lim and NaN break before backward at once, whatever check_every """
+        stop = StopCriteria(check_every=10, rel_tol=0, loss_lim=100.)
+        for bad in [1e3, float('nan'), float('inf')]:
+            records, x = self.run_losses([1., 2., bad, 3., 4.], stop)
+            self.assertEqual(records['steps'], 2)
+            self.assertEqual(len(records['total']), 3)
+            self.assertTrue(torch.isfinite(x))
+
+    def test_syncs_on_checks_only(self):
+        """ .item() only on check steps, plus the final read-out """
+        item = torch.Tensor.item
+        calls = []
+
+        def counting_item(t):
+            calls.append(1)
+            return item(t)
+
+        with mock.patch.object(torch.Tensor, 'item', counting_item):
+            records, x = self.run_losses(
+                [1., float('nan')] + [1.] * 18, StopCriteria(check_every=5, rel_tol=0))
+        self.assertEqual((len(records['total']), records['steps']), (2, 1))
+        self.assertTrue(torch.isfinite(x))
+        # checks at n=5, which breaks, then stopped_at and num_steps
+        self.assertEqual(len(calls), 3)
+
+    def test_abs_tol_and_plateau_on_checks(self):
+        losses = [5., 4., 0.5, 0.4, 0.3, 0.2, 0.1, 0.1]
+        records, _ = self.run_losses(losses, StopCriteria(check_every=2, rel_tol=0, abs_tol=1.))
+        self.assertEqual((len(records['total']), records['steps']), (4, 3))
+        records, _ = self.run_losses(losses, StopCriteria(check_every=1, rel_tol=0, abs_tol=1.))
+        self.assertEqual((len(records['total']), records['steps']), (3, 2))
+        records, _ = self.run_losses([1.] * 10, StopCriteria(check_every=1, rel_tol=1e-2, window=3))
+        self.assertEqual(records['steps'], 3)
+        records, _ = self.run_losses([1.] * 10, StopCriteria(rel_tol=0))
+        self.assertEqual(records['steps'], 10)
+
+    def test_max_seconds(self):
+        clock = iter(range(100))
+        with mock.patch.object(optim_loop.time, 'time', lambda: float(next(clock))):
+            records, _ = self.run_losses(
+                [1.] * 20, StopCriteria(check_every=2, rel_tol=0, max_seconds=2.5))
+        # t=0 at start, checks at t=1, 2, 3
+        self.assertEqual((len(records['total']), records['steps']), (6, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,11 +6,13 @@ import torch
 from temporal.optim_plan import (
     optimize_hand, smooth_hand_pose
 )
-from homan.mvho_forwarder import MVHOVis, LiteHandModule
+from temporal.optim_loop import InitGuard, StopCriteria
+from homan.mvho_forwarder import MVHOImpl, MVHOVis, LiteHandModule
 from nnutils.handmocap import extract_forwarder_input
 
 ElementType = namedtuple(
-    "ElementType", "iou collision max_min_dist R t s sample_indices")
+    "ElementType", "iou collision max_min_dist R t s sample_indices failed",
+    defaults=(False,))
 
 
 class EvalHelper:
@@ -22,14 +24,18 @@ class EvalHelper:
     def __init__(self):
         self.num_eval = None
         self.eval_results = []
+        self.num_dropped_inits = 0  # diverged during multiview_optimize
 
         self.eval_input = None
+        self.eval_forwarder_input = None  # extract_forwarder_input(eval_input), reused by post refinement
         self.eval_mano_pca_pose = None
         self.eval_mano_betas = None
 
         self.eval_hand_data = None
         self.eval_image_patch = None
         self.eval_target_masks_object = None
+        self.eval_context = None  # MVHOImpl on eval frames, see build_eval_context()
+        self.eval_chunk = 4  # candidates evaluated together
 
         self.movie_global_cam = None  # For make_compare_video
         self.movie_images = None
@@ -44,11 +50,12 @@ class EvalHelper:
         images, hand_bbox_dicts, side, obj_bboxes, hand_masks, obj_masks, cat, global_cam = eval_input
         self.eval_input = eval_input
 
+        self.eval_forwarder_input = extract_forwarder_input(
+            eval_input, ihoi_box_expand=cfg.preprocess.ihoi_box_expand)
         eval_ihoi_cam_nr_mat, eval_ihoi_cam_mat, eval_image_patch, \
         eval_hand_rotation_6d, eval_hand_translation, \
         eval_mano_pca_pose, eval_pred_hand_betas, eval_hand_mask_patch, eval_obj_mask_patch = \
-            extract_forwarder_input(
-                eval_input, ihoi_box_expand=cfg.preprocess.ihoi_box_expand)
+            self.eval_forwarder_input
         num_eval = min(cfg.optim_mv.num_eval, len(eval_ihoi_cam_nr_mat))
 
         # Frankmocap on all eval frames
@@ -60,8 +67,9 @@ class EvalHelper:
 
         if optimize_eval_hand:
             print('Eval: Smooth hand pose and optimize hand')
-            eval_hand = smooth_hand_pose(eval_hand, lr=0.1)
-            eval_hand = optimize_hand(eval_hand, verbose=False)
+            hand_stop = StopCriteria(**cfg.homan.get('hand_stop', {}))
+            eval_hand = smooth_hand_pose(eval_hand, lr=0.1, stop=hand_stop)
+            eval_hand = optimize_hand(eval_hand, verbose=False, stop=hand_stop)
 
         self.eval_mano_pca_pose = eval_hand.mano_pca_pose.detach().clone()
         self.eval_mano_betas = eval_hand.mano_betas.detach().clone()
@@ -87,31 +95,98 @@ class EvalHelper:
                 eval_dataset, index, cfg, side, optimize_eval_hand)
         self.num_eval = min(cfg.optim_mv.num_eval, len(self.eval_image_patch))
 
+    def set_eval_forwarder(self, homan: MVHOVis):
+        """ Put homan on the eval frames, with a single pose """
+        homan.set_size(1, self.num_eval)
+        homan.set_ihoi_img_patch(self.eval_image_patch)
+        homan.set_hand_data(self.eval_hand_data)
+        homan.set_obj_target(self.eval_target_masks_object, check_shape=False)
+
+    def build_eval_context(self, homan: MVHOVis) -> MVHOImpl:
+        """ A separate forwarder on the eval frames, built once per clip:
+        eval hand verts and normals, camera and target masks, 
+        repeated for `eval_chunk` candidates and then left untouched
+        except for the object pose.
+        Object buffers are shared with the training forwarder `homan`.
+        """
+        k = self.eval_chunk
+        ctx = MVHOImpl()
+        ctx.register_obj_buffer(
+            verts_object_og=homan.verts_object_og,
+            faces_object=homan.faces_object,
+            scale_mode=homan.scale_mode)
+        ctx.set_size(k, self.num_eval)
+        hand_data = LiteHandModule.HandData(*[
+            v.repeat(k, *([1] * (v.dim() - 1))) for v in self.eval_hand_data])
+        ctx.set_hand_data(hand_data)
+        ctx.set_obj_target(
+            self.eval_target_masks_object.repeat(k, 1, 1), check_shape=False)
+        return ctx.to(homan.verts_object_og.device)
+
+    def eval_candidates(self, R, T, s):
+        """ Metrics of candidate poses on the eval frames, via the eval context.
+
+        Args:
+            R: (K, 6), T: (K, 1, 3), s: (K,) or (K, 3)
+
+        Returns:
+            ious: (K,) mean over eval frames
+            max_min_dists: (K,) max over eval frames
+        """
+        ctx = self.eval_context
+        k, e = ctx.num_inits, ctx.train_size
+        num = len(R)
+        ious, max_min_dists = [], []
+        with torch.no_grad():
+            for start in range(0, num, k):
+                # pad the last chunk by repeating its last candidate
+                inds = torch.arange(start, start + k).clamp_max(num - 1).to(R.device)
+                ctx.set_obj_transform(
+                    translations_object=T[inds],
+                    rotations_object=R[inds],
+                    scale_object=s[inds])
+                v_obj = ctx.get_verts_object()
+                _, iou, _ = ctx.forward_obj_pose_render(v_obj=v_obj, loss_only=False)
+                # all hand vertices: knn_points, not the dense proximity matrix
+                max_min_d = ctx.loss_nearest_dist(
+                    ctx.v_hand, v_obj, phy_factor=False).view(k, e).max(1).values
+                valid = min(k, num - start)
+                ious.append(iou.view(k, e).mean(1)[:valid])
+                max_min_dists.append(max_min_d[:valid])
+        return torch.cat(ious), torch.cat(max_min_dists)
+
     def register_batch(self,
                        homan: MVHOVis,
                        epoch: int,
                        num_inits_parallel: int):
+        """ Evaluate the optimized poses of homan, homan itself is not modified. """
         R_train = homan.rotations_object.detach().clone()
         T_train = homan.translations_object.detach().clone()
         s_train = homan.scale_object.detach().clone()
-        homan.set_size(1, self.num_eval)
-        homan.set_ihoi_img_patch(self.eval_image_patch)
-        homan.set_hand_data(self.eval_hand_data)
-        homan.set_obj_target(self.eval_target_masks_object, check_shape=False)
+        init_alive = getattr(homan, 'init_alive', None)
+        init_alive = [True] * num_inits_parallel \
+            if init_alive is None else init_alive.tolist()
+        self.num_dropped_inits += init_alive.count(False)
+        if self.eval_context is None:
+            self.eval_context = self.build_eval_context(homan)
+
+        alive_inds = [i for i in range(num_inits_parallel) if init_alive[i]]
+        metrics = {}
+        if len(alive_inds) > 0:
+            ious, max_min_dists = self.eval_candidates(
+                R_train[alive_inds], T_train[alive_inds], s_train[alive_inds])
+            metrics = dict(zip(alive_inds, zip(ious.tolist(), max_min_dists.tolist())))
         for i in range(num_inits_parallel):
-            homan.set_obj_transform(
-                translations_object=T_train[[i]],
-                rotations_object=R_train[[i]],
-                scale_object=s_train[[i]])
-            with torch.no_grad():
-                metrics = homan.eval_metrics()
-
-            iou = metrics['oious']                # bigger better
-            mean_iou = iou.mean(0)
-            # collision = metrics['collision']    # smaller better
-            max_min_dist = metrics['max_min_dist'] # smaller better
+            if not init_alive[i]:
+                # failed candidate, never evaluated
+                element = ElementType(
+                    0.0, 0, float('inf'),
+                    R_train[[i]], T_train[[i]], s_train[[i]], None, True)
+                self.eval_results.append(element)
+                continue
+            mean_iou, max_min_dist = metrics[i]  # bigger better, smaller better
             element = ElementType(
-                mean_iou.item(), 0, max_min_dist,
+                mean_iou, 0, max_min_dist,
                 R_train[[i]], T_train[[i]], s_train[[i]], None)
             self.eval_results.append(element)
 
@@ -124,11 +199,15 @@ class EvalHelper:
         """
         results = self.eval_results
         sign = 1 if criterion == 'iou' else -1
-        final_score = \
-            torch.softmax(torch.as_tensor([sign * getattr(v, criterion) for v in results]), 0)
+        scores = torch.as_tensor([sign * getattr(v, criterion) for v in results])
+        failed = torch.as_tensor([v.failed for v in results])
+        if not failed.all():
+            scores[failed] = -float('inf')
+        final_score = torch.softmax(scores, 0)
 
         best_idx = final_score.argmax()
         R, t, s = results[best_idx].R, results[best_idx].t, results[best_idx].s
+        self.set_eval_forwarder(homan)
         homan.set_obj_transform(
             translations_object=t,
             rotations_object=R,
@@ -140,7 +219,8 @@ class EvalHelper:
             'iou': results[best_idx].iou,
             # 'pd_h2o': pd_h2o,
             # 'pd_o2h': pd_o2h,
-            'max_min_dist': results[best_idx].max_min_dist}
+            'max_min_dist': results[best_idx].max_min_dist,
+            'num_dropped_inits': self.num_dropped_inits}
         return homan, best_metric
 
     def make_compare_video(self, homan):
@@ -148,6 +228,11 @@ class EvalHelper:
             self.movie_global_cam, global_images=self.movie_images, pose_idx=0)
         return frames
 
+    def write_compare_video(self, homan, save_file):
+        homan.write_compare_video(
+            save_file, self.movie_global_cam,
+            global_images=self.movie_images, pose_idx=0)
+
 
 def multiview_optimize(homan: MVHOVis,
                        optim_cfg) -> MVHOVis:
@@ -161,6 +246,15 @@ def multiview_optimize(homan: MVHOVis,
     eval_frames should be a subset of source_bank, e.g. at most N=20 frames.
     each pose sees a small fraction of source_bank, e.g. N=3 frames.
 
+    Inits whose loss diverges (NaN/Inf) are dropped individually by InitGuard,
+    the rest keep optimizing. 
+    Afterwards homan.init_alive (N,) marks the survivors,
+    and homan.num_dropped_inits counts the dropped.
+
+    With optim_cfg.sil_schedule, e.g. [64, 128, 256], num_iters is split evenly
+    and the object silhouette loss is computed at each resolution in turn;
+    the full resolution is restored at the end.
+
     Args:
         cfg: cfg.optim_mv in config/conf.yaml
     """
@@ -168,6 +262,7 @@ def multiview_optimize(homan: MVHOVis,
     lr = optim_cfg.lr
     num_iters = optim_cfg.num_iters
     vis_interval = optim_cfg.vis_interval
+    sil_schedule = optim_cfg.get('sil_schedule', None)
 
     params = [
         homan.rotations_object,  # (Np*T,)
@@ -178,19 +273,32 @@ def multiview_optimize(homan: MVHOVis,
         'params': params,
         'lr': lr
     }])
+    guard = InitGuard(params, homan.num_inits)
+    prof = homan.profiler
     with tqdm.tqdm(total=num_iters, disable=not optim_cfg.iter_tqdm) as loop:
         for step in range(num_iters):
-            optimizer.zero_grad()
+            if sil_schedule:
+                homan.set_sil_size(sil_schedule[step * len(sil_schedule) // num_iters])
+            with prof.step():
+                with prof.section('zero_grad'):
+                    optimizer.zero_grad()
 
-            print_metric = (vis_interval > 0 and step % vis_interval == 0)
-            tot_loss = homan.train_loss(
-                optim_cfg=optim_cfg, print_metric=print_metric)
+                print_metric = (vis_interval > 0 and step % vis_interval == 0)
+                per_init_loss = homan.train_loss(
+                    optim_cfg=optim_cfg, print_metric=print_metric, per_init=True)
+                with prof.section('reduce'):
+                    tot_loss = guard.masked_loss(per_init_loss)
 
-            if torch.isnan(tot_loss) or torch.isinf(tot_loss):
-                break
-            tot_loss.backward()
-            optimizer.step()
-            loop.set_description(f"tot loss: {tot_loss.item():.3g}")
+                with prof.section('backward'):
+                    tot_loss.backward()
+                with prof.section('optimizer_step'):
+                    guard.step(optimizer)
+            if optim_cfg.iter_tqdm:
+                loop.set_description(f"tot loss: {tot_loss.item():.3g}")
             loop.update()
 
+    if sil_schedule:
+        homan.set_sil_size(None)
+    homan.init_alive = guard.alive
+    homan.num_dropped_inits = guard.num_dropped
     return homan
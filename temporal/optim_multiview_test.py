@@ -0,0 +1,124 @@
+import unittest
+import time
+import torch
+import torch.nn as nn
+from omegaconf import OmegaConf
+from homan.step_profiler import StepProfiler, NULL_PROFILER
+from temporal.optim_multiview import multiview_optimize
+
+
+class FakeMVHO(nn.Module):
+    """ Quadratic per-init loss; inits in `nan_inits` return NaN from `nan_step` on. """
+    profiler = NULL_PROFILER
+
+    def __init__(self, num_inits, nan_inits=(), nan_step=None, nan_grad=False):
+        super().__init__()
+        g = torch.Generator().manual_seed(0)
+        self.num_inits = num_inits
+        self.rotations_object = nn.Parameter(torch.randn(num_inits, 6, generator=g))
+        self.translations_object = nn.Parameter(torch.randn(num_inits, 1, 3, generator=g))
+        self.scale_object = nn.Parameter(torch.rand(num_inits, generator=g) + 0.5)
+        self.target = torch.randn(num_inits, 6, generator=g)
+        self.nan_inits = list(nan_inits)
+        self.nan_step = nan_step
+        self.nan_grad = nan_grad
+        self.step = 0
+
+    def train_loss(self, optim_cfg, print_metric=False, per_init=False):
+        loss = (self.rotations_object - self.target).pow(2).sum(1) \
+            + self.translations_object.pow(2).sum((1, 2)) \
+            + (self.scale_object - 1).pow(2)
+        if self.nan_step is not None and self.step >= self.nan_step:
+            bad = torch.as_tensor(self.nan_inits)
+            if self.nan_grad:
+                # finite loss, NaN gradient
+                s = self.scale_object[bad]
+                loss = loss.index_add(0, bad, (s - s.detach()).abs().sqrt())
+            else:
+                nan = torch.zeros(self.num_inits)
+                nan[bad] = float('nan')
+                loss = loss + nan
+        self.step += 1
+        return loss if per_init else loss.sum()
+
+
+class TestNanIsolation(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = OmegaConf.create(dict(
+            lr=1e-2, num_iters=30, vis_interval=-1, iter_tqdm=False))
+
+    def check(self, **kwargs):
+        clean = multiview_optimize(FakeMVHO(8), self.cfg)
+        dirty = multiview_optimize(FakeMVHO(8, nan_inits=[1, 5], nan_step=10, **kwargs), self.cfg)
+        survivors = [0, 2, 3, 4, 6, 7]
+
+        self.assertEqual(clean.num_dropped_inits, 0)
+        self.assertEqual(dirty.num_dropped_inits, 2)
+        self.assertEqual(dirty.init_alive.tolist(), [i in survivors for i in range(8)])
+        for name in ['rotations_object', 'translations_object', 'scale_object']:
+            p_clean = getattr(clean, name).detach()
+            p_dirty = getattr(dirty, name).detach()
+            self.assertTrue(torch.equal(p_dirty[survivors], p_clean[survivors]))
+            # dropped inits are frozen and finite
+            self.assertTrue(torch.isfinite(p_dirty).all())
+            self.assertFalse(torch.equal(p_dirty[[1, 5]], p_clean[[1, 5]]))
+
+    def test_nan_loss(self):
+        self.check()
+
+    def test_nan_grad(self):
+        self.check(nan_grad=True)
+
+
+class SlowFakeMVHO(FakeMVHO):
+    """ train_loss with profiled sections that take measurable time """
+    def train_loss(self, optim_cfg, print_metric=False, per_init=False):
+        with self.profiler.section('verts'):
+            time.sleep(2e-3)
+        with self.profiler.section('obj_sil'):
+            loss = super().train_loss(optim_cfg, print_metric, per_init)
+            time.sleep(3e-3)
+        return loss
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = OmegaConf.create(dict(
+            lr=1e-2, num_iters=20, vis_interval=-1, iter_tqdm=False))
+
+    def test_breakdown_sums_to_step_time(self):
+        homan = SlowFakeMVHO(4)
+        profiler = homan.profiler = StepProfiler()
+        wall = []
+        for e in range(2):
+            profiler.start_epoch(e)
+            st = time.perf_counter()
+            multiview_optimize(homan, self.cfg)
+            wall.append(time.perf_counter() - st)
+            profiler.end_epoch()
+        summary = profiler.summary()
+
+        self.assertEqual(len(summary['epochs']), 2)
+        # steps are the whole of multiview_optimize, up to the setup outside the loop
+        for rec, t in zip(summary['epochs'], wall):
+            self.assertLessEqual(rec['step_time'], t)
+            self.assertGreater(rec['step_time'], 0.9 * t)
+        for rec in summary['epochs'] + [summary['total']]:
+            sections = rec['sections']
+            self.assertEqual(
+                set(sections), {'zero_grad', 'verts', 'obj_sil', 'reduce', 'backward', 'optimizer_step'})
+            # sections cover the step: only the context-manager bookkeeping is untracked
+            self.assertLess(abs(rec['untracked']), 0.05 * rec['step_time'])
+        self.assertEqual(summary['total']['steps'], 40)
+        self.assertEqual(summary['total']['sections']['backward']['calls'], 40)
+
+    def test_disabled(self):
+        homan = SlowFakeMVHO(4)
+        self.assertIs(homan.profiler.section('a'), homan.profiler.section('b'))
+        multiview_optimize(homan, self.cfg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import tqdm
 import torch
 from homan.ho_forwarder_v2 import HOForwarderV2Vis, HOForwarderV2Impl
 from temporal.utils import choose_with_softmax
+from temporal.optim_loop import StopCriteria, InitGuard, run_optim_loop
 
 from moviepy import editor
 
@@ -14,8 +15,16 @@ from moviepy import editor
 def smooth_hand_pose(homan: HOForwarderV2Impl,
                      lr=1e-2,
                      thresh=1e-3,
-                     verbose=True):
-    """ smooth pca pose """
+                     verbose=True,
+                     max_steps=500,
+                     stop: StopCriteria = StopCriteria()):
+    """ smooth pca pose 
+
+    Args:
+        thresh: stop once the pca loss is below it, the abs_tol of `stop` if that has none
+        stop: see StopCriteria, by default also stops on a plateau.
+            e.g. StopCriteria(rel_tol=0) for the threshold only
+    """
     optimizer = torch.optim.Adam([
         {
             'params': [
@@ -25,14 +34,13 @@ def smooth_hand_pose(homan: HOForwarderV2Impl,
         }
     ])
 
-    max_steps = 500
-    for _ in range(max_steps):
-        optimizer.zero_grad()
-        pca_loss = homan.loss_pca_interpolation().sum()
-        if pca_loss < thresh:
-            break
-        pca_loss.backward()
-        optimizer.step()
+    def closure():
+        return homan.loss_pca_interpolation().sum(), None
+
+    if stop.abs_tol is None:
+        stop = stop._replace(abs_tol=thresh)
+    loss_records = run_optim_loop(optimizer, closure, max_steps, stop=stop)
+    homan.loss_records = loss_records
 
     return homan
 
@@ -40,7 +48,14 @@ def smooth_hand_pose(homan: HOForwarderV2Impl,
 def optimize_hand(homan: HOForwarderV2Impl,
                   lr=1e-2,
                   num_steps=100,
-                  verbose=True) -> HOForwarderV2Impl:
+                  verbose=True,
+                  stop: StopCriteria = StopCriteria()) -> HOForwarderV2Impl:
+    """
+    Args:
+        num_steps: at most
+        stop: see StopCriteria, by default stops on a plateau.
+            StopCriteria(rel_tol=0) runs all num_steps unless the loss diverges
+    """
     optimizer = torch.optim.Adam([
         {
             'params': [
@@ -51,29 +66,10 @@ def optimize_hand(homan: HOForwarderV2Impl,
         }
     ])
 
-    loss_records = {
-        'total': [],
-        'sil': [],
-        'pca': [],
-        'rot': [],
-        'transl': [],
-        # 'smooth': [],
-    }
-    for step in range(num_steps):
-        optimizer.zero_grad()
-        tot_loss, loss_dict = homan.forward_hand()
-        if verbose and step % 10 == 0:
-            print(f"Step {step}, tot = {tot_loss.item():.04f}, ", end=' ')
-            for k, v in loss_dict.items():
-                print(f"{k} = {v.item():.04f}", end=' ')
-            print()
-        loss_records['total'].append(tot_loss.item())
-        for k, v in loss_dict.items():
-            loss_records[k].append(v.item())
-
-        tot_loss.backward()
-        optimizer.step()
-
+    # keys: total, sil, pca, rot, transl, steps
+    loss_records = run_optim_loop(
+        optimizer, homan.forward_hand, num_steps, stop=stop,
+        print_every=10 if verbose else None)
     homan.loss_records = loss_records
 
     return homan
@@ -116,6 +112,7 @@ def reinit_sample_optimize(homan: HOForwarderV2Vis,
         out_frames = []
 
     results = []
+    num_dropped_inits = 0
 
     num_epochs = rotation6d_inits.shape[0] if debug_num_epoch is None else debug_num_epoch
     for e in tqdm.trange(num_epochs // num_epoch_parallel, disable=not cfg.epoch_tqdm):
@@ -140,31 +137,46 @@ def reinit_sample_optimize(homan: HOForwarderV2Vis,
             'params': params,
             'lr': lr
         }])
+        guard = InitGuard(params, num_epoch_parallel)
+        prof = homan.profiler
+        prof.start_epoch(e)
 
         with tqdm.tqdm(total=num_iters, disable=not cfg.iter_tqdm) as loop:
             for step in range(num_iters):
-                optimizer.zero_grad()
-
-                print_metric = (vis_interval > 0 and step % vis_interval == 0)
-                tot_loss = homan.train_loss(
-                    cfg=cfg, print_metric=print_metric)
-
-                if save_grid and step % 5 == 0:
-                    frame = homan.render_grid_np(0, True)
-                    out_frames.append(frame)
-
-                if torch.isnan(tot_loss) or torch.isinf(tot_loss):
-                    tot_loss = weights.abs().max().detach().clone()
-                    break
-                tot_loss.backward()
-                optimizer.step()
+                with prof.step():
+                    with prof.section('zero_grad'):
+                        optimizer.zero_grad()
+
+                    print_metric = (vis_interval > 0 and step % vis_interval == 0)
+                    per_init_loss = homan.train_loss(
+                        cfg=cfg, print_metric=print_metric, per_init=True)
+                    with prof.section('reduce'):
+                        tot_loss = guard.masked_loss(per_init_loss)
+
+                    if save_grid and step % 5 == 0:
+                        with prof.section('save_grid'):
+                            frame = homan.render_grid_np(0, True)
+                            out_frames.append(frame)
+
+                    with prof.section('backward'):
+                        tot_loss.backward()
+                    with prof.section('optimizer_step'):
+                        guard.step(optimizer)
                 loop.set_description(f"tot_loss: {tot_loss.item():.3g}")
                 loop.update()
+        prof.end_epoch()
+
+        num_dropped_inits += guard.num_dropped
+        if guard.num_dropped == num_epoch_parallel:
+            # all diverged, penalise these sample_indices as before
+            tot_loss = weights.abs().max().detach().clone()
 
         with torch.no_grad():
-            if torch.isnan(tot_loss) or torch.isinf(tot_loss):
-                import pudb;
-                pudb.set_trace()
+            R = homan.rotations_object.detach().clone()
+            t = homan.translations_object.detach().clone()
+            s = homan.scale_object.detach().clone()
+            alive = guard.alive.tolist()
+            guard.fill_dropped_()
             metrics = homan.eval_metrics()
             hious = metrics['hious']              # bigger better
             oious = metrics['oious']              # bigger better
@@ -172,13 +184,16 @@ def reinit_sample_optimize(homan: HOForwarderV2Vis,
             mean_hiou = hious
             mean_oiou = oious
 
-            R = homan.rotations_object.detach().clone()
-            t = homan.translations_object.detach().clone()
-            s = homan.scale_object.detach().clone()
             for i in range(num_epoch_parallel):
-                element = ElementType(
-                    mean_hiou[i].item(), mean_oiou[i].item(), max_min_dist,
-                    R[[i]], t[[i]], s[[i]], homan.sample_indices)
+                if not alive[i]:
+                    # failed candidate
+                    element = ElementType(
+                        0.0, 0.0, float('inf'),
+                        R[[i]], t[[i]], s[[i]], homan.sample_indices)
+                else:
+                    element = ElementType(
+                        mean_hiou[i].item(), mean_oiou[i].item(), max_min_dist,
+                        R[[i]], t[[i]], s[[i]], homan.sample_indices)
                 results.append(element)
         # Update weights
         weights[homan.sample_indices] -= tot_loss  # TODO, is it good?
@@ -195,7 +210,8 @@ def reinit_sample_optimize(homan: HOForwarderV2Vis,
     best_idx = final_score.argmax()
     best_metric = {
         'hious': results[best_idx].hiou, 'oious': results[best_idx].oiou,
-        'max_min_dist': results[best_idx].max_min_dist}
+        'max_min_dist': results[best_idx].max_min_dist,
+        'num_dropped_inits': num_dropped_inits}
     R, t, s = results[best_idx].R, results[best_idx].t, results[best_idx].s
     homan.set_obj_transform(
         translations_object=t,
@@ -1,7 +1,5 @@
 from argparse import ArgumentParser
-from tqdm import tqdm
 import os.path as osp
-from moviepy import editor
 
 import torch
 from datasets.epic_clip_v3 import EpicClipDatasetV3
@@ -10,35 +8,47 @@ from homan.ho_forwarder_v2 import HOForwarderV2Vis
 from omegaconf import OmegaConf
 from temporal.optim_multiview import EvalHelper
 from nnutils.handmocap import extract_forwarder_input
-from temporal.visualize import make_compare_video
+from temporal.visualize import write_compare_video
+from temporal.optim_loop import StopCriteria, run_optim_loop
 
 from libzhifan import io
 
 
 def parse_args():
     parser = ArgumentParser()
-    parser.add_argument('--data_locate')
+    parser.add_argument('--data_locate', nargs='+',
+                        help='one or more clips, refined one at a time')
     parser.add_argument('--model_dir')
     # parser.add_argument('--lw_smooth', type=float, default=1.0)
     return parser.parse_args()
 
 
-def optimize_post(homan, steps=200, optim_trans_hand=True):
-    loss_lim = torch.tensor(1e5)
-    def loss_combined(homan):
-        l_ho = homan.forward_combined_sil().sum()
-        l_obj_sm = homan.loss_obj_smooth().sum()
-        # l_hand_sm = homan.loss_hand_smooth().sum()
-        return l_ho + l_obj_sm
+def loss_combined(homan: HOForwarderV2Vis) -> torch.Tensor:
+    l_ho = homan.forward_combined_sil().sum()
+    l_obj_sm = homan.loss_obj_smooth().sum()
+    # l_hand_sm = homan.loss_hand_smooth().sum()
+    return l_ho + l_obj_sm
 
-    def loss_mano_pca(homan: HOForwarderV2Vis):
-        l_pca = homan.loss_pca_interpolation().sum()
-        l_in = homan.loss_insideness().sum()
-        l_cl = homan.loss_closeness().sum()
-        l_vhand = homan.loss_hand_smooth(hand_space=True, phy_factor=False).sum()
-        l = l_pca + l_in + l_cl + l_vhand
-        return l
 
+def loss_mano_pca(homan: HOForwarderV2Vis) -> torch.Tensor:
+    l_pca = homan.loss_pca_interpolation().sum()
+    l_in = homan.loss_insideness().sum()
+    l_cl = homan.loss_closeness().sum()
+    l_vhand = homan.loss_hand_smooth(hand_space=True, phy_factor=False).sum()
+    l = l_pca + l_in + l_cl + l_vhand
+    return l
+
+
+def optimize_post(homan, steps=200, optim_trans_hand=True,
+                  stop: StopCriteria = StopCriteria(loss_lim=1e5)):
+    """ Two phases: hand [R|T] on combined silhouettes, then mano_pca_pose.
+
+    Args:
+        steps: at most, per phase
+        stop: see StopCriteria, applied to each phase. 
+            StopCriteria(rel_tol=0, loss_lim=1e5) runs as before,
+            except that it also stops on a non-finite loss.
+    """
     """ [R|T] for hand """
     if optim_trans_hand:
         params = [
@@ -53,16 +63,8 @@ def optimize_post(homan, steps=200, optim_trans_hand=True):
         'params': params,
         'lr': 1e-2
     }])
-    with tqdm(total=steps) as loop:
-        for i in range(steps):
-            optim.zero_grad()
-            loss = loss_combined(homan)
-            if loss > loss_lim:
-                break
-            loss.backward()
-            loop.set_description(f"loss: {loss.item():.3g}")
-            loop.update()
-            optim.step()
+    records_combined = run_optim_loop(
+        optim, lambda: (loss_combined(homan), None), steps, stop=stop, show_tqdm=True)
     
     """ mano_pca_pose """
     optim = torch.optim.Adam([{
@@ -71,29 +73,36 @@ def optimize_post(homan, steps=200, optim_trans_hand=True):
         ],
         'lr': 1e-2
     }])
-    with tqdm(total=steps) as loop:
-        for i in range(steps):
-            optim.zero_grad()
-            loss = loss_mano_pca(homan)
-            if loss > loss_lim:
-                break
-            loss.backward()
-            loop.set_description(f"loss: {loss.item():.3g}")
-            loop.update()
-            optim.step()
-        return homan
+    records_pca = run_optim_loop(
+        optim, lambda: (loss_mano_pca(homan), None), steps, stop=stop, show_tqdm=True)
+
+    homan.loss_records = {
+        'combined': records_combined['total'],
+        'combined_steps': records_combined['steps'],
+        'pca': records_pca['total'],
+        'pca_steps': records_pca['steps'],
+    }
+    return homan
 
 
 def load_homan_from_mvho(eval_input, mvho, cfg, 
                          mano_pca_pose=None,
-                         mano_betas=None) -> HOForwarderV2Vis:
+                         mano_betas=None,
+                         forwarder_input=None) -> HOForwarderV2Vis:
+    """
+    Args:
+        forwarder_input: extract_forwarder_input(eval_input), 
+            e.g. EvalHelper.eval_forwarder_input, computed if None
+    """
     images, hand_bbox_dicts, side, obj_bboxes, hand_masks, obj_masks, cat, global_cam = eval_input
 
+    if forwarder_input is None:
+        forwarder_input = extract_forwarder_input(
+            eval_input, ihoi_box_expand=cfg.preprocess.ihoi_box_expand)
     eval_ihoi_cam_nr_mat, eval_ihoi_cam_mat, eval_image_patch, \
     eval_hand_rotation_6d, eval_hand_translation, \
     eval_mano_pca_pose, eval_pred_hand_betas, eval_hand_mask_patch, eval_obj_mask_patch = \
-        extract_forwarder_input(
-            eval_input, ihoi_box_expand=cfg.preprocess.ihoi_box_expand)
+        forwarder_input
     num_eval = min(cfg.optim_mv.num_eval, len(eval_ihoi_cam_nr_mat))
 
     mano_pca_pose = mano_pca_pose if mano_pca_pose is not None else eval_mano_pca_pose
@@ -120,18 +129,12 @@ def load_homan_from_mvho(eval_input, mvho, cfg,
     return homan
 
 
-def main(args):
-    model_dir = args.model_dir
-    data_locate = args.data_locate
-    cfg = OmegaConf.load('config/conf_multiview.yaml')
+def prepare_clip(eval_dataset, data_locate, model_dir, cfg):
+    """ Load the mvho result of a clip into a HOForwarderV2Vis ready for optimize_post().
 
-    image_sets = '/home/skynet/Zhifan/epic_analysis/hos/tools/model-input-Feb03.json'
-    image_sets = '/home/skynet/Zhifan/epic_analysis/hos/tools/eval_100_Feb25.json'
-    image_sets = '/home/skynet/Zhifan/epic_analysis/hos/tools/eval_rand100_Mar05.json'
-    eval_dataset = EpicClipDatasetV3(
-        image_sets=image_sets, sample_frames=30,
-        show_loading_time=True
-    )
+    Returns:
+        homan, fmt: output path format, eval_input
+    """
     index = eval_dataset.locate_index_from_output(data_locate)
 
     vid_key = '_'.join(data_locate.split('_')[:4])
@@ -145,24 +148,40 @@ def main(args):
                               optimize_eval_hand=cfg.homan.optimize_eval_hand)
     homan = load_homan_from_mvho(eval_input, mvho, cfg,
                                  mano_pca_pose=eval_helper.eval_mano_pca_pose,
-                                 mano_betas=eval_helper.eval_mano_betas)
+                                 mano_betas=eval_helper.eval_mano_betas,
+                                 forwarder_input=eval_helper.eval_forwarder_input)
 
     homan.register_combined_target()
-    pre_metrics = homan.eval_metrics(unsafe=True, avg=True)
-    homan = optimize_post(homan, steps=200, optim_trans_hand=False)
-    post_metrics = homan.eval_metrics(unsafe=True, avg=True)
+    return homan, fmt, eval_input
 
-    torch.save(homan, (fmt % 'post.pth'))
-    io.write_json(pre_metrics, (fmt % 'pre.json'))
-    io.write_json(post_metrics, (fmt % 'post.json'))
 
-    if cfg.action_video.save:
-        frames = make_compare_video(
-            homan, eval_input.global_camera, global_images=eval_input.images,
-            render_frames='all')
-        action_cilp = editor.ImageSequenceClip(frames, fps=5)
-        action_cilp.write_videofile(fmt % 'post.mp4')
+def main(args):
+    model_dir = args.model_dir
+    cfg = OmegaConf.load('config/conf_multiview.yaml')
+
+    image_sets = '/home/skynet/Zhifan/epic_analysis/hos/tools/model-input-Feb03.json'
+    image_sets = '/home/skynet/Zhifan/epic_analysis/hos/tools/eval_100_Feb25.json'
+    image_sets = '/home/skynet/Zhifan/epic_analysis/hos/tools/eval_rand100_Mar05.json'
+    eval_dataset = EpicClipDatasetV3(
+        image_sets=image_sets, sample_frames=30,
+        show_loading_time=True
+    )
 
+    for data_locate in args.data_locate:
+        homan, fmt, eval_input = prepare_clip(eval_dataset, data_locate, model_dir, cfg)
+        pre_metrics = homan.eval_metrics(unsafe=True, avg=True)
+        optimize_post(homan, steps=200, optim_trans_hand=False)
+
+        post_metrics = homan.eval_metrics(unsafe=True, avg=True)
+        torch.save(homan, (fmt % 'post.pth'))
+        io.write_json(pre_metrics, (fmt % 'pre.json'))
+        io.write_json(post_metrics, (fmt % 'post.json'))
+
+        if cfg.action_video.save:
+            write_compare_video(
+                fmt % 'post.mp4',
+                homan, eval_input.global_camera, global_images=eval_input.images,
+                render_frames='all')
 
 if __name__ == '__main__':
     main(parse_args())
@@ -1,7 +1,8 @@
-from typing import List
+from typing import Iterator, List
 import matplotlib.pyplot as plt
 import numpy as np
 from homan.ho_forwarder_v2 import HOForwarderV2Vis
+from nnutils.image_utils import VideoWriter
 
 from libzhifan.geometry import visualize_mesh, SimpleMesh
 from libzhifan.geometry import BatchCameraManager
@@ -62,6 +63,31 @@ def concat_pose_meshes(pose_machine,
     return meshes
 
 
+def iter_compare_frames(homan: HOForwarderV2Vis,
+                        global_cam: BatchCameraManager,
+                        global_images: np.ndarray,
+                        render_frames: str,
+                        chunk_size=16) -> Iterator[np.ndarray]:
+    """ Lazy version of make_compare_video(), yields one frame at a time.
+    Args:
+        frames: 'all' or 'ransac'
+    """
+    if render_frames == 'all':
+        scene_indices = range(homan.bsize)
+    elif render_frames == 'ransac':
+        scene_indices = homan.sample_indices
+    scene_indices = list(scene_indices)
+
+    img_meshes = homan.render_global_batch(
+        global_cam=global_cam,
+        global_images=global_images,
+        scene_indices=scene_indices,
+        obj_idx=0,
+        chunk_size=chunk_size)
+    for i, img_mesh in zip(scene_indices, img_meshes):
+        yield np.vstack([global_images[i], img_mesh * 255])
+
+
 def make_compare_video(homan: HOForwarderV2Vis,
                        global_cam: BatchCameraManager,
                        global_images: np.ndarray,
@@ -70,20 +96,17 @@ def make_compare_video(homan: HOForwarderV2Vis,
     Args:
         frames: 'all' or 'ransac'
     """
-    frames = []
-    if render_frames == 'all':
-        scene_indices = range(homan.bsize)
-    elif render_frames == 'ransac':
-        scene_indices = homan.sample_indices
+    return list(iter_compare_frames(
+        homan, global_cam, global_images, render_frames))
+
 
-    for i in scene_indices:
-        img_mesh = homan.render_global(
-            global_cam=global_cam,
-            global_images=global_images,
-            scene_idx=i,
-            obj_idx=0,
-            with_hand=True,
-            overlay_gt=False)
-        img = np.vstack([global_images[i], img_mesh * 255])
-        frames.append(img)
-    return frames
\ No newline at end of file
+def write_compare_video(save_file: str,
+                        homan: HOForwarderV2Vis,
+                        global_cam: BatchCameraManager,
+                        global_images: np.ndarray,
+                        render_frames: str,
+                        fps=5):
+    """ Stream compare frames into save_file (.mp4) without keeping them. """
+    with VideoWriter(save_file, fps=fps) as writer:
+        writer.write_frames(iter_compare_frames(
+            homan, global_cam, global_images, render_frames))